@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+# This file is part of Handheld Game Console Controller System (HandyGCCS)
+# Copyright 2022-2023 Derek J. Clark <derekjohn.clark@gmail.com>
+# Measures the CPU cost and latency of IMU decoding and sensor fusion by
+# replaying a recorded IMU trace through the same reader and filter the daemon
+# uses. Traces are CSV files with one sample per line:
+#   timestamp_s,gyro_x,gyro_y,gyro_z,accel_x,accel_y,accel_z
+# in rad/s and m/s^2. Without --trace a synthetic trace is generated.
+# Use --record to capture a trace from the handheld's IIO device.
+
+import argparse
+import asyncio
+import csv
+import math
+import os
+import random
+import sys
+import time
+
+from handycon import fusion, imu
+
+GYRO_SCALE = 0.001
+ACCEL_SCALE = 0.001
+
+
+def synthetic_trace(seconds, rate):
+    rng = random.Random(0)
+    samples = []
+    for index in range(int(seconds * rate)):
+        t = index / rate
+        # Alternate between resting on a table and sweeping the view.
+        moving = int(t) % 4 >= 2
+        yaw = math.sin(t * 3.0) * 2.0 if moving else 0.0
+        pitch = math.cos(t * 2.0) * 0.8 if moving else 0.0
+        samples.append((
+            t,
+            pitch + 0.01 + rng.gauss(0, 0.005),
+            yaw - 0.02 + rng.gauss(0, 0.005),
+            rng.gauss(0, 0.005),
+            rng.gauss(0, 0.05),
+            rng.gauss(0, 0.05),
+            fusion.GRAVITY + rng.gauss(0, 0.05),
+        ))
+    return samples
+
+
+def load_trace(path):
+    with open(path, newline="") as f:
+        return [tuple(float(value) for value in row) for row in csv.reader(f) if row and not row[0].startswith("#")]
+
+
+def channels():
+    return [
+        imu.Channel("anglvel_x", 0, "le:s16/16>>0", GYRO_SCALE),
+        imu.Channel("anglvel_y", 1, "le:s16/16>>0", GYRO_SCALE),
+        imu.Channel("anglvel_z", 2, "le:s16/16>>0", GYRO_SCALE),
+        imu.Channel("accel_x", 3, "le:s16/16>>0", ACCEL_SCALE),
+        imu.Channel("accel_y", 4, "le:s16/16>>0", ACCEL_SCALE),
+        imu.Channel("accel_z", 5, "le:s16/16>>0", ACCEL_SCALE),
+        imu.Channel("timestamp", 6, "le:s64/64>>0", 1e-9),
+    ]
+
+
+# Encodes samples as the raw scan records an IIO buffer would produce.
+def encode(samples, layout):
+    def clamp(value, scale):
+        return max(-32768, min(32767, round(value / scale)))
+
+    return b"".join(
+        layout.pack(
+            clamp(gx, GYRO_SCALE), clamp(gy, GYRO_SCALE), clamp(gz, GYRO_SCALE),
+            clamp(ax, ACCEL_SCALE), clamp(ay, ACCEL_SCALE), clamp(az, ACCEL_SCALE),
+            round(t * 1e9),
+        )
+        for t, gx, gy, gz, ax, ay, az in samples
+    )
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+def run(samples, settings, watermark):
+    rate = settings["rate"]
+    # A pipe stands in for the IIO character device.
+    read_fd, write_fd = os.pipe()
+    os.set_blocking(read_fd, False)
+    reader = imu.IIOReader(f"/proc/self/fd/{read_fd}", channels(), chunk=watermark)
+    reader.fd = read_fd
+    records = encode(samples, reader.layout)
+    outputs = []
+    engine = fusion.FusionEngine(settings, sink=lambda yaw, pitch, elapsed: outputs.append((yaw, pitch)))
+    reader.listeners.append(engine.consume)
+
+    # Each wakeup delivers one watermark worth of samples, as the kernel would.
+    batch = reader.layout.size * watermark
+    batch_times = []
+    cpu_start = time.process_time()
+    for offset in range(0, len(records), batch):
+        os.write(write_fd, records[offset:offset + batch])
+        start = time.perf_counter_ns()
+        reader.read_available()
+        batch_times.append(time.perf_counter_ns() - start)
+    cpu = time.process_time() - cpu_start
+    reader.close()
+    os.close(write_fd)
+
+    count = len(samples)
+    duration = count / rate
+    # Samples wait on average half a watermark in the kernel buffer before the
+    # reader wakes, then for the batch to be processed.
+    buffering_ms = (watermark - 1) / 2 / rate * 1000
+    print(f"filter={settings['filter']} space={settings['space']} samples={count} rate={rate}Hz watermark={watermark}")
+    print(f"  per sample:      {cpu / count * 1e6:8.2f} us")
+    print(f"  cpu at {rate} Hz: {cpu / duration * 100:8.2f} %")
+    print(f"  batch p50:       {percentile(batch_times, 0.5) / 1e6:8.3f} ms")
+    print(f"  batch p99:       {percentile(batch_times, 0.99) / 1e6:8.3f} ms")
+    print(f"  latency p99:     {buffering_ms + percentile(batch_times, 0.99) / 1e6:8.3f} ms (incl. {buffering_ms:.2f} ms buffering)")
+    print(f"  outputs:         {len(outputs)}  learned bias: {[round(value, 4) for value in engine.bias]}")
+
+
+def record(path, seconds, settings):
+    device = imu.find_imu()
+    if device is None:
+        sys.exit("No IIO gyro/accelerometer found.")
+    reader = imu.IIOReader(imu.IIO_DEV_PATH / device.name, imu.setup_buffer(device, settings["rate"], settings["watermark"]))
+    names = [channel.name for channel in reader.channels]
+    order = [names.index(name) for name in fusion.SAMPLE_CHANNELS]
+    rows = []
+    cursor = 0
+
+    # Drain the ring as samples arrive so long recordings aren't overwritten.
+    def collect(reader):
+        nonlocal cursor
+        batch, cursor = reader.ring.read_since(cursor)
+        rows.extend([row[position] for position in order] for row in batch)
+
+    reader.listeners.append(collect)
+
+    async def capture():
+        reader.start()
+        await asyncio.sleep(seconds)
+        reader.stop()
+
+    try:
+        asyncio.run(capture())
+    finally:
+        imu.teardown_buffer(device)
+    with open(path, "w", newline="") as f:
+        csv.writer(f).writerows(rows)
+    print(f"Recorded {len(rows)} samples to {path}.")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay an IMU trace through the gyro fusion engine.")
+    parser.add_argument("--trace", help="CSV IMU trace to replay")
+    parser.add_argument("--record", help="record a trace from the IIO device to this file")
+    parser.add_argument("--seconds", type=float, default=60.0)
+    parser.add_argument("--rate", type=int, default=1000)
+    parser.add_argument("--watermark", type=int, default=16)
+    args = parser.parse_args()
+
+    settings = fusion.get_default_config() | imu.get_default_config()
+    settings["rate"] = args.rate
+    settings["watermark"] = args.watermark
+
+    if args.record:
+        record(args.record, args.seconds, settings)
+        return
+
+    samples = load_trace(args.trace) if args.trace else synthetic_trace(args.seconds, args.rate)
+    for filter_name in fusion.FUSION_FILTERS:
+        for space in fusion.FUSION_SPACES:
+            run(samples, settings | {"filter": filter_name, "space": space}, args.watermark)
+
+
+if __name__ == "__main__":
+    main()
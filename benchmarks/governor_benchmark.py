@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+# This file is part of Handheld Game Console Controller System (HandyGCCS)
+# Copyright 2022-2023 Derek J. Clark <derekjohn.clark@gmail.com>
+# Replays a bursty game load through the turbo governor against a fake
+# procfs/sysfs tree and counts how often each policy would have run the speed
+# commands. The naive policy steps as soon as a sample crosses a threshold.
+# Time is simulated, so an hour of samples takes well under a second.
+
+import argparse
+import logging
+import os
+import random
+import tempfile
+
+from handycon import governor
+
+SPEEDS = ["0", "1", "2"]
+# USER_HZ ticks per sample interval across all CPUs.
+TICKS = 800
+
+
+class FakeTurbo:
+    def __init__(self):
+        self.speeds = SPEEDS
+        self.current = 0
+        self.manual_at = float("-inf")
+
+
+class FakeController:
+    def __init__(self):
+        self.logger = logging.getLogger("governor")
+        self.turbo = FakeTurbo()
+
+
+class FakeTree:
+    """A root containing the files LoadSampler reads. Files are rewritten in
+    place so descriptors held open by the sampler see new values."""
+
+    def __init__(self, root):
+        self.root = root
+        self.user = 0
+        self.idle = 0
+        self.write("proc/stat", self.stat_line())
+        self.write("sys/class/drm/card0/device/gpu_busy_percent", "0\n")
+        self.write("sys/class/hwmon/hwmon0/name", "acpitz\n")
+        self.write("sys/class/hwmon/hwmon0/temp1_input", "40000\n")
+        self.write("sys/class/hwmon/hwmon1/name", "k10temp\n")
+        self.write("sys/class/hwmon/hwmon1/temp1_input", "50000\n")
+        self.write("sys/class/power_supply/BAT0/type", "Battery\n")
+        self.write("sys/class/power_supply/ADP0/type", "Mains\n")
+        self.write("sys/class/power_supply/ADP0/online", "0\n")
+
+    def write(self, path, text):
+        path = os.path.join(self.root, path)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w") as f:
+            f.write(text)
+
+    def stat_line(self):
+        return f"cpu  {self.user} 0 0 {self.idle} 0 0 0 0 0 0\ncpu0 0 0 0 0 0 0 0 0 0 0\n"
+
+    def set_load(self, cpu, gpu, temp):
+        busy = int(TICKS * cpu / 100)
+        self.user += busy
+        self.idle += TICKS - busy
+        self.write("proc/stat", self.stat_line())
+        self.write("sys/class/drm/card0/device/gpu_busy_percent", f"{int(gpu)}\n")
+        self.write("sys/class/hwmon/hwmon1/temp1_input", f"{int(temp * 1000)}\n")
+
+
+# Yields (cpu, gpu, temp) per sample: menus, then a game whose load swings
+# between loading bursts and lighter scenes, then a sustained heavy scene.
+def load_trace(rng, samples):
+    phases = [(0.15, 10, 30), (0.55, 30, 98), (0.3, 80, 100)]
+    for share, low, high in phases:
+        for _ in range(int(samples * share)):
+            load = rng.uniform(low, high)
+            yield load * rng.uniform(0.6, 1.0), load, 60 + load * 0.3
+
+
+def naive(settings, current, load):
+    if load >= settings["up_threshold"] and current < len(SPEEDS) - 1:
+        return current + 1
+    if load <= settings["down_threshold"] and current > 0:
+        return current - 1
+    return None
+
+
+def run(args):
+    rng = random.Random(args.seed)
+    settings = governor.get_default_config()
+    settings["interval"] = args.interval
+    samples = int(args.minutes * 60 / args.interval)
+
+    with tempfile.TemporaryDirectory() as root:
+        tree = FakeTree(root)
+        sampler = governor.LoadSampler(root)
+        sampler.open()
+        controller = FakeController()
+        gov = governor.Governor(controller, settings, sampler)
+        naive_current = 0
+        naive_changes = 0
+        residency = [0] * len(SPEEDS)
+
+        for index, (cpu, gpu, temp) in enumerate(load_trace(rng, samples)):
+            tree.set_load(cpu, gpu, temp)
+            target = gov.step(index * args.interval)
+            if target is not None:
+                controller.turbo.current = target
+            residency[controller.turbo.current] += 1
+
+            step = naive(settings, naive_current, max(cpu, gpu))
+            if step is not None:
+                naive_current = step
+                naive_changes += 1
+        sampler.close()
+
+    print(f"{samples} samples at {args.interval:g}s ({args.minutes:g} min simulated)")
+    print(f"  naive threshold policy: {naive_changes} speed changes")
+    print(f"  governor:               {gov.changes} speed changes")
+    print("  governor residency:     " + "  ".join(
+        f"speed {speed} {100 * count / samples:.0f}%" for speed, count in zip(SPEEDS, residency)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare turbo governor speed changes against a naive policy.")
+    parser.add_argument("--minutes", type=float, default=60.0, help="simulated minutes of load")
+    parser.add_argument("--interval", type=float, default=2.0, help="sample interval in seconds")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    logging.disable(logging.CRITICAL)
+    run(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,43 @@
+#!/usr/bin/env python3
+# This file is part of Handheld Game Console Controller System (HandyGCCS)
+# Copyright 2022-2023 Derek J. Clark <derekjohn.clark@gmail.com>
+# Measures how often a running handycon process wakes up. Leave the handheld
+# untouched for longer than the idle timeout first; an idle daemon with all of
+# its devices grabbed should report close to zero wakeups per second.
+
+import argparse
+import subprocess
+import sys
+import time
+
+from handycon import idle
+
+
+def find_pid():
+    try:
+        return int(subprocess.check_output(["pgrep", "-o", "-f", "bin/handycon"]).split()[0])
+    except (subprocess.CalledProcessError, IndexError, ValueError):
+        sys.exit("handycon is not running. Pass --pid.")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Count the wakeups of a running handycon process.")
+    parser.add_argument("--pid", type=int, help="process to measure, defaults to the running handycon")
+    parser.add_argument("--seconds", type=float, default=60.0)
+    parser.add_argument("--interval", type=float, default=10.0, help="report every this many seconds")
+    args = parser.parse_args()
+
+    pid = args.pid or find_pid()
+    start = last = idle.read_wakeups(pid)
+    started = time.monotonic()
+    while time.monotonic() - started < args.seconds:
+        time.sleep(min(args.interval, args.seconds - (time.monotonic() - started)))
+        now = idle.read_wakeups(pid)
+        print(f"{time.monotonic() - started:7.1f}s  {(now - last) / args.interval:8.3f} wakeups/s")
+        last = now
+    elapsed = time.monotonic() - started
+    print(f"pid {pid}: {idle.read_wakeups(pid) - start} wakeups in {elapsed:.1f}s, {(idle.read_wakeups(pid) - start) / elapsed:.3f}/s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+# This file is part of Handheld Game Console Controller System (HandyGCCS)
+# Copyright 2022-2023 Derek J. Clark <derekjohn.clark@gmail.com>
+# Replays the same input event stream through every available event loop
+# engine and reports read-to-write latency and CPU time per event. Events are
+# written to a pipe in the input_event layout and read back through
+# add_reader, the same path evdev's async_read_loop takes, then forwarded to
+# a second pipe the way events are written to the virtual controller.
+
+import argparse
+import asyncio
+import os
+import random
+import struct
+import time
+
+from handycon import engine
+
+# timestamp ns, type, code, value. Same size as struct input_event.
+EVENT = struct.Struct("<qHHiq")
+
+
+def replay_schedule(seed, events):
+    rng = random.Random(seed)
+    schedule = []
+    for _ in range(events):
+        # Controllers report in bursts at around 125-1000 Hz.
+        schedule.append(rng.choice((0.001, 0.002, 0.004, 0.008)))
+    return schedule
+
+
+async def replay(schedule):
+    loop = asyncio.get_running_loop()
+    in_read, in_write = os.pipe()
+    out_read, out_write = os.pipe()
+    os.set_blocking(in_read, False)
+    latencies = []
+    done = asyncio.Event()
+
+    async def forward(data):
+        stamp, type, code, value, _ = EVENT.unpack(data)
+        os.write(out_write, data)
+        latencies.append(time.perf_counter_ns() - stamp)
+        if len(latencies) == len(schedule):
+            done.set()
+
+    def on_readable():
+        data = os.read(in_read, EVENT.size * 64)
+        for offset in range(0, len(data), EVENT.size):
+            # Handlers are coroutines in the daemon too.
+            loop.create_task(forward(data[offset:offset + EVENT.size]))
+
+    def drain():
+        os.read(out_read, 65536)
+
+    loop.add_reader(in_read, on_readable)
+    loop.add_reader(out_read, drain)
+    cpu_start = time.process_time()
+    for delay in schedule:
+        await asyncio.sleep(delay)
+        os.write(in_write, EVENT.pack(time.perf_counter_ns(), 3, 0, 0, 0))
+    await done.wait()
+    cpu = time.process_time() - cpu_start
+    loop.remove_reader(in_read)
+    loop.remove_reader(out_read)
+    for fd in (in_read, in_write, out_read, out_write):
+        os.close(fd)
+    return latencies, cpu
+
+
+def report(name, latencies, cpu):
+    latencies = sorted(latencies)
+    count = len(latencies)
+
+    def percentile(share):
+        return latencies[min(int(count * share), count - 1)] / 1000
+
+    print(f"{name}: {count} events")
+    print(f"  latency:  p50 {percentile(0.5):7.1f} us  p99 {percentile(0.99):7.1f} us  max {latencies[-1] / 1000:7.1f} us")
+    print(f"  cpu:      {cpu / count * 1e6:7.1f} us per event")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare event loop engines on the same input replay.")
+    parser.add_argument("--events", type=int, default=20000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--loop", choices=engine.ENGINES, action="append",
+                        help="engine to run, may be repeated (default every installed engine)")
+    args = parser.parse_args()
+
+    schedule = replay_schedule(args.seed, args.events)
+    installed = engine.available()
+    for name in args.loop or engine.ENGINES:
+        if name not in installed:
+            print(f"{name}: not installed, skipped")
+            continue
+        latencies, cpu = engine.run(replay(schedule), name)
+        report(name, latencies, cpu)
+
+
+if __name__ == "__main__":
+    main()
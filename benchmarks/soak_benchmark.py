@@ -0,0 +1,323 @@
+#!/usr/bin/env python3
+# This file is part of Handheld Game Console Controller System (HandyGCCS)
+# Copyright 2022-2023 Derek J. Clark <derekjohn.clark@gmail.com>
+# Drives hours of synthetic chord traffic through every handheld module and
+# profile and reports RSS, event queue depth and per-event time, to show that
+# memory and latency stay flat over a long session. Time is simulated, so an
+# hour of traffic takes seconds to replay.
+# The chords each module listens for are read from its source. Traffic mixes
+# clean presses, key repeats, out of order releases and partial chords so
+# mismatched release paths get exercised.
+
+import argparse
+import ast
+import heapq
+import importlib
+import itertools
+import logging
+import os
+import pkgutil
+import random
+import sys
+import time
+
+from evdev import InputEvent, ecodes as e
+
+from handycon import chords, devices, engine, handhelds, pending, profiles, trace
+from handycon.constants import EVENT_MAP, PROFILES_DIR
+
+DEFAULT_BUTTONS = {
+    "button1": "SCR",
+    "button2": "QAM",
+    "button3": "ESC",
+    "button4": "OSK",
+    "button5": "MODE",
+    "button6": "OPEN_CHIMERA",
+    "button7": "TOGGLE_PERFORMANCE",
+    "button8": "MODE",
+    "button9": "TOGGLE_MOUSE",
+    "button10": "ALT_TAB",
+    "button11": "KILL",
+    "button12": "TOGGLE_GYRO",
+}
+PAGE_SIZE = os.sysconf("SC_PAGE_SIZE")
+# Per-event time is averaged over windows of this many events.
+WINDOW = 1000
+
+
+def rss_kib():
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * PAGE_SIZE // 1024
+
+
+class SimulatedHandle:
+    def __init__(self, callback):
+        self.callback = callback
+        self.cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
+
+
+class SimulatedClock:
+    """Simulated time. Also stands in for the event loop the ChordTimer
+    schedules its deadlines on, so hold and repeat deadlines come due in
+    simulated time too."""
+
+    def __init__(self):
+        self.now = 0.0
+        self.timers = []
+        self.sequence = itertools.count()
+
+    def __call__(self):
+        return self.now
+
+    def time(self):
+        return self.now
+
+    def call_at(self, when, callback):
+        handle = SimulatedHandle(callback)
+        heapq.heappush(self.timers, (when, next(self.sequence), handle))
+        return handle
+
+    # Moves time forward, running each timer that comes due on the way.
+    def advance(self, seconds):
+        end = self.now + seconds
+        while self.timers and self.timers[0][0] <= end:
+            when, _, handle = heapq.heappop(self.timers)
+            if not handle.cancelled:
+                self.now = max(self.now, when)
+                handle.callback()
+        self.now = end
+
+
+class NoTurbo:
+    def capture(self):
+        return False
+
+    def set_turbo(self):
+        pass
+
+
+class DiscardDevice:
+    def write_event(self, event):
+        pass
+
+    def syn(self):
+        pass
+
+
+class SoakController:
+    """The parts of HandheldController the handheld modules touch, with
+    output discarded."""
+
+    def __init__(self, clock):
+        self.logger = logging.getLogger("soak")
+        self.button_map = {button: EVENT_MAP[event] for button, event in DEFAULT_BUTTONS.items()}
+        self.event_queue = pending.PendingActions(clock=clock)
+        self.chord_timer = chords.ChordTimer(loop=clock)
+        self.last_button = None
+        self.pending_config = None
+        self.shutdown = False
+        self.turbo = NoTurbo()
+        self.trace = trace.EventTrace()
+        self.ui_device = DiscardDevice()
+        self.emitted = 0
+
+    def add_keyboard(self, role, name, phys, handler=None):
+        pass
+
+    def fire_action(self, event_list, value):
+        self.emitted += 1
+
+    def tap_action(self, event_list):
+        self.emitted += 1
+
+    async def emit_events(self, events):
+        self.emitted += len(events)
+
+    async def emit_now(self, seed_event, event_list, value):
+        self.emitted += 1
+
+    async def do_rumble(self, button=0, interval=10, length=1000, delay=0):
+        pass
+
+    # The real press and release paths, so the queue is cleaned up exactly as
+    # it is on the device.
+    async def handle_key_down(self, seed_event, queued_event):
+        await devices.handle_key_down(seed_event, queued_event)
+
+    async def handle_key_up(self, seed_event, queued_event):
+        await devices.handle_key_up(seed_event, queued_event)
+
+
+# Collects every key list compared against active_keys in a handheld module,
+# resolving module level constants like AOKZOE_A1_HOME.
+def module_chords(module):
+    with open(module.__file__) as f:
+        tree = ast.parse(f.read())
+    found = set()
+
+    def add(node):
+        if isinstance(node, ast.Name):
+            node = ast.Constant(getattr(module, node.id, None))
+        try:
+            value = node.value if isinstance(node, ast.Constant) else ast.literal_eval(node)
+        except ValueError:
+            return
+        if isinstance(value, list) and value and all(isinstance(key, int) for key in value):
+            found.add(tuple(sorted(value)))
+        elif isinstance(value, list):
+            for chord in value:
+                if isinstance(chord, list) and chord:
+                    found.add(tuple(sorted(chord)))
+
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Compare) and isinstance(node.left, ast.Name) and node.left.id == "active_keys":
+            for comparator in node.comparators:
+                add(comparator)
+    return sorted(found)
+
+
+def handlers(profiles_dir):
+    for info in pkgutil.iter_modules(handhelds.__path__):
+        module = importlib.import_module(f"handycon.handhelds.{info.name}")
+        yield info.name, module, module_chords(module)
+    loaded, errors = profiles.compile_profiles([profiles_dir])
+    for profile in loaded:
+        handler = profiles.ProfileHandler(profile)
+        found = sorted({tuple(chord) for _, alternatives, _ in profile["buttons"] for chord in alternatives})
+        yield f"{profile['name']} (profile)", handler, found
+
+
+# Returns the (code, value) key events for one burst of traffic, and whether
+# the burst is a whole chord that every release path has to clean up after.
+def chord_traffic(rng, all_chords, all_keys) -> tuple:
+    chord = list(rng.choice(all_chords))
+    kind = rng.random()
+    whole = True
+    if kind < 0.1:
+        # Partial chord, as when a firmware macro is interrupted.
+        chord = chord[:max(1, len(chord) - 1)]
+        whole = False
+    elif kind < 0.15:
+        chord.append(rng.choice(all_keys))
+        whole = False
+    events = [(code, 1) for code in chord]
+    if rng.random() < 0.3:
+        events += [(chord[-1], 2)] * rng.randint(1, 20)
+    release = list(chord)
+    if rng.random() < 0.5:
+        rng.shuffle(release)
+    events += [(code, 0) for code in release]
+    return events, whole
+
+
+async def soak(name, handler, all_chords, hours, seed):
+    clock = SimulatedClock()
+    controller = SoakController(clock)
+    devices.set_handycon(controller)
+    handler.init_handheld(controller)
+    rng = random.Random(seed)
+    all_keys = sorted({key for chord in all_chords for key in chord})
+    end = hours * 3600
+    windows = []
+    window_time = 0
+    window_events = 0
+    events = 0
+    depth_max = 0
+    held = set()
+    failures = {}
+    leaked = 0
+    rss_start = rss_kib()
+
+    while clock.now < end:
+        burst, whole = chord_traffic(rng, all_chords, all_keys)
+        queued = len(controller.event_queue)
+        for code, value in burst:
+            clock.advance(rng.uniform(0.005, 0.05))
+            if value:
+                held.add(code)
+            else:
+                held.discard(code)
+            active_keys = sorted(held)
+            sec = int(clock.now)
+            seed_event = InputEvent(sec, int((clock.now - sec) * 1000000), e.EV_KEY, code, value)
+
+            start = time.perf_counter_ns()
+            try:
+                await handler.process_event(seed_event, active_keys)
+            except Exception as err:
+                # The keyboard loop would drop the device here.
+                failures[type(err).__name__ + f": {err}"] = failures.get(type(err).__name__ + f": {err}", 0) + 1
+            controller.event_queue.expire(active_keys)
+            window_time += time.perf_counter_ns() - start
+            window_events += 1
+            events += 1
+            depth_max = max(depth_max, len(controller.event_queue))
+
+            if window_events == WINDOW:
+                windows.append(window_time / window_events / 1000)
+                window_time = window_events = 0
+        # A whole chord pressed with nothing queued must not leave anything
+        # behind for expiry to clean up. Entries left by a partial chord can
+        # change how the next release is handled, so those bursts don't count.
+        if whole and not queued and controller.event_queue:
+            leaked += 1
+        # Idle gap between bursts.
+        clock.advance(rng.uniform(0.1, 3.0))
+
+    print(f"{name}: {len(all_chords)} chords, {events} events over {hours:g} h simulated")
+    if windows:
+        print(f"  per event:   first {windows[0]:6.2f} us  last {windows[-1]:6.2f} us  worst window {max(windows):6.2f} us")
+    print(f"  queue depth: max {depth_max}  final {len(controller.event_queue)}  expired {controller.event_queue.expired}  dropped {controller.event_queue.dropped}")
+    print(f"  leaked:      {leaked} whole chords left a queued press behind")
+    print(f"  chord timer: fired {controller.chord_timer.fired}")
+    print(f"  rss:         {rss_start} KiB -> {rss_kib()} KiB")
+    for failure, count in failures.items():
+        print(f"  raised {count}x {failure}")
+    # Partial chords may leave presses for expiry, whole ones may not.
+    return not failures and not leaked
+
+
+# Returns the names of the modules that failed the soak.
+
+
+async def main_async(args) -> list:
+    failed = []
+    for name, handler, all_chords in handlers(args.profiles):
+        if args.only and args.only not in name:
+            continue
+        if not all_chords:
+            print(f"{name}: no chords found, skipped")
+            continue
+        if not await soak(name, handler, all_chords, args.hours, args.seed):
+            failed.append(name)
+    return failed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Soak every handheld module with synthetic chord traffic.")
+    parser.add_argument("--hours", type=float, default=8.0, help="simulated hours of traffic per module")
+    parser.add_argument("--only", help="only run modules whose name contains this")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--profiles", default=PROFILES_DIR, help="directory of handheld profiles to soak")
+    parser.add_argument("--loop", choices=engine.ENGINES, action="append",
+                        help="event loop engine to soak on, may be repeated (default asyncio)")
+    args = parser.parse_args()
+    logging.disable(logging.CRITICAL)
+    installed = engine.available()
+    failed = []
+    for name in args.loop or [engine.DEFAULT_ENGINE]:
+        if name not in installed:
+            print(f"== {name}: not installed, skipped")
+            continue
+        print(f"== {name}")
+        failed += engine.run(main_async(args), name)
+    if failed:
+        print(f"Failed: {', '.join(failed)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+# This file is part of Handheld Game Console Controller System (HandyGCCS)
+# Copyright 2022-2023 Derek J. Clark <derekjohn.clark@gmail.com>
+
+# Python Modules
+import fcntl
+import glob
+import json
+import os
+
+## Local modules
+from .constants import BINDING_CACHE_PATH
+
+# ioctl request numbers from linux/input.h. _IOC(_IOC_READ, 'E', nr, len)
+EVIOCGNAME = 0x06
+EVIOCGPHYS = 0x07
+IOC_READ = 2
+NAME_LEN = 256
+
+cache = None
+
+
+def eviocg(nr, length=NAME_LEN):
+    return (IOC_READ << 30) | (length << 16) | (ord('E') << 8) | nr
+
+
+# Identifies the cache so a kernel update or a different device invalidates it.
+def cache_key() -> str:
+    try:
+        with open("/sys/devices/virtual/dmi/id/product_name", "r") as f:
+            product = f.read().strip()
+    except OSError:
+        product = ""
+    return f"{product}|{os.uname().release}"
+
+
+def load(path=BINDING_CACHE_PATH) -> dict:
+    global cache
+
+    if cache is None:
+        cache = {"key": cache_key(), "roles": {}}
+        try:
+            with open(path, "r") as f:
+                stored = json.load(f)
+            if stored.get("key") == cache["key"]:
+                cache["roles"] = stored.get("roles", {})
+        except (OSError, ValueError, AttributeError):
+            pass
+    return cache
+
+
+def read_string(fd, nr) -> str:
+    buf = bytearray(NAME_LEN)
+    fcntl.ioctl(fd, eviocg(nr), buf)
+    return bytes(buf).split(b"\0", 1)[0].decode(errors="replace")
+
+
+# Confirms the node at path still belongs to the device we bound last time
+# with one EVIOCGNAME and one EVIOCGPHYS, without a full InputDevice open.
+def validate(path, name, phys) -> bool:
+    try:
+        fd = os.open(path, os.O_RDONLY | os.O_NONBLOCK)
+    except OSError:
+        return False
+    try:
+        return read_string(fd, EVIOCGNAME) == name and read_string(fd, EVIOCGPHYS) == phys
+    except OSError:
+        return False
+    finally:
+        os.close(fd)
+
+
+# A device that went away, for instance over a suspend, usually comes back
+# under the same parent with a new input and event number. Looks there for a
+# node matching name and phys and moves the binding to it.
+def relocate(role, binding, path=BINDING_CACHE_PATH) -> str | None:
+    sysfs = binding.get("sysfs")
+    if not sysfs:
+        return None
+    for event_dir in sorted(glob.glob(os.path.join(os.path.dirname(sysfs), "input*", "event*"))):
+        event = os.path.basename(event_dir)
+        event_path = f"/dev/input/{event}"
+        if validate(event_path, binding["name"], binding["phys"]):
+            save(role, dict(binding, path=event_path, sysfs=os.path.realpath(os.path.dirname(event_dir))), path)
+            return event_path
+    return None
+
+
+# Returns the cached event node for role if it still matches name and phys.
+def lookup(role, name, phys, path=BINDING_CACHE_PATH) -> str | None:
+    binding = load(path)["roles"].get(role)
+    if not binding or binding.get("name") != name or binding.get("phys") != phys:
+        return None
+    event_path = binding.get("path")
+    if event_path and validate(event_path, name, phys):
+        return event_path
+    return relocate(role, binding, path)
+
+
+def store(role, device, path=BINDING_CACHE_PATH) -> bool:
+    event = os.path.basename(device.path)
+    binding = {
+        "path": device.path,
+        "name": device.name,
+        "phys": device.phys,
+        "sysfs": os.path.realpath(f"/sys/class/input/{event}/device"),
+    }
+    return save(role, binding, path)
+
+
+def save(role, binding, path=BINDING_CACHE_PATH) -> bool:
+    data = load(path)
+    if data["roles"].get(role) == binding:
+        return True
+    data["roles"][role] = binding
+
+    # Write to a temporary file first so a crash never leaves a torn cache.
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(data, f)
+        os.replace(tmp_path, path)
+    except OSError:
+        return False
+    return True
@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+# This file is part of Handheld Game Console Controller System (HandyGCCS)
+# Copyright 2022-2023 Derek J. Clark <derekjohn.clark@gmail.com>
+
+# Python Modules
+import asyncio
+import heapq
+import itertools
+
+# Press patterns a button can be classified as.
+TAP = "tap"
+HOLD = "hold"
+HOLD_END = "hold_end"
+DOUBLE = "double"
+REPEAT = "repeat"
+
+# Internal deadline kinds.
+HOLD_DEADLINE = "hold_deadline"
+REPEAT_DEADLINE = "repeat_deadline"
+TAP_DEADLINE = "tap_deadline"
+
+
+class PressPattern:
+    """Classifies presses of one physical button or chord.
+
+    actions maps TAP, HOLD, HOLD_END, DOUBLE and REPEAT to callables. Only the
+    patterns with an action are tracked, so a button with only a TAP action
+    fires on release without waiting for any deadline."""
+
+    def __init__(self, name, actions: dict, hold_time=0.5, double_time=0.3, repeat_interval=0.1):
+        self.name = name
+        self.actions = actions
+        self.hold_time = hold_time
+        self.double_time = double_time
+        self.repeat_interval = repeat_interval
+        self.timer = None
+        self.generation = 0
+        self.pressed = False
+        self.held = False
+        self.awaiting_double = False
+        self.suppress_release = False
+
+    def fire(self, pattern):
+        action = self.actions.get(pattern)
+        if action:
+            action()
+
+    def press(self, now):
+        if self.pressed:
+            return
+        self.pressed = True
+        self.generation += 1
+
+        if self.awaiting_double:
+            self.awaiting_double = False
+            self.suppress_release = True
+            self.fire(DOUBLE)
+            return
+
+        if HOLD in self.actions or REPEAT in self.actions:
+            self.timer.schedule(now + self.hold_time, self, HOLD_DEADLINE)
+
+    def release(self, now):
+        if not self.pressed:
+            return
+        self.pressed = False
+        self.generation += 1
+
+        if self.suppress_release:
+            self.suppress_release = False
+        elif self.held:
+            self.held = False
+            self.fire(HOLD_END)
+        elif DOUBLE in self.actions:
+            self.awaiting_double = True
+            self.timer.schedule(now + self.double_time, self, TAP_DEADLINE)
+        else:
+            self.fire(TAP)
+
+    def expire(self, kind, deadline):
+        if kind == HOLD_DEADLINE:
+            self.held = True
+            self.fire(HOLD)
+            if REPEAT in self.actions:
+                self.timer.schedule(deadline + self.repeat_interval, self, REPEAT_DEADLINE)
+        elif kind == REPEAT_DEADLINE:
+            self.fire(REPEAT)
+            # Schedule from the deadline, not from now, so repeats never drift.
+            self.timer.schedule(deadline + self.repeat_interval, self, REPEAT_DEADLINE)
+        elif kind == TAP_DEADLINE:
+            self.awaiting_double = False
+            self.fire(TAP)
+
+
+class ChordTimer:
+    """Services press pattern deadlines from a heap on the event loop.
+
+    Only one loop timer is ever armed, for the earliest deadline. Cancelled
+    deadlines are left in the heap and skipped when they come due. on_settle
+    callbacks run when serviced deadlines leave no pattern busy."""
+
+    def __init__(self, loop=None):
+        self.loop = loop
+        self.heap = []
+        self.handle = None
+        self.handle_when = None
+        self.patterns = {}
+        self.sequence = itertools.count()
+        self.on_settle = []
+        self.fired = 0
+        self.lateness_max = 0.0
+        self.lateness_total = 0.0
+
+    def get_loop(self):
+        if self.loop is None:
+            self.loop = asyncio.get_event_loop()
+        return self.loop
+
+    def now(self) -> float:
+        return self.get_loop().time()
+
+    def add(self, pattern: PressPattern):
+        pattern.timer = self
+        self.patterns[pattern.name] = pattern
+
+    def press(self, name):
+        self.patterns[name].press(self.now())
+
+    def release(self, name):
+        self.patterns[name].release(self.now())
+
+    def is_pressed(self, name) -> bool:
+        return self.patterns[name].pressed
+
+    # True while any pattern is mid-press and its actions may still fire.
+    def busy(self) -> bool:
+        return any(pattern.pressed or pattern.awaiting_double for pattern in self.patterns.values())
+
+    def schedule(self, deadline, pattern, kind):
+        heapq.heappush(self.heap, (deadline, next(self.sequence), pattern, kind, pattern.generation))
+        self.arm()
+
+    # Keeps the single loop timer pointed at the earliest deadline.
+    def arm(self):
+        if not self.heap:
+            return
+        deadline = self.heap[0][0]
+        if self.handle is not None:
+            if self.handle_when <= deadline:
+                return
+            self.handle.cancel()
+        self.handle = self.get_loop().call_at(deadline, self.service)
+        self.handle_when = deadline
+
+    def service(self):
+        self.handle = None
+        now = self.now()
+        while self.heap and self.heap[0][0] <= now:
+            deadline, _, pattern, kind, generation = heapq.heappop(self.heap)
+            if generation != pattern.generation:
+                continue
+            lateness = now - deadline
+            self.fired += 1
+            self.lateness_total += lateness
+            self.lateness_max = max(self.lateness_max, lateness)
+            pattern.expire(kind, deadline)
+        self.arm()
+        if self.on_settle and not self.busy():
+            for callback in self.on_settle:
+                callback()
+
+    def stats(self) -> dict:
+        return {
+            "fired": self.fired,
+            "lateness_max_ms": self.lateness_max * 1000,
+            "lateness_mean_ms": self.lateness_total / self.fired * 1000 if self.fired else 0.0,
+        }
@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+# This file is part of Handheld Game Console Controller System (HandyGCCS)
+# Copyright 2022-2023 Derek J. Clark <derekjohn.clark@gmail.com>
+
+# Python Modules
+import asyncio
+import ctypes
+import os
+import struct
+
+## Local modules
+from .constants import *
+from . import utilities
+
+# inotify flags from linux/inotify.h
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_NONBLOCK = os.O_NONBLOCK
+IN_CLOEXEC = os.O_CLOEXEC
+INOTIFY_EVENT = struct.Struct("iIII")
+
+# Editors often write a file several times in quick succession. Wait for the
+# writes to settle before parsing.
+CONFIG_SETTLE_DELAY = 0.1
+
+handycon = None
+
+def set_handycon(handheld_controller):
+    global handycon
+    handycon = handheld_controller
+
+
+# Returns an inotify fd watching directory for the events in mask. By default
+# that is files being written or replaced.
+def open_watch(directory, mask=IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE) -> int:
+    libc = ctypes.CDLL(None, use_errno=True)
+    fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+    if fd < 0:
+        raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+    wd = libc.inotify_add_watch(fd, os.fsencode(directory), mask)
+    if wd < 0:
+        err = ctypes.get_errno()
+        os.close(fd)
+        raise OSError(err, f"inotify_add_watch failed for {directory}")
+    return fd
+
+
+# Drains the inotify fd and returns the file names that changed.
+def read_names(fd) -> list[str]:
+    names = []
+    while True:
+        try:
+            data = os.read(fd, 4096)
+        except BlockingIOError:
+            return names
+        offset = 0
+        while offset + INOTIFY_EVENT.size <= len(data):
+            _, _, _, length = INOTIFY_EVENT.unpack_from(data, offset)
+            offset += INOTIFY_EVENT.size
+            names.append(data[offset:offset + length].split(b"\0", 1)[0].decode(errors="replace"))
+            offset += length
+
+
+# Parses the config on a worker thread, then swaps it in on the event loop.
+async def reload_config():
+    global handycon
+
+    loop = asyncio.get_running_loop()
+    try:
+        config, compiled = await loop.run_in_executor(None, utilities.read_config, CONFIG_PATH)
+    except ValueError as err:
+        handycon.logger.error(f"{err} | Keeping the current config.")
+        return
+
+    handycon.pending_config = (config, compiled)
+    if not utilities.apply_pending_config():
+        handycon.logger.info("Config change queued until the current button press is released.")
+
+
+# Watches the config directory and reloads the config when it changes. The
+# task sleeps on the inotify fd and never polls.
+async def watch_config():
+    global handycon
+
+    loop = asyncio.get_running_loop()
+    try:
+        fd = open_watch(CONFIG_DIR)
+    except (OSError, AttributeError) as err:
+        handycon.logger.warn(f"{err} | Config hot-reload is not available.")
+        return
+
+    config_name = os.path.basename(CONFIG_PATH)
+    changed = asyncio.Event()
+
+    def on_readable():
+        if config_name in read_names(fd):
+            changed.set()
+
+    loop.add_reader(fd, on_readable)
+    try:
+        while handycon.running:
+            await changed.wait()
+            await asyncio.sleep(CONFIG_SETTLE_DELAY)
+            changed.clear()
+            handycon.logger.info(f"Detected change to {CONFIG_PATH}. Reloading.")
+            await reload_config()
+    finally:
+        loop.remove_reader(fd)
+        os.close(fd)
@@ -5,6 +5,7 @@
 from evdev import AbsInfo, ecodes as e
 from pathlib import Path
 
+BINDING_CACHE_PATH = Path("/var/cache/handygccs/bindings.json")
 CHIMERA_LAUNCHER_PATH = Path('/usr/share/chimera/bin/chimera-web-launcher')
 CONFIG_DIR = "/etc/handygccs/"
 CONFIG_PATH = "/etc/handygccs/handygccs.conf"
@@ -231,6 +232,43 @@ INSTANT_EVENTS = [EVENT_MODE, EVENT_OPEN_CHIM, EVENT_TOGGLE_GYRO, EVENT_TOGGLE_M
 QUEUED_EVENTS = [EVENT_ALT_TAB, EVENT_ESC, EVENT_KILL, EVENT_OSK, EVENT_OSK_DE, EVENT_QAM, EVENT_SCR]
 FF_DELAY = 0.2
 HIDE_PATH = Path("/dev/input/.hidden/")
+MOUSE_EVENTS = {
+    e.EV_REL: [
+        e.REL_X,
+        e.REL_Y,
+        e.REL_WHEEL,
+    ],
+    e.EV_KEY: [
+        e.BTN_LEFT,
+        e.BTN_RIGHT,
+        e.BTN_MIDDLE,
+    ],
+}
 HOME_PATH = Path('/home')
 JOY_MAX = 32767
 JOY_MIN = -32767
+# Default sampling rate of the profiler started with SIGUSR2.
+PROFILE_HZ = 100
+PROFILE_CACHE_PATH = Path("/var/cache/handygccs/profiles.bin")
+PROFILE_OVERRIDE_DIR = Path("/etc/handygccs/profiles")
+PROFILES_DIR = Path("/usr/share/handygccs/profiles")
+# Missing devices are retried this often for a while after a resume.
+RESUME_POLL = 0.05
+# Stick and trigger options that leave the input untouched.
+STICK_DEFAULTS = {
+    "inner_deadzone": 0.0,
+    "outer_deadzone": 0.0,
+    "anti_deadzone": 0.0,
+    "curve": 1.0,
+    "radial": False,
+}
+TRIGGER_DEFAULTS = {
+    "deadzone": 0.0,
+    "outer_deadzone": 0.0,
+    "curve": 1.0,
+    "hair_trigger": False,
+    "threshold": 0.5,
+    "hysteresis": 0.1,
+}
+# Longest wait for the controller before the startup turbo speed is applied anyway.
+TURBO_STARTUP_WAIT = 30.0
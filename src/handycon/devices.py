@@ -5,34 +5,17 @@
 ## Python Modules
 import asyncio
 import os
+import time
 
 # Local modules
-import handycon.handhelds.ally_gen1 as ally_gen1
-import handycon.handhelds.anb_gen1 as anb_gen1
-import handycon.handhelds.aok_gen1 as aok_gen1
-import handycon.handhelds.aok_gen2 as aok_gen2
-import handycon.handhelds.aya_gen1 as aya_gen1
-import handycon.handhelds.aya_gen2 as aya_gen2
-import handycon.handhelds.aya_gen3 as aya_gen3
-import handycon.handhelds.aya_gen4 as aya_gen4
-import handycon.handhelds.aya_gen5 as aya_gen5
-import handycon.handhelds.aya_gen6 as aya_gen6
-import handycon.handhelds.aya_gen7 as aya_gen7
-import handycon.handhelds.ayn_gen1 as ayn_gen1
-import handycon.handhelds.gpd_gen1 as gpd_gen1
-import handycon.handhelds.gpd_gen2 as gpd_gen2
-import handycon.handhelds.gpd_gen3 as gpd_gen3
-import handycon.handhelds.oxp_gen1 as oxp_gen1
-import handycon.handhelds.oxp_gen2 as oxp_gen2
-import handycon.handhelds.oxp_gen3 as oxp_gen3
-import handycon.handhelds.oxp_gen4 as oxp_gen4
 from .constants import *
+from . import bindings
+from . import trace
 
 ## Partial imports
 from evdev import ecodes as e, ff, InputDevice, InputEvent, list_devices, UInput
 from pathlib import Path
 from shutil import move
-from time import sleep
 
 handycon = None
 
@@ -41,140 +24,86 @@ def set_handycon(handheld_controller):
     handycon = handheld_controller
 
 
+# Finds an input device by name and phys. The binding cached from the last
+# successful grab is tried first, and only a miss falls back to a full scan.
+def find_device(role, name, phys):
+    global handycon
+
+    cached_path = bindings.lookup(role, name, phys)
+    if cached_path:
+        handycon.logger.debug(f"Using cached {role} binding {cached_path}.")
+        return InputDevice(cached_path)
+
+    for device in [InputDevice(path) for path in list_devices()]:
+        handycon.logger.debug(f"{device.name}, {device.phys}")
+        if device.name == name and device.phys == phys:
+            if not bindings.store(role, device):
+                handycon.logger.warn(f"Unable to cache {role} binding to {BINDING_CACHE_PATH}.")
+            return device
+    return None
+
+
 def get_controller():
     global handycon
 
     handycon.logger.debug(f"Attempting to grab {handycon.GAMEPAD_NAME}.")
     # Identify system input event devices.
     try:
-        devices_original = [InputDevice(path) for path in list_devices()]
+        device = find_device("controller", handycon.GAMEPAD_NAME, handycon.GAMEPAD_ADDRESS)
 
     except Exception as err:
         handycon.logger.error("Error when scanning event devices. Restarting scan.")
-        sleep(DETECT_DELAY)
         return False
 
     # Grab the built-in devices. This will give us exclusive acces to the devices and their capabilities.
-    for device in devices_original:
-        if device.name == handycon.GAMEPAD_NAME and device.phys == handycon.GAMEPAD_ADDRESS:
-            handycon.controller_path = device.path
-            handycon.controller_device = InputDevice(handycon.controller_path)
-            if handycon.CAPTURE_CONTROLLER:
-                handycon.controller_device.grab()
-                handycon.controller_event = Path(handycon.controller_path).name
-                move(handycon.controller_path, str(HIDE_PATH / handycon.controller_event))
-            break
+    if device:
+        handycon.controller_path = device.path
+        handycon.controller_device = device
+        if handycon.CAPTURE_CONTROLLER:
+            handycon.controller_device.grab()
+            handycon.controller_event = Path(handycon.controller_path).name
+            move(handycon.controller_path, str(HIDE_PATH / handycon.controller_event))
 
     # Sometimes the service loads before all input devices have full initialized. Try a few times.
     if not handycon.controller_device:
         handycon.logger.warn("Controller device not yet found. Restarting scan.")
-        sleep(DETECT_DELAY)
         return False
     else:
         handycon.logger.info(f"Found {handycon.controller_device.name}. Capturing input data.")
+        handycon.startup.phase_since("first device grab", "loop start")
         return True
 
 
-def get_keyboard():
-    global handycon
-
-    handycon.logger.debug(f"Attempting to grab {handycon.KEYBOARD_NAME}.")
-    try:
-        # Grab the built-in devices. This will give us exclusive acces to the devices and their capabilities.
-        for device in [InputDevice(path) for path in list_devices()]:
-            handycon.logger.debug(f"{device.name}, {device.phys}")
-            if device.name == handycon.KEYBOARD_NAME and device.phys == handycon.KEYBOARD_ADDRESS:
-                handycon.keyboard_path = device.path
-                handycon.keyboard_device = InputDevice(handycon.keyboard_path)
-                if handycon.CAPTURE_KEYBOARD:
-                    handycon.keyboard_device.grab()
-                    handycon.keyboard_event = Path(handycon.keyboard_path).name
-                    move(handycon.keyboard_path, str(HIDE_PATH / handycon.keyboard_event))
-                break
-
-        # Sometimes the service loads before all input devices have full initialized. Try a few times.
-        if not handycon.keyboard_device:
-            handycon.logger.warn("Keyboard device not yet found. Restarting scan.")
-            sleep(DETECT_DELAY)
-            return False
-        else:
-            handycon.logger.info(f"Found {handycon.keyboard_device.name}. Capturing input data.")
-            return True
-
-    # Some funky stuff happens sometimes when booting. Give it another shot.
-    except Exception as err:
-        handycon.logger.error("Error when scanning event devices. Restarting scan.")
-        sleep(DETECT_DELAY)
-        return False
-
-
-def get_keyboard_2():
-    global handycon
-
-    handycon.logger.debug(f"Attempting to grab {handycon.KEYBOARD_2_NAME}.")
-    try:
-        # Grab the built-in devices. This will give us exclusive acces to the devices and their capabilities.
-        for device in [InputDevice(path) for path in list_devices()]:
-            handycon.logger.debug(f"{device.name}, {device.phys}")
-            if device.name == handycon.KEYBOARD_2_NAME and device.phys == handycon.KEYBOARD_2_ADDRESS:
-                handycon.keyboard_2_path = device.path
-                handycon.keyboard_2_device = InputDevice(handycon.keyboard_2_path)
-                if handycon.CAPTURE_KEYBOARD:
-                    handycon.keyboard_2_device.grab()
-                    handycon.keyboard_2_event = Path(handycon.keyboard_2_path).name
-                    move(handycon.keyboard_2_path, str(HIDE_PATH / handycon.keyboard_2_event))
-                break
-
-        # Sometimes the service loads before all input devices have full initialized. Try a few times.
-        if not handycon.keyboard_2_device:
-            handycon.logger.warn("Keyboard device 2 not yet found. Restarting scan.")
-            sleep(DETECT_DELAY)
-            return False
-        else:
-            handycon.logger.info(f"Found {handycon.keyboard_2_device.name}. Capturing input data.")
-            return True
-
-    # Some funky stuff happens sometimes when booting. Give it another shot.
-    except Exception as err:
-        handycon.logger.error("Error when scanning event devices. Restarting scan.")
-        sleep(DETECT_DELAY)
-        return False
-
-
 def get_powerkey():
     global handycon
 
     handycon.logger.debug(f"Attempting to grab power buttons.")
     # Identify system input event devices.
     try:
-        devices_original = [InputDevice(path) for path in list_devices()]
-    # Some funky stuff happens sometimes when booting. Give it another shot.
-    except Exception as err:
-        handycon.logger.error("Error when scanning event devices. Restarting scan.")
-        sleep(DETECT_DELAY)
-        return False
-
-    # Grab the built-in devices. This will give us exclusive acces to the devices and their capabilities.
-    for device in devices_original:
-
         # Power Button
-        if device.name == 'Power Button' and device.phys == handycon.POWER_BUTTON_PRIMARY and not handycon.power_device:
-            handycon.power_device = device
-            handycon.logger.debug(f"found power device {handycon.power_device.phys}")
-            if handycon.CAPTURE_POWER:
-                handycon.power_device.grab()
+        if not handycon.power_device:
+            handycon.power_device = find_device("power", 'Power Button', handycon.POWER_BUTTON_PRIMARY)
+            if handycon.power_device:
+                handycon.logger.debug(f"found power device {handycon.power_device.phys}")
+                if handycon.CAPTURE_POWER:
+                    handycon.power_device.grab()
 
         # Some devices have an extra power input device corresponding to the same
         # physical button that needs to be grabbed.
-        if device.name == 'Power Button' and device.phys == handycon.POWER_BUTTON_SECONDARY and not handycon.power_device_2:
-            handycon.power_device_2 = device
-            handycon.logger.debug(f"found alternate power device {handycon.power_device_2.phys}")
-            if handycon.CAPTURE_POWER:
-                handycon.power_device_2.grab()
+        if not handycon.power_device_2:
+            handycon.power_device_2 = find_device("power_2", 'Power Button', handycon.POWER_BUTTON_SECONDARY)
+            if handycon.power_device_2:
+                handycon.logger.debug(f"found alternate power device {handycon.power_device_2.phys}")
+                if handycon.CAPTURE_POWER:
+                    handycon.power_device_2.grab()
+
+    # Some funky stuff happens sometimes when booting. Give it another shot.
+    except Exception as err:
+        handycon.logger.error("Error when scanning event devices. Restarting scan.")
+        return False
 
     if not handycon.power_device and not handycon.power_device_2:
         handycon.logger.warn("No Power Button found. Restarting scan.")
-        sleep(DETECT_DELAY)
         return False
     else:
         if handycon.power_device:
@@ -209,108 +138,86 @@ async def do_rumble(button=0, interval=10, length=1000, delay=0):
     handycon.controller_device.erase_effect(effect_id)
 
 
-# Captures keyboard events and translates them to virtual device events.
-async def capture_keyboard_events():
-    global handycon
-
-    # Capture keyboard events and translate them to mapped events.
-    while handycon.running:
-        if handycon.keyboard_device:
-            try:
-                async for seed_event in handycon.keyboard_device.async_read_loop():
-                    # Loop variables
-                    active_keys = handycon.keyboard_device.active_keys()
-
-                    # Debugging variables
-                    handycon.logger.debug(f"Seed Value: {seed_event.value}, Seed Code: {seed_event.code}, Seed Type: {seed_event.type}.")
-                    if active_keys != []:
-                        handycon.logger.debug(f"Active Keys: {active_keys}")
-                    else:
-                        handycon.logger.debug("No active keys")
-                    if handycon.event_queue != []:
-                        handycon.logger.debug(f"Queued events: {handycon.event_queue}")
-                    else:
-                        handycon.logger.debug("No active events.")
-
-                    # Capture keyboard events and translate them to mapped events.
-                    handycon.system_handler.process_event(seed_event, active_keys)
-
-            except Exception as err:
-                handycon.logger.error(f"{err} | Error reading events from {handycon.keyboard_device.name}")
-                restore_device(handycon.keyboard_event, handycon.keyboard_path)
-                handycon.keyboard_device = None
-                handycon.keyboard_event = None
-                handycon.keyboard_path = None
-        else:
-            handycon.logger.info("Attempting to grab keyboard device...")
-            get_keyboard()
-            await asyncio.sleep(DETECT_DELAY)
-
-
-# Captures keyboard events and translates them to virtual device events.
-async def capture_keyboard_2_events():
-    global handycon
-
-    # Capture keyboard events and translate them to mapped events.
-    while handycon.running:
-        if handycon.keyboard_2_device:
-            try:
-                async for seed_event_2 in handycon.keyboard_2_device.async_read_loop():
-                    # Loop variables
-                    active_keys_2 = handycon.keyboard_2_device.active_keys()
-
-                    # Debugging variables
-                    handycon.logger.debug(f"Seed Value: {seed_event_2.value}, Seed Code: {seed_event_2.code}, Seed Type: {seed_event_2.type}.")
-                    if active_keys_2 != []:
-                        handycon.logger.debug(f"Active Keys: {active_keys_2}")
-                    else:
-                        handycon.logger.debug("No active keys")
-                    if handycon.event_queue != []:
-                        handycon.logger.debug(f"Queued events: {handycon.event_queue}")
-                    else:
-                        handycon.logger.debug("No active events.")
-
-                    # Capture keyboard events and translate them to mapped events.
-                    match handycon.system_type:
-                        case "ALY_GEN1":
-                           await ally_gen1.process_event(seed_event_2, active_keys_2)
-
-            except Exception as err:
-                handycon.logger.error(f"{err} | Error reading events from {handycon.keyboard_2_device.name}")
-                restore_device(handycon.keyboard_2_event, handycon.keyboard_2_path)
-                handycon.keyboard_2_device = None
-                handycon.keyboard_2_event = None
-                handycon.keyboard_2_path = None
-        else:
-            handycon.logger.info("Attempting to grab keyboard device 2...")
-            get_keyboard_2()
-            await asyncio.sleep(DETECT_DELAY)
-
-
 async def capture_controller_events():
     global handycon
 
     handycon.logger.debug(f"capture_controller_events, {handycon.running}")
     while handycon.running:
         if handycon.controller_device:
+            handycon.forwarding.set()
+            handycon.readiness.acquired("controller")
+            handycon.resume.acquired("controller")
             try:
                 async for event in handycon.controller_device.async_read_loop():
                     # Block FF events, or get infinite recursion. Up to you I guess...
                     if event.type in [e.EV_FF, e.EV_UINPUT]:
                         continue
+                    handycon.idle.touch()
+                    handycon.trace.record(trace.INPUT, trace.CONTROLLER, event.type, event.code, event.value)
+                    if handycon.resume.awaiting_input:
+                        handycon.resume.first_input("controller")
+
+                    # Stick and click events drive the mouse while mouse mode is on.
+                    if handycon.mouse and handycon.mouse.enabled and handycon.mouse.capture(event):
+                        continue
+
+                    # Apply the configured stick deadzones and response curves.
+                    # Gyro output is added to the shaped right stick.
+                    sink = handycon.fusion.sink if handycon.fusion else None
+                    if handycon.sticks is not None:
+                        if event.type == e.EV_ABS:
+                            event = handycon.sticks.process(event)
+                            if event is None:
+                                continue
+                        elif event.type == e.EV_SYN:
+                            for stick_event in handycon.sticks.flush(event):
+                                if sink is None or not sink.capture(stick_event):
+                                    write_event(stick_event)
+
+                    if sink is not None and sink.capture(event):
+                        continue
+
+                    # Apply the configured trigger curves and hair triggers.
+                    if handycon.triggers is not None and event.type == e.EV_ABS:
+                        event = handycon.triggers.process(event)
 
                     # Output the event.
                     await emit_events([event])
+                    if not handycon.startup.complete:
+                        handycon.finish_startup()
             except Exception as err:
                 handycon.logger.error(f"{err} | Error reading events from {handycon.controller_device.name}.")
-                restore_device(handycon.controller_event, handycon.controller_path)
-                handycon.controller_device = None
-                handycon.controller_event = None
-                handycon.controller_path = None
+                handycon.dump_trace()
+                handycon.resume.check()
+                release_controller()
         else:
             handycon.logger.info("Attempting to grab controller device...")
-            get_controller()
-            await asyncio.sleep(DETECT_DELAY)
+            marker = handycon.idle.device_marker()
+            if not get_controller():
+                await handycon.idle.wait_for_device(marker)
+
+
+# Drops a controller that can no longer be read and puts its node back.
+def release_controller():
+    global handycon
+
+    handycon.forwarding.clear()
+    handycon.readiness.lost("controller")
+    close_device(handycon.controller_device)
+    if handycon.controller_event:
+        restore_device(handycon.controller_event, handycon.controller_path)
+    handycon.controller_device = None
+    handycon.controller_event = None
+    handycon.controller_path = None
+
+
+def close_device(device):
+    if device is None:
+        return
+    try:
+        device.close()
+    except OSError:
+        pass
 
 
 # Captures power events and handles long or short press events.
@@ -319,38 +226,57 @@ async def capture_power_events():
 
     while handycon.running:
         if handycon.power_device:
+            handycon.readiness.acquired("power")
+            handycon.resume.acquired("power")
             try:
                 async for event in handycon.power_device.async_read_loop():
-                    handycon.logger.debug(f"Got event: {event.type} | {event.code} | {event.value}")
+                    handycon.idle.touch()
+                    handycon.trace.record(trace.INPUT, trace.POWER, event.type, event.code, event.value)
+                    if handycon.resume.awaiting_input:
+                        handycon.resume.first_input("power")
+                    handycon.logger.debug("Got event: %s | %s | %s", event.type, event.code, event.value)
                     if event.type == e.EV_KEY and event.code == 116: # KEY_POWER
                         if event.value == 0:
                             handle_power_action()
 
             except Exception as err:
                 handycon.logger.error(f"{err} | Error reading events from power device.")
+                handycon.resume.check()
+                close_device(handycon.power_device)
                 handycon.power_device = None
+                handycon.readiness.lost("power")
 
         elif handycon.power_device_2 and not handycon.power_device:
+            handycon.readiness.acquired("power")
+            handycon.resume.acquired("power")
             try:
                 async for event in handycon.power_device_2.async_read_loop():
-                    handycon.logger.debug(f"Got event: {event.type} | {event.code} | {event.value}")
+                    handycon.idle.touch()
+                    handycon.trace.record(trace.INPUT, trace.POWER, event.type, event.code, event.value)
+                    if handycon.resume.awaiting_input:
+                        handycon.resume.first_input("power")
+                    handycon.logger.debug("Got event: %s | %s | %s", event.type, event.code, event.value)
                     if event.type == e.EV_KEY and event.code == 116: # KEY_POWER
                         if event.value == 0:
                             handle_power_action()
 
             except Exception as err:
                 handycon.logger.error(f"{err} | Error reading events from power device.")
+                handycon.resume.check()
+                close_device(handycon.power_device_2)
                 handycon.power_device_2 = None
+                handycon.readiness.lost("power")
 
         else:
-            handycon.logger.info("Attempting to grab controller device...")
-            get_powerkey()
-            await asyncio.sleep(DETECT_DELAY)
+            handycon.logger.info("Attempting to grab power button...")
+            marker = handycon.idle.device_marker()
+            if not get_powerkey():
+                await handycon.idle.wait_for_device(marker)
 
 
 # Performs specific power actions based on user config.
 def handle_power_action():
-    handycon.logger.debug(f"Power Action: {handycon.power_action}")
+    handycon.logger.debug("Power Action: %s", handycon.power_action)
     match handycon.power_action:
         case "Suspend":
             # For DeckUI Sessions
@@ -377,8 +303,16 @@ async def capture_ff_events():
 
     async for event in handycon.ui_device.async_read_loop():
         if handycon.controller_device is None:
-            # Slow down the loop so we don't waste millions of cycles and overheat our controller.
-            await asyncio.sleep(.5)
+            # Refuse uploads right away so the game doesn't block waiting on
+            # a controller that isn't there. Everything else is dropped.
+            if event.type == e.EV_UINPUT and event.code == e.UI_FF_UPLOAD:
+                upload = handycon.ui_device.begin_upload(event.value)
+                upload.retval = -1
+                handycon.ui_device.end_upload(upload)
+            elif event.type == e.EV_UINPUT and event.code == e.UI_FF_ERASE:
+                erase = handycon.ui_device.begin_erase(event.value)
+                erase.retval = -1
+                handycon.ui_device.end_erase(erase)
             continue
 
         if event.type == e.EV_FF:
@@ -452,14 +386,27 @@ async def emit_events(events: list):
     global handycon
 
     for event in events:
-        handycon.logger.debug(f"Emitting event: {event}")
-        handycon.ui_device.write_event(event)
+        handycon.logger.debug("Emitting event: %s", event)
+        write_event(event)
         handycon.ui_device.syn()
         # Pause between multiple events, but not after the last one in the list.
         if event != events[len(events)-1]:
             await asyncio.sleep(handycon.BUTTON_DELAY)
 
 
+# Writes events to the virtual controller in one frame, without the delay
+# between them. Used for output not read from a device, like the gyro.
+def write_events(events: list):
+    for event in events:
+        write_event(event)
+    handycon.ui_device.syn()
+
+
+def write_event(event):
+    handycon.trace.record(trace.OUTPUT, trace.VIRTUAL, event.type, event.code, event.value)
+    handycon.ui_device.write_event(event)
+
+
 # Generates events from an event list. Can be called directly or when looping through
 # the event queue.
 async def emit_now(seed_event, event_list, value):
@@ -480,9 +427,11 @@ async def emit_now(seed_event, event_list, value):
                 handycon.logger.debug("Open Chimera")
                 handycon.launch_chimera()
             case "Toggle Gyro":
-                handycon.logger.debug("Toggle Gyro is not currently enabled")
+                handycon.logger.debug("Toggle Gyro")
+                toggle_gyro()
             case "Toggle Mouse Mode":
-                handycon.logger.debug("Toggle Mouse Mode is not currently enabled")
+                handycon.logger.debug("Toggle Mouse Mode")
+                toggle_mouse()
             case "Toggle Performance":
                 handycon.logger.debug("Toggle Performance")
                 await handycon.turbo.toggle()
@@ -492,7 +441,7 @@ async def emit_now(seed_event, event_list, value):
                 handycon.logger.warn(f"{event_list[0]} not defined.")
         return
 
-    handycon.logger.debug(f'Event list: {event_list}')
+    handycon.logger.debug('Event list: %s', event_list)
     events = []
 
     if value == 0:
@@ -508,8 +457,80 @@ async def emit_now(seed_event, event_list, value):
         await emit_events(events)
 
 
+# Builds a stand-in seed event for actions that fire from a timer rather than
+# from an input event.
+def timer_seed():
+    now = time.time()
+    sec = int(now)
+    return InputEvent(sec, int((now - sec) * 1000000), e.EV_SYN, e.SYN_REPORT, 0)
+
+
+# Presses or releases an event list from a chord timer callback.
+def fire_action(event_list, value):
+    return asyncio.ensure_future(emit_now(timer_seed(), event_list, value))
+
+
+# Presses and releases an event list from a chord timer callback.
+def tap_action(event_list):
+    async def tap():
+        seed = timer_seed()
+        await emit_now(seed, event_list, 1)
+        await emit_now(seed, event_list, 0)
+
+    return asyncio.ensure_future(tap())
+
+
+# Mouse mode is set up the first time it is needed. Returns None if its config
+# is invalid.
+def load_mouse():
+    global handycon
+
+    if handycon.mouse is None:
+        from . import mouse
+
+        try:
+            settings = handycon.compile_mouse(handycon.config)
+        except ValueError as err:
+            handycon.logger.error(f"{err} | Mouse mode is unavailable.")
+            return None
+        handycon.mouse = mouse.MouseMode(handycon, settings)
+    return handycon.mouse
+
+
+def toggle_mouse():
+    if load_mouse():
+        handycon.mouse.toggle()
+
+
+# Starts or stops the IMU and the fusion stage that consumes it.
+def toggle_gyro():
+    global handycon
+
+    if handycon.imu is None:
+        from . import fusion
+        from . import imu
+
+        try:
+            settings = handycon.compile_gyro(handycon.config)
+        except ValueError as err:
+            handycon.logger.error(f"{err} | Gyro is unavailable.")
+            return
+        handycon.fusion = fusion.FusionEngine(settings)
+        handycon.imu = imu.ImuSource(handycon, settings)
+        handycon.imu.listeners.append(handycon.fusion.consume)
+    if handycon.imu.enabled:
+        handycon.imu.stop()
+        handycon.fusion.stop()
+        return
+    handycon.fusion.start(handycon)
+    handycon.imu.start()
+    if not handycon.imu.enabled:
+        handycon.fusion.stop()
+
+
 async def handle_key_down(seed_event, queued_event):
     handycon.event_queue.append(queued_event)
+    trace_decision(trace.KEY_DOWN, queued_event)
     if queued_event in INSTANT_EVENTS:
         await handycon.emit_now(seed_event, queued_event, 1)
 
@@ -517,6 +538,7 @@ async def handle_key_down(seed_event, queued_event):
 async def handle_key_up(seed_event, queued_event):
     if queued_event in INSTANT_EVENTS:
         handycon.event_queue.remove(queued_event)
+        trace_decision(trace.KEY_UP, queued_event)
         await handycon.emit_now(seed_event, queued_event, 0)
     elif queued_event in QUEUED_EVENTS:
         # Create list of events to fire.
@@ -524,14 +546,29 @@ async def handle_key_up(seed_event, queued_event):
         if not handycon.last_button:
             handycon.event_queue.remove(queued_event)
             handycon.last_button = queued_event
+            trace_decision(trace.KEY_UP, queued_event)
             await handycon.emit_now(seed_event, queued_event, 1)
             return
 
         # Clean up old button presses.
         if handycon.last_button:
+            trace_decision(trace.KEY_UP, handycon.last_button)
             await handycon.emit_now(seed_event, handycon.last_button, 0)
             handycon.last_button = None
 
+    # A config swap held back for this chord can go through once the handler
+    # that released it is done.
+    if handycon.pending_config and not handycon.event_queue and not handycon.last_button:
+        asyncio.get_running_loop().call_soon(handycon.apply_pending_config)
+
+
+# Records which button slot a chord resolved to and the queue state after it.
+def trace_decision(action, queued_event):
+    if handycon.last_button:
+        action |= trace.LAST_BUTTON
+    handycon.trace.record(trace.DECISION, trace.KEYBOARD, action,
+            trace.button_slot(handycon.button_map, queued_event), len(handycon.event_queue))
+
 
 async def toggle_performance():
     global handycon
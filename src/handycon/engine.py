@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+# This file is part of Handheld Game Console Controller System (HandyGCCS)
+# Copyright 2022-2023 Derek J. Clark <derekjohn.clark@gmail.com>
+
+# Python Modules
+import asyncio
+import logging
+import os
+
+## Local modules
+from .constants import *
+
+# Event loop implementations. uvloop is optional and falls back to asyncio.
+ENGINES = ("asyncio", "uvloop")
+DEFAULT_ENGINE = "asyncio"
+
+logger = logging.getLogger(__name__)
+
+
+# The engine from the command line, then HANDYCON_LOOP, then the loop key of
+# the [Engine] config section, then the default.
+def resolve_engine(name=None, config_path=CONFIG_PATH) -> str:
+    if not name:
+        name = os.environ.get("HANDYCON_LOOP")
+    if not name:
+        import configparser
+        config = configparser.ConfigParser()
+        try:
+            config.read(config_path)
+        except configparser.Error:
+            pass
+        name = config.get("Engine", "loop", fallback=DEFAULT_ENGINE)
+    name = name.strip().lower()
+    if name not in ENGINES:
+        raise ValueError(f"Invalid event loop {name}. Expected one of {', '.join(ENGINES)}.")
+    return name
+
+
+# Returns a loop policy for an engine, or None if it isn't installed.
+def get_policy(name):
+    if name == "uvloop":
+        try:
+            import uvloop
+        except ImportError:
+            return None
+        return uvloop.EventLoopPolicy()
+    return asyncio.DefaultEventLoopPolicy()
+
+
+# Makes the engine the one asyncio creates loops with. Returns the engine
+# actually installed.
+def install(name) -> str:
+    policy = get_policy(name)
+    if policy is None:
+        logger.warning(f"Event loop {name} is not installed. Using {DEFAULT_ENGINE}.")
+        name = DEFAULT_ENGINE
+        policy = get_policy(name)
+    asyncio.set_event_loop_policy(policy)
+    logger.info(f"Using the {name} event loop.")
+    return name
+
+
+def available() -> list:
+    return [name for name in ENGINES if get_policy(name) is not None]
+
+
+# Runs a coroutine to completion on a fresh loop of the given engine.
+def run(coro, name):
+    loop = get_policy(name).new_event_loop()
+    asyncio.set_event_loop(loop)
+    try:
+        return loop.run_until_complete(coro)
+    finally:
+        asyncio.set_event_loop(None)
+        loop.close()
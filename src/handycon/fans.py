@@ -0,0 +1,215 @@
+#!/usr/bin/env python3
+# This file is part of Handheld Game Console Controller System (HandyGCCS)
+# Copyright 2022-2023 Derek J. Clark <derekjohn.clark@gmail.com>
+
+# Python Modules
+import asyncio
+import glob
+import os
+
+## Local modules
+from .governor import TEMP_SENSORS
+
+FAN_DEFAULTS = {
+    "enabled": False,
+    "interval": 2.0,
+    "smoothing": 0.6,
+    "hysteresis": 4.0,
+    "curve": "40:0, 55:30, 70:55, 80:80, 90:100",
+}
+# The oxp-platform driver exposes its fan through a hwmon device. pwm1_enable
+# is 1 for manual control and 0 to hand the fan back to the firmware curve.
+OXP_HWMON = "/sys/devices/platform/oxp-platform/hwmon/hwmon*"
+PWM_MANUAL = b"1"
+PWM_AUTO = b"0"
+PWM_MAX = 255
+
+
+# Parses "temp:percent, ..." into (temp, pwm) points sorted by temperature.
+def parse_curve(text) -> list:
+    points = []
+    for point in text.split(","):
+        if not point.strip():
+            continue
+        try:
+            temp, percent = (float(value) for value in point.split(":"))
+        except ValueError:
+            raise ValueError(f"Invalid fan curve point '{point.strip()}'. Expected temp:percent.")
+        if not 0 <= percent <= 100:
+            raise ValueError(f"Fan curve speed {percent:g}% is out of range.")
+        points.append((temp, round(percent * PWM_MAX / 100)))
+    if not points:
+        raise ValueError("Fan curve has no points.")
+    points.sort()
+    if any(a[0] == b[0] for a, b in zip(points, points[1:])):
+        raise ValueError("Fan curve has two points at the same temperature.")
+    return points
+
+
+# PWM for a temperature, interpolating between curve points.
+def curve_pwm(curve, temp) -> int:
+    if temp <= curve[0][0]:
+        return curve[0][1]
+    for (low_temp, low_pwm), (high_temp, high_pwm) in zip(curve, curve[1:]):
+        if temp <= high_temp:
+            return round(low_pwm + (high_pwm - low_pwm) * (temp - low_temp) / (high_temp - low_temp))
+    return curve[-1][1]
+
+
+class FanController:
+    """Drives the oxp-platform fan from a temperature curve.
+
+    The curve follows the turbo speed when a curve_<speed> key is set for it.
+    Temperature is smoothed, and the fan only slows once the temperature has
+    dropped hysteresis degrees below the point that sped it up.
+
+    root is prepended to every path so a stand-in hwmon tree can be used."""
+
+    def __init__(self, handycon, settings: dict, root="/"):
+        self.handycon = handycon
+        self.root = root
+        self.task = None
+        self.temp_fd = None
+        self.pwm_fd = None
+        self.enable_fd = None
+        self.temp = None
+        self.pwm = None
+        self.update(settings)
+
+    def update(self, settings: dict):
+        self.settings = settings
+
+    def path(self, path) -> str:
+        return os.path.join(self.root, path.lstrip("/"))
+
+    # Returns False when there is no oxp-platform fan to control.
+    def open(self) -> bool:
+        fans = sorted(glob.glob(self.path(OXP_HWMON)))
+        if not fans:
+            return False
+        for hwmon in sorted(glob.glob(self.path("/sys/class/hwmon/hwmon*"))):
+            try:
+                with open(os.path.join(hwmon, "name"), "r") as f:
+                    name = f.read().strip()
+            except OSError:
+                continue
+            if name in TEMP_SENSORS:
+                self.temp_fd = os.open(os.path.join(hwmon, "temp1_input"), os.O_RDONLY)
+                break
+        if self.temp_fd is None:
+            return False
+        self.enable_fd = os.open(os.path.join(fans[0], "pwm1_enable"), os.O_RDWR)
+        self.pwm_fd = os.open(os.path.join(fans[0], "pwm1"), os.O_RDWR)
+        os.pwrite(self.enable_fd, PWM_MANUAL, 0)
+        return True
+
+    def close(self):
+        if self.enable_fd is not None:
+            try:
+                os.pwrite(self.enable_fd, PWM_AUTO, 0)
+            except OSError as err:
+                self.handycon.logger.error(f"{err} | Unable to return the fan to firmware control.")
+        for name in ("temp_fd", "pwm_fd", "enable_fd"):
+            fd = getattr(self, name)
+            if fd is not None:
+                os.close(fd)
+                setattr(self, name, None)
+        self.temp = None
+        self.pwm = None
+
+    def start(self):
+        if self.task is not None:
+            return
+        try:
+            found = self.open()
+        except OSError as err:
+            self.handycon.logger.error(f"{err} | Unable to take control of the fan.")
+            self.close()
+            return
+        if not found:
+            self.handycon.logger.warn("Fan curves are enabled but no oxp-platform fan was found.")
+            self.close()
+            return
+        self.task = asyncio.ensure_future(self.run())
+        self.handycon.logger.info("Fan curve control enabled.")
+
+    def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            self.task = None
+            self.close()
+            self.handycon.logger.info("Fan returned to firmware control.")
+
+    # The curve for the current turbo speed, or the default curve.
+    def curve(self) -> list:
+        turbo = self.handycon.turbo
+        if turbo is not None and turbo.speeds:
+            curve = self.settings["curves"].get(turbo.speeds[turbo.current])
+            if curve:
+                return curve
+        return self.settings["curve"]
+
+    # Returns the PWM for one temperature sample.
+    def decide(self, temp) -> int:
+        settings = self.settings
+        if self.temp is None:
+            self.temp = temp
+        else:
+            self.temp = settings["smoothing"] * self.temp + (1 - settings["smoothing"]) * temp
+        curve = self.curve()
+        target = curve_pwm(curve, self.temp)
+        if self.pwm is not None and target < self.pwm:
+            # Only slow down to what the curve gives hysteresis degrees higher.
+            target = min(self.pwm, curve_pwm(curve, self.temp + settings["hysteresis"]))
+        return target
+
+    def step(self):
+        temp = int(os.pread(self.temp_fd, 32, 0)) / 1000
+        target = self.decide(temp)
+        if target != self.pwm:
+            os.pwrite(self.pwm_fd, str(target).encode(), 0)
+            self.pwm = target
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        deadline = loop.time()
+        while True:
+            try:
+                self.step()
+            except (OSError, ValueError) as err:
+                self.handycon.logger.error(f"{err} | Fan update failed.")
+
+            deadline += self.settings["interval"]
+            delay = deadline - loop.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            else:
+                deadline = loop.time()
+
+
+# Reads and validates the [Fans] config section.
+def compile_fans(section) -> dict:
+    settings = {}
+    try:
+        settings["enabled"] = section.getboolean("enabled", FAN_DEFAULTS["enabled"])
+        for key in ("interval", "smoothing", "hysteresis"):
+            settings[key] = section.getfloat(key, FAN_DEFAULTS[key])
+    except ValueError as err:
+        raise ValueError(f"Invalid value in [Fans]: {err}")
+    settings["curve"] = parse_curve(section.get("curve", FAN_DEFAULTS["curve"]))
+    settings["curves"] = {
+        key[len("curve_"):]: parse_curve(value)
+        for key, value in section.items() if key.startswith("curve_")
+    }
+
+    if settings["interval"] <= 0:
+        raise ValueError("Fan interval must be greater than 0.")
+    if not 0.0 <= settings["smoothing"] < 1.0:
+        raise ValueError("Fan smoothing must be between 0 and 1.")
+    if settings["hysteresis"] < 0:
+        raise ValueError("Fan hysteresis must not be negative.")
+    return settings
+
+
+def get_default_config() -> dict:
+    return dict(FAN_DEFAULTS)
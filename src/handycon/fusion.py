@@ -0,0 +1,335 @@
+#!/usr/bin/env python3
+# This file is part of Handheld Game Console Controller System (HandyGCCS)
+# Copyright 2022-2023 Derek J. Clark <derekjohn.clark@gmail.com>
+
+# Python Modules
+import math
+
+## Local modules
+from .constants import *
+
+## Partial imports
+from evdev import ecodes as e, InputEvent
+
+GRAVITY = 9.80665
+FUSION_FILTERS = ("complementary", "madgwick")
+FUSION_SPACES = ("local", "world", "player")
+FUSION_OUTPUTS = ("stick", "mouse")
+FUSION_AXES = ("x", "y", "z", "-x", "-y", "-z")
+FUSION_DEFAULTS = {
+    "filter": "complementary",
+    "space": "player",
+    "output": "stick",
+    "yaw_axis": "y",
+    "pitch_axis": "x",
+    "sensitivity": 1.0,
+    "stick_full_scale": 360.0,
+    "mouse_pixels_per_degree": 20.0,
+    "complementary_alpha": 0.02,
+    "madgwick_beta": 0.05,
+    "calibrate": True,
+    "still_threshold": 0.05,
+    "still_time": 0.5,
+}
+SAMPLE_CHANNELS = ("anglvel_x", "anglvel_y", "anglvel_z", "accel_x", "accel_y", "accel_z", "timestamp")
+PLAYER_SPACE_RELAX = 1.41
+
+
+def axis_index(axis) -> tuple:
+    return "xyz".index(axis[-1]), -1.0 if axis.startswith("-") else 1.0
+
+
+class FusionEngine:
+    """Turns batches of IMU samples into yaw and pitch motion.
+
+    All filter state is preallocated and updated in place. A batch produces a
+    single output so output cost does not scale with the sampling rate."""
+
+    def __init__(self, settings: dict, sink=None):
+        self.sink = sink
+        self.cursor = 0
+        self.positions = None
+        self.reader = None
+        self.bias = [0.0, 0.0, 0.0]
+        # Reused for every sample of every batch.
+        self.gyro = [0.0, 0.0, 0.0]
+        self.accel = [0.0, 0.0, 0.0]
+        self.rotated = [0.0, 0.0, 0.0]
+        self.update(settings)
+        self.reset()
+
+    def update(self, settings: dict):
+        self.settings = settings
+        self.period = 1.0 / settings.get("rate", 1000)
+        self.yaw = axis_index(settings["yaw_axis"])
+        self.pitch = axis_index(settings["pitch_axis"])
+
+    def start(self, handycon):
+        self.reset()
+        self.reader = None
+        self.sink = make_sink(handycon, self.settings)
+
+    def stop(self):
+        if self.sink:
+            self.sink.release()
+        self.sink = None
+
+    def reset(self):
+        self.quaternion = [1.0, 0.0, 0.0, 0.0]
+        self.gravity = [0.0, 0.0, 1.0]
+        self.still_time = 0.0
+        self.last_time = None
+        self.samples = 0
+
+    # ImuSource listener. Reads every sample since the last call as one batch.
+    def consume(self, reader):
+        if reader is not self.reader:
+            self.reader = reader
+            self.cursor = 0
+            names = [channel.name for channel in reader.channels]
+            self.positions = [names.index(name) if name in names else None for name in SAMPLE_CHANNELS]
+        ring = reader.ring
+        first, self.cursor = ring.unread(self.cursor)
+        if first < self.cursor:
+            self.process(ring.data, ring.capacity, ring.width, first, self.cursor)
+
+    # Reads samples first to end straight out of the ring's data.
+    def process(self, data, capacity, width, first, end):
+        gx_i, gy_i, gz_i, ax_i, ay_i, az_i, t_i = self.positions
+        gyro = self.gyro
+        accel = self.accel
+        settings = self.settings
+        bias = self.bias
+        calibrate = settings["calibrate"]
+        still_threshold = settings["still_threshold"]
+        madgwick = settings["filter"] == "madgwick"
+        yaw_total = 0.0
+        pitch_total = 0.0
+        elapsed = 0.0
+
+        for sample in range(first, end):
+            row = (sample % capacity) * width
+            if t_i is not None:
+                stamp = data[row + t_i]
+                dt = stamp - self.last_time if self.last_time is not None else self.period
+                self.last_time = stamp
+                if not 0.0 < dt < 0.1:
+                    dt = self.period
+            else:
+                dt = self.period
+
+            gyro[0] = data[row + gx_i]
+            gyro[1] = data[row + gy_i]
+            gyro[2] = data[row + gz_i]
+            accel[0] = data[row + ax_i]
+            accel[1] = data[row + ay_i]
+            accel[2] = data[row + az_i]
+
+            # Learn the gyro bias while the device is at rest.
+            if calibrate:
+                drift = math.sqrt((gyro[0] - bias[0]) ** 2 + (gyro[1] - bias[1]) ** 2 + (gyro[2] - bias[2]) ** 2)
+                accel_norm = math.sqrt(accel[0] ** 2 + accel[1] ** 2 + accel[2] ** 2)
+                if drift < still_threshold and abs(accel_norm - GRAVITY) < 0.5:
+                    self.still_time += dt
+                    if self.still_time >= settings["still_time"]:
+                        for axis in range(3):
+                            bias[axis] += (gyro[axis] - bias[axis]) * 0.01
+                else:
+                    self.still_time = 0.0
+            for axis in range(3):
+                gyro[axis] -= bias[axis]
+
+            if madgwick:
+                self.madgwick_step(gyro, accel, dt)
+            else:
+                self.complementary_step(gyro, accel, dt)
+
+            yaw_rate, pitch_rate = self.space_rates(gyro)
+            yaw_total += yaw_rate * dt
+            pitch_total += pitch_rate * dt
+            elapsed += dt
+
+        self.samples += end - first
+        if self.sink and elapsed > 0.0:
+            self.sink(yaw_total, pitch_total, elapsed)
+
+    # Rotates the gravity estimate with the gyro and pulls it toward the
+    # measured acceleration.
+    def complementary_step(self, gyro, accel, dt):
+        g = self.gravity
+        rotated = self.rotated
+        rotated[0] = g[0] + (g[1] * gyro[2] - g[2] * gyro[1]) * dt
+        rotated[1] = g[1] + (g[2] * gyro[0] - g[0] * gyro[2]) * dt
+        rotated[2] = g[2] + (g[0] * gyro[1] - g[1] * gyro[0]) * dt
+        norm = math.sqrt(accel[0] ** 2 + accel[1] ** 2 + accel[2] ** 2)
+        if norm > 0.0:
+            alpha = self.settings["complementary_alpha"]
+            for axis in range(3):
+                rotated[axis] += (accel[axis] / norm - rotated[axis]) * alpha
+        norm = math.sqrt(rotated[0] ** 2 + rotated[1] ** 2 + rotated[2] ** 2) or 1.0
+        for axis in range(3):
+            g[axis] = rotated[axis] / norm
+
+    # Madgwick's IMU orientation filter (gyro and accelerometer, no magnetometer).
+    def madgwick_step(self, gyro, accel, dt):
+        q0, q1, q2, q3 = self.quaternion
+        gx, gy, gz = gyro
+        ax, ay, az = accel
+        beta = self.settings["madgwick_beta"]
+
+        dq0 = 0.5 * (-q1 * gx - q2 * gy - q3 * gz)
+        dq1 = 0.5 * (q0 * gx + q2 * gz - q3 * gy)
+        dq2 = 0.5 * (q0 * gy - q1 * gz + q3 * gx)
+        dq3 = 0.5 * (q0 * gz + q1 * gy - q2 * gx)
+
+        norm = math.sqrt(ax * ax + ay * ay + az * az)
+        if norm > 0.0:
+            ax /= norm
+            ay /= norm
+            az /= norm
+            f0 = 2.0 * (q1 * q3 - q0 * q2) - ax
+            f1 = 2.0 * (q0 * q1 + q2 * q3) - ay
+            f2 = 1.0 - 2.0 * (q1 * q1 + q2 * q2) - az
+            s0 = -2.0 * q2 * f0 + 2.0 * q1 * f1
+            s1 = 2.0 * q3 * f0 + 2.0 * q0 * f1 - 4.0 * q1 * f2
+            s2 = -2.0 * q0 * f0 + 2.0 * q3 * f1 - 4.0 * q2 * f2
+            s3 = 2.0 * q1 * f0 + 2.0 * q2 * f1
+            norm = math.sqrt(s0 * s0 + s1 * s1 + s2 * s2 + s3 * s3)
+            if norm > 0.0:
+                dq0 -= beta * s0 / norm
+                dq1 -= beta * s1 / norm
+                dq2 -= beta * s2 / norm
+                dq3 -= beta * s3 / norm
+
+        q0 += dq0 * dt
+        q1 += dq1 * dt
+        q2 += dq2 * dt
+        q3 += dq3 * dt
+        norm = math.sqrt(q0 * q0 + q1 * q1 + q2 * q2 + q3 * q3) or 1.0
+        q = self.quaternion
+        q[0], q[1], q[2], q[3] = q0 / norm, q1 / norm, q2 / norm, q3 / norm
+
+        # Gravity direction in the sensor frame.
+        g = self.gravity
+        g[0] = 2.0 * (q[1] * q[3] - q[0] * q[2])
+        g[1] = 2.0 * (q[0] * q[1] + q[2] * q[3])
+        g[2] = q[0] * q[0] - q[1] * q[1] - q[2] * q[2] + q[3] * q[3]
+
+    # Returns the yaw and pitch rates for the configured space.
+    def space_rates(self, gyro) -> tuple:
+        yaw_axis, yaw_sign = self.yaw
+        pitch_axis, pitch_sign = self.pitch
+        local_yaw = gyro[yaw_axis] * yaw_sign
+        pitch_rate = gyro[pitch_axis] * pitch_sign
+        space = self.settings["space"]
+        if space == "local":
+            return local_yaw, pitch_rate
+
+        # Yaw around the gravity vector, independent of how the device is held.
+        g = self.gravity
+        world_yaw = (gyro[0] * g[0] + gyro[1] * g[1] + gyro[2] * g[2]) * yaw_sign
+        if space == "world":
+            return world_yaw, pitch_rate
+
+        # Player space relaxes world yaw toward the local axes so turning the
+        # device or leaning it both turn the view.
+        roll_axis = 3 - yaw_axis - pitch_axis
+        local_magnitude = math.hypot(gyro[yaw_axis], gyro[roll_axis])
+        return math.copysign(min(abs(world_yaw) * PLAYER_SPACE_RELAX, local_magnitude), world_yaw), pitch_rate
+
+
+class StickSink:
+    """Adds gyro motion to the right stick of the virtual controller."""
+
+    def __init__(self, handycon, settings: dict):
+        self.handycon = handycon
+        self.settings = settings
+        self.base_x = 0
+        self.base_y = 0
+        self.gyro_x = 0.0
+        self.gyro_y = 0.0
+
+    # Real stick movement is combined with the gyro rather than replaced. The
+    # events arrive after the stick deadzones and curves were applied.
+    def capture(self, event) -> bool:
+        if event.type != e.EV_ABS or event.code not in (e.ABS_RX, e.ABS_RY):
+            return False
+        if event.code == e.ABS_RX:
+            self.base_x = event.value
+        else:
+            self.base_y = event.value
+        self.write()
+        return True
+
+    def __call__(self, yaw, pitch, elapsed):
+        scale = self.settings["sensitivity"] * JOY_MAX / math.radians(self.settings["stick_full_scale"]) / elapsed
+        self.gyro_x = -yaw * scale
+        self.gyro_y = -pitch * scale
+        self.write()
+
+    def write(self):
+        x = max(JOY_MIN, min(JOY_MAX, round(self.base_x + self.gyro_x)))
+        y = max(JOY_MIN, min(JOY_MAX, round(self.base_y + self.gyro_y)))
+        self.handycon.write_events([
+            InputEvent(0, 0, e.EV_ABS, e.ABS_RX, x),
+            InputEvent(0, 0, e.EV_ABS, e.ABS_RY, y),
+        ])
+
+    def release(self):
+        self.gyro_x = self.gyro_y = 0.0
+        self.write()
+
+
+class MouseSink:
+    """Moves the virtual mouse by the gyro rotation of each batch."""
+
+    def __init__(self, handycon, settings: dict):
+        self.handycon = handycon
+        self.settings = settings
+        handycon.mouse.ensure_device()
+
+    def capture(self, event) -> bool:
+        return False
+
+    def __call__(self, yaw, pitch, elapsed):
+        scale = self.settings["sensitivity"] * self.settings["mouse_pixels_per_degree"]
+        self.handycon.mouse.move_by(-math.degrees(yaw) * scale, -math.degrees(pitch) * scale)
+
+    def release(self):
+        pass
+
+
+# Falls back to the stick if mouse mode can't be set up.
+def make_sink(handycon, settings: dict):
+    if settings["output"] == "mouse" and handycon.load_mouse():
+        return MouseSink(handycon, settings)
+    return StickSink(handycon, settings)
+
+
+# Reads and validates the fusion options of the [Gyro] config section.
+def compile_fusion(section) -> dict:
+    settings = {}
+    try:
+        for key, default in FUSION_DEFAULTS.items():
+            if isinstance(default, bool):
+                settings[key] = section.getboolean(key, default)
+            elif isinstance(default, float):
+                settings[key] = section.getfloat(key, default)
+            else:
+                settings[key] = section.get(key, default)
+    except ValueError as err:
+        raise ValueError(f"Invalid value in [Gyro]: {err}")
+
+    for key, choices in (("filter", FUSION_FILTERS), ("space", FUSION_SPACES), ("output", FUSION_OUTPUTS),
+                         ("yaw_axis", FUSION_AXES), ("pitch_axis", FUSION_AXES)):
+        if settings[key] not in choices:
+            raise ValueError(f"Gyro {key} must be one of {', '.join(choices)}.")
+    if settings["yaw_axis"][-1] == settings["pitch_axis"][-1]:
+        raise ValueError("Gyro yaw_axis and pitch_axis must differ.")
+    if settings["stick_full_scale"] <= 0.0:
+        raise ValueError("Gyro stick_full_scale must be greater than 0.")
+    return settings
+
+
+def get_default_config() -> dict:
+    return dict(FUSION_DEFAULTS)
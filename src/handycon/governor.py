@@ -0,0 +1,282 @@
+#!/usr/bin/env python3
+# This file is part of Handheld Game Console Controller System (HandyGCCS)
+# Copyright 2022-2023 Derek J. Clark <derekjohn.clark@gmail.com>
+
+# Python Modules
+import asyncio
+import glob
+import os
+import time
+
+GOVERNOR_DEFAULTS = {
+    "enabled": False,
+    "interval": 2.0,
+    "smoothing": 0.5,
+    "up_threshold": 75.0,
+    "down_threshold": 35.0,
+    "up_hold": 4.0,
+    "down_hold": 20.0,
+    "min_interval": 10.0,
+    "temp_limit": 90.0,
+    "temp_release": 80.0,
+    "battery_ceiling": "",
+    "ac_ceiling": "",
+    "override": 300.0,
+}
+TEMP_SENSORS = ("k10temp", "zenpower", "coretemp")
+
+
+class LoadSampler:
+    """Reads CPU load, GPU load, temperature and power source from files it
+    keeps open, so each sample costs one pread per file.
+
+    root is prepended to every path so a fake procfs/sysfs tree can be used."""
+
+    def __init__(self, root="/"):
+        self.root = root
+        self.stat_fd = None
+        self.gpu_fd = None
+        self.temp_fd = None
+        self.ac_fd = None
+        self.last_busy = 0
+        self.last_total = 0
+
+    def path(self, path) -> str:
+        return os.path.join(self.root, path.lstrip("/"))
+
+    def read_name(self, path) -> str:
+        try:
+            with open(path, "r") as f:
+                return f.read().strip()
+        except OSError:
+            return ""
+
+    def open_first(self, paths):
+        for path in paths:
+            try:
+                return os.open(path, os.O_RDONLY)
+            except OSError:
+                continue
+        return None
+
+    def open(self):
+        self.stat_fd = os.open(self.path("/proc/stat"), os.O_RDONLY)
+        self.gpu_fd = self.open_first(sorted(glob.glob(self.path("/sys/class/drm/card*/device/gpu_busy_percent"))))
+        hwmons = sorted(glob.glob(self.path("/sys/class/hwmon/hwmon*")))
+        self.temp_fd = self.open_first(
+            os.path.join(hwmon, "temp1_input") for hwmon in hwmons
+            if self.read_name(os.path.join(hwmon, "name")) in TEMP_SENSORS)
+        supplies = sorted(glob.glob(self.path("/sys/class/power_supply/*")))
+        self.ac_fd = self.open_first(
+            os.path.join(supply, "online") for supply in supplies
+            if self.read_name(os.path.join(supply, "type")) == "Mains")
+        self.cpu_load()
+
+    def close(self):
+        for name in ("stat_fd", "gpu_fd", "temp_fd", "ac_fd"):
+            fd = getattr(self, name)
+            if fd is not None:
+                os.close(fd)
+                setattr(self, name, None)
+
+    def read_int(self, fd) -> int | None:
+        if fd is None:
+            return None
+        try:
+            return int(os.pread(fd, 32, 0))
+        except (OSError, ValueError):
+            return None
+
+    # Busy share of all CPU time since the previous call, from the aggregate
+    # line of /proc/stat.
+    def cpu_load(self) -> float:
+        line = os.pread(self.stat_fd, 256, 0).split(b"\n", 1)[0]
+        fields = [int(field) for field in line.split()[1:9]]
+        total = sum(fields)
+        busy = total - fields[3] - (fields[4] if len(fields) > 4 else 0)
+        delta_total = total - self.last_total
+        delta_busy = busy - self.last_busy
+        self.last_total = total
+        self.last_busy = busy
+        if delta_total <= 0:
+            return 0.0
+        return 100.0 * delta_busy / delta_total
+
+    # Returns (cpu %, gpu %, temperature in C or None, on battery).
+    def sample(self) -> tuple:
+        gpu = self.read_int(self.gpu_fd)
+        temp = self.read_int(self.temp_fd)
+        online = self.read_int(self.ac_fd)
+        return (
+            self.cpu_load(),
+            float(gpu) if gpu is not None else 0.0,
+            temp / 1000 if temp is not None else None,
+            online == 0,
+        )
+
+
+class Governor:
+    """Steps through the turbo speeds automatically from system load.
+
+    Load has to stay past a threshold for a hold time before the speed moves
+    by one step, and speeds never change more often than min_interval, so
+    bursty game loads don't thrash the speed commands."""
+
+    def __init__(self, handycon, settings: dict, sampler=None):
+        self.handycon = handycon
+        self.sampler = sampler or LoadSampler()
+        self.task = None
+        self.awake = asyncio.Event()
+        self.awake.set()
+        self.load = None
+        self.hot = False
+        self.above_since = None
+        self.below_since = None
+        self.last_change = float("-inf")
+        self.changes = 0
+        self.update(settings)
+
+    def update(self, settings: dict):
+        self.settings = settings
+
+    def start(self):
+        if self.task is None:
+            try:
+                self.sampler.open()
+            except OSError as err:
+                self.handycon.logger.error(f"{err} | Unable to read system load. Turbo governor disabled.")
+                return
+            self.task = asyncio.ensure_future(self.run())
+            self.handycon.logger.info("Turbo governor enabled.")
+
+    def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            self.task = None
+            self.sampler.close()
+            self.handycon.logger.info("Turbo governor disabled.")
+
+    # Sampling pauses while the handheld is idle.
+    def pause(self):
+        self.awake.clear()
+
+    def resume(self):
+        self.awake.set()
+
+    # Highest speed index allowed on the current power source.
+    def ceiling(self, speeds, on_battery) -> int:
+        key = self.settings["battery_ceiling" if on_battery else "ac_ceiling"]
+        if key in speeds:
+            return speeds.index(key)
+        return len(speeds) - 1
+
+    # Picks the next speed index from one sample. Returns None to stay put.
+    def decide(self, now, current, speeds, cpu, gpu, temp, on_battery) -> int | None:
+        settings = self.settings
+        load = max(cpu, gpu)
+        if self.load is None:
+            self.load = load
+        else:
+            self.load = settings["smoothing"] * self.load + (1 - settings["smoothing"]) * load
+
+        if temp is not None:
+            if temp >= settings["temp_limit"]:
+                self.hot = True
+            elif temp <= settings["temp_release"]:
+                self.hot = False
+
+        ceiling = self.ceiling(speeds, on_battery)
+        target = current
+        if current > ceiling:
+            target = ceiling
+        elif self.hot:
+            target = max(current - 1, 0)
+        elif self.load >= settings["up_threshold"]:
+            self.below_since = None
+            if self.above_since is None:
+                self.above_since = now
+            if now - self.above_since >= settings["up_hold"]:
+                target = min(current + 1, ceiling)
+        elif self.load <= settings["down_threshold"]:
+            self.above_since = None
+            if self.below_since is None:
+                self.below_since = now
+            if now - self.below_since >= settings["down_hold"]:
+                target = max(current - 1, 0)
+        else:
+            self.above_since = None
+            self.below_since = None
+
+        if target == current or now - self.last_change < settings["min_interval"]:
+            return None
+        self.last_change = now
+        self.above_since = None
+        self.below_since = None
+        self.changes += 1
+        return target
+
+    # Takes one sample and returns the speed index to switch to, or None.
+    def step(self, now) -> int | None:
+        turbo = self.handycon.turbo
+        if not turbo.speeds:
+            return None
+        # A manual toggle holds the governor off for a while.
+        if now - turbo.manual_at < self.settings["override"]:
+            return None
+        cpu, gpu, temp, on_battery = self.sampler.sample()
+        return self.decide(now, turbo.current, turbo.speeds, cpu, gpu, temp, on_battery)
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        deadline = loop.time()
+        while True:
+            if not self.awake.is_set():
+                await self.awake.wait()
+                deadline = loop.time()
+                # Forget the load seen before the pause.
+                self.sampler.cpu_load()
+                self.load = None
+
+            target = self.step(time.monotonic())
+            if target is not None:
+                speed = self.handycon.turbo.speeds[target]
+                self.handycon.logger.info(f"Governor switching to turbo speed {speed} at {self.load:.0f}% load.")
+                try:
+                    await self.handycon.turbo.set_speed(target, feedback=False)
+                except Exception as err:
+                    self.handycon.logger.error(f"{err} | Governor failed to apply turbo speed {speed}.")
+
+            deadline += self.settings["interval"]
+            delay = deadline - loop.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            else:
+                deadline = loop.time()
+
+
+# Reads and validates the [Governor] config section.
+def compile_governor(section) -> dict:
+    settings = {}
+    try:
+        settings["enabled"] = section.getboolean("enabled", GOVERNOR_DEFAULTS["enabled"])
+        for key, default in GOVERNOR_DEFAULTS.items():
+            if isinstance(default, float):
+                settings[key] = section.getfloat(key, default)
+    except ValueError as err:
+        raise ValueError(f"Invalid value in [Governor]: {err}")
+    for key in ("battery_ceiling", "ac_ceiling"):
+        settings[key] = section.get(key, GOVERNOR_DEFAULTS[key]).strip()
+
+    if settings["interval"] <= 0:
+        raise ValueError("Governor interval must be greater than 0.")
+    if not 0.0 <= settings["smoothing"] < 1.0:
+        raise ValueError("Governor smoothing must be between 0 and 1.")
+    if settings["down_threshold"] >= settings["up_threshold"]:
+        raise ValueError("Governor down_threshold must be below up_threshold.")
+    if settings["temp_release"] > settings["temp_limit"]:
+        raise ValueError("Governor temp_release must not be above temp_limit.")
+    return settings
+
+
+def get_default_config() -> dict:
+    return dict(GOVERNOR_DEFAULTS)
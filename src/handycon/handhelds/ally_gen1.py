@@ -20,8 +20,9 @@ def init_handheld(handheld_controller):
     handycon.GAMEPAD_NAME = 'Microsoft X-Box 360 pad'
     handycon.KEYBOARD_ADDRESS = 'usb-0000:0a:00.3-3/input0'
     handycon.KEYBOARD_NAME = 'Asus Keyboard'
-    handycon.KEYBOARD_2_ADDRESS = 'usb-0000:0a:00.3-3/input2'
-    handycon.KEYBOARD_2_NAME = 'Asus Keyboard'
+
+    # The paddle combos and Control Center long press report on a second interface.
+    handycon.add_keyboard("keyboard_2", 'Asus Keyboard', 'usb-0000:0a:00.3-3/input2')
 
 
 # Captures keyboard events and translates them to virtual device events.
@@ -63,10 +64,10 @@ async def process_event(seed_event, active_keys):
         this_button = button2
 
     # BUTTON 3 (Default: ESC) Paddle + X Temp disabled, goes nuts.
-    # This event triggers from KEYBOARD_2.
+    # This event triggers from keyboard_2.
     if active_keys == [25, 125] and button_on == 1 and button3 not in handycon.event_queue:
         handycon.event_queue.append(button3)
-    elif active_keys == [] and seed_event.code in [49, 125, 185] and button_on == 0 and button3 in handycon.event_queue:
+    elif active_keys == [] and seed_event.code in [25, 125, 185] and button_on == 0 and button3 in handycon.event_queue:
         this_button = button3
 
     # BUTTON 4 (Default: OSK) Paddle + D-Pad UP
@@ -97,7 +98,7 @@ async def process_event(seed_event, active_keys):
         this_button = button7
 
     # BUTTON 8 (Default: Mode) Control Center Long Press.
-    # This event triggers from KEYBOARD_2.
+    # This event triggers from keyboard_2.
     if active_keys == [29, 56, 111] and button_on == 1 and button8 not in handycon.event_queue:
         handycon.event_queue.append(button8)
         await handycon.do_rumble(0, 150, 1000, 0)
@@ -105,31 +106,31 @@ async def process_event(seed_event, active_keys):
         this_button = button8
 
     # BUTTON 9 (Default: Toggle Mouse) Paddle + D-Pad DOWN
-    # This event triggers from KEYBOARD_2.
+    # This event triggers from keyboard_2.
     if active_keys == [1, 29, 42] and button_on == 1 and button9 not in handycon.event_queue:
         handycon.event_queue.append(button9)
     elif active_keys == [] and seed_event.code in [1, 29, 42, 185] and button_on == 0 and button9 in handycon.event_queue:
         this_button = button9
 
     # BUTTON 10 (Default: ALT+TAB) Paddle + D-Pad LEFT
-    # This event triggers from KEYBOARD_2.
+    # This event triggers from keyboard_2.
     if active_keys == [32, 125] and button_on == 1 and button10 not in handycon.event_queue:
         handycon.event_queue.append(button10)
     elif active_keys == [] and seed_event.code in [32, 125, 185] and button_on == 0 and button10 in handycon.event_queue:
         this_button = button10
 
     # BUTTON 11 (Default: KILL) Paddle + D-Pad RIGHT
-    # This event triggers from KEYBOARD_2.
+    # This event triggers from keyboard_2.
     if active_keys == [15, 125] and button_on == 1 and button11 not in handycon.event_queue:
         handycon.event_queue.append(button11)
     elif active_keys == [] and seed_event.code in [15, 125, 185] and button_on == 0 and button11 in handycon.event_queue:
         this_button = button11
 
     # BUTTON 12 (Default: Toggle Gyro) Paddle + B
-    # This event triggers from KEYBOARD_2.
+    # This event triggers from keyboard_2.
     if active_keys == [49, 125] and button_on == 1 and button12 not in handycon.event_queue:
         handycon.event_queue.append(button12)
-    elif active_keys == [] and seed_event.code in [25, 125, 185] and button_on == 0 and button12 in handycon.event_queue:
+    elif active_keys == [] and seed_event.code in [49, 125, 185] and button_on == 0 and button12 in handycon.event_queue:
         this_button = button12
 
     # Create list of events to fire.
@@ -148,12 +149,18 @@ def get_powersave_config() -> list[str]:
     # Get the default powersave setting for this device.
     return [
         "ryzenadj --power-saving",
-        "echo 0 > /sys/devices/platform/asus-nb-wmi/throttle_thermal_policy",
     ]
 
 def get_performance_config() -> list[str]:
     # Get the default performance setting for this device.
     return [
         "ryzenadj --max-performance",
-        "echo 1 > /sys/devices/platform/asus-nb-wmi/throttle_thermal_policy",
     ]
+
+def get_powersave_knobs() -> dict:
+    # Balanced firmware policy, with the cores asking for efficiency.
+    return {"thermal_policy": 0, "epp": "power"}
+
+def get_performance_knobs() -> dict:
+    # Turbo firmware policy.
+    return {"thermal_policy": 1, "epp": "performance"}
@@ -5,8 +5,12 @@
 import sys
 from evdev import InputDevice, InputEvent, UInput, ecodes as e, list_devices, ff
 
+from .. import chords
 from .. import constants as cons
 
+ANB_KBD = [24, 29, 125]                   # Left Ctrl + Left Meta + O
+ANB_KBD_LONG_DELAY = 0.5
+
 handycon = None
 
 def init_handheld(handheld_controller):
@@ -21,16 +25,21 @@ def init_handheld(handheld_controller):
     handycon.KEYBOARD_ADDRESS = 'isa0060/serio0/input0'
     handycon.KEYBOARD_NAME = 'AT Translated Set 2 keyboard'
 
+    # Short press KB for button4, hold it for button1.
+    handycon.chord_timer.add(chords.PressPattern("kbd", {
+        chords.TAP: lambda: handycon.tap_action(handycon.button_map["button4"]),
+        chords.HOLD: lambda: handycon.fire_action(handycon.button_map["button1"], 1),
+        chords.HOLD_END: lambda: handycon.fire_action(handycon.button_map["button1"], 0),
+        }, hold_time=ANB_KBD_LONG_DELAY))
+
 
 # Captures keyboard events and translates them to virtual device events.
 async def process_event(seed_event, active_keys):
     global handycon
 
     # Button map shortcuts for easy reference.
-    button1 = handycon.button_map["button1"]  # Default Screenshot
     button2 = handycon.button_map["button2"]  # Default QAM
     button3 = handycon.button_map["button3"]  # Default ESC
-    button4 = handycon.button_map["button4"]  # Default OSK
     button5 = handycon.button_map["button5"]  # Default MODE
 
     ## Loop variables
@@ -47,14 +56,14 @@ async def process_event(seed_event, active_keys):
         this_button = handycon.event_queue[0]
 
     # BUTTON 1 (BUTTON 4 ALT Mode) (Default: Screenshot) Long press KB
-    if active_keys == [24, 29, 125] and button_on == 2 and button1 not in handycon.event_queue:
-        if button4 in handycon.event_queue:
-            handycon.event_queue.remove(button4)
+    # BUTTON 4 (Default: OSK) Short press KB
+    # Key repeats (value 2) are ignored, the chord timer tells short from long.
+    if active_keys == ANB_KBD and button_on == 1:
         if button5 in handycon.event_queue:
             handycon.event_queue.remove(button5)
-        handycon.event_queue.append(button1)
-    elif active_keys == [] and seed_event.code in [24, 29, 125] and button_on == 0 and button1 in handycon.event_queue:
-        this_button = button1
+        handycon.chord_timer.press("kbd")
+    elif seed_event.code in ANB_KBD and button_on == 0 and handycon.chord_timer.is_pressed("kbd"):
+        handycon.chord_timer.release("kbd")
 
     # BUTTON 2 (Default: QAM) Home key.
     if active_keys == [125] and button_on == 1 and button2 not in handycon.event_queue:
@@ -73,14 +82,6 @@ async def process_event(seed_event, active_keys):
     elif active_keys == [] and seed_event.code == 1 and button_on == 0 and button3 in handycon.event_queue:
         this_button = button3
 
-    # BUTTON 4 (Default: OSK) Short press KB
-    if active_keys == [24, 29, 125] and button_on == 1 and button4 not in handycon.event_queue:
-        if button5 in handycon.event_queue:
-            handycon.event_queue.remove(button5)
-        handycon.event_queue.append(button4)
-    elif active_keys == [] and seed_event.code in [24, 29, 125] and button_on == 0 and button4 in handycon.event_queue:
-        this_button = button4
-
     # BUTTON 5 (Default: GUIDE) Meta/Windows key.
     if active_keys == [34, 125] and button_on == 1 and button5 not in handycon.event_queue:
         handycon.event_queue.append(button5)
@@ -2,10 +2,12 @@
 # This file is part of Handheld Game Console Controller System (HandyGCCS)
 # Copyright 2022-2023 Derek J. Clark <derekjohn.clark@gmail.com>
 
+import asyncio
 import os
 import sys
 from evdev import InputDevice, InputEvent, UInput, ecodes as e, list_devices, ff
 
+from .. import chords
 from .. import constants as cons
 
 handycon = None
@@ -15,7 +17,7 @@ handycon = None
 AOKZOE_A1_HOME = [125, 32]                # Left Meta + D
 AOKZOE_A1_HOME_LONG = [125, 34]           # Left Meta + G
 AOKZOE_A1_KBD = [97, 125, 24]             # Left Ctrl + Left Meta + O
-AOKZOE_A1_TURBO = [29, 125, 56]           # Left Ctrl + Left Meta + Left Alt
+AOKZOE_A1_TURBO = [29, 56, 125]           # Left Ctrl + Left Alt + Left Meta
 AOKZOE_A1_HOME_PLUS_KBD = [100, 97, 111]  # Ctrl Alt Del
 AOKZOE_A1_HOME_PLUS_TURBO = [99, 125]     # Left Meta + Sysreq
 AOKZOE_A1_TURBO_LONG_DELAY = 1.5
@@ -48,6 +50,22 @@ def init_handheld(handheld_controller):
         # Setup the turbo handler default settings.
     handycon.turbo.set_turbo()
 
+    # Short press Turbo for button2, hold it for button7.
+    handycon.chord_timer.add(chords.PressPattern("turbo", {
+        chords.TAP: turbo_tap,
+        chords.HOLD: turbo_hold,
+        }, hold_time=AOKZOE_A1_TURBO_LONG_DELAY))
+
+
+def turbo_tap():
+    handycon.tap_action(handycon.button_map["button2"])
+    asyncio.ensure_future(handycon.do_rumble(0, 150, 1000, 0))
+
+
+def turbo_hold():
+    handycon.tap_action(handycon.button_map["button7"])
+    asyncio.ensure_future(handycon.do_rumble(0, 150, 1000, 0))
+
 
 # Captures keyboard events and translates them to virtual device events.
 async def process_event(seed_event, active_keys):
@@ -55,7 +73,6 @@ async def process_event(seed_event, active_keys):
 
     # Button map shortcuts for easy reference.
     button1 = handycon.button_map["button1"]  # Default Screenshot
-    button2 = handycon.button_map["button2"]  # Default QAM
     button3 = handycon.button_map["button3"]  # Default ESC
     button4 = handycon.button_map["button4"]  # Default OSK
     button5 = handycon.button_map["button5"]  # Default MODE
@@ -81,13 +98,13 @@ async def process_event(seed_event, active_keys):
     elif active_keys == [] and seed_event.code in AOKZOE_A1_HOME_PLUS_TURBO and button_on == 0 and button1 in handycon.event_queue:
         this_button = button1
 
-    # BUTTON 2 (Default: QAM) Turbo Button
-    # This event won't fire if turbo was not captured
-    if active_keys == AOKZOE_A1_TURBO and button_on == 1 and button2 not in handycon.event_queue:
-        handycon.event_queue.append(button2)
-    elif active_keys == [] and seed_event.code in AOKZOE_A1_TURBO and button_on == 0 and button2 in handycon.event_queue:
-        this_button = button2
-        await handycon.do_rumble(0, 150, 1000, 0)
+    # BUTTON 2 (Default: QAM) Short press Turbo
+    # BUTTON 7 (Default: Toggle Performance) Long press Turbo
+    # These events won't fire if turbo was not captured
+    if active_keys == AOKZOE_A1_TURBO and button_on == 1:
+        handycon.chord_timer.press("turbo")
+    elif seed_event.code in AOKZOE_A1_TURBO and button_on == 0 and handycon.chord_timer.is_pressed("turbo"):
+        handycon.chord_timer.release("turbo")
 
     # BUTTON 3 (Default: ESC) Short press orange + KB
     if active_keys == AOKZOE_A1_HOME_PLUS_KBD and button_on == 1 and button3 not in handycon.event_queue:
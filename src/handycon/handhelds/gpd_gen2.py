@@ -1,57 +0,0 @@
-#!/usr/bin/env python3
-# This file is part of Handheld Game Console Controller System (HandyGCCS)
-# Copyright 2022-2023 Derek J. Clark <derekjohn.clark@gmail.com>
-
-import sys
-from evdev import InputDevice, InputEvent, UInput, ecodes as e, list_devices, ff
-
-from .. import constants as cons
-
-handycon = None
-
-def init_handheld(handheld_controller):
-    global handycon
-    handycon = handheld_controller
-    handycon.BUTTON_DELAY = 0.11
-    handycon.CAPTURE_CONTROLLER = True
-    handycon.CAPTURE_KEYBOARD = True
-    handycon.CAPTURE_POWER = True
-    handycon.GAMEPAD_ADDRESS = 'usb-0000:74:00.3-3/input0'
-    handycon.GAMEPAD_NAME = 'Microsoft X-Box 360 pad'
-    handycon.KEYBOARD_ADDRESS = 'usb-0000:74:00.3-4/input0'
-    handycon.KEYBOARD_NAME = '  Mouse for Windows'
-
-
-# Captures keyboard events and translates them to virtual device events.
-async def process_event(seed_event, active_keys):
-    global handycon
-
-    # Button map shortcuts for easy reference.
-    button1 = handycon.button_map["button1"]  # Default Screenshot
-    button2 = handycon.button_map["button2"]  # Default QAM
-
-    ## Loop variables
-    button_on = seed_event.value
-
-    # Automatically pass default keycodes we dont intend to replace.
-    if seed_event.code in [e.KEY_VOLUMEDOWN, e.KEY_VOLUMEUP]:
-        await handycon.emit_events([seed_event])
-
-    # BUTTON 1 (Default: Screenshot)
-    if active_keys == [11] and button_on == 1 and button1 not in handycon.event_queue:
-        await handycon.handle_key_down(seed_event, button1)
-    elif active_keys == [] and seed_event.code in [29, 56, 111] and button_on == 0 and button1 in handycon.event_queue:
-        await handycon.handle_key_up(seed_event, button1)
-
-    # BUTTON 2 (Default: QAM)
-    if active_keys == [10] and button_on == 1 and button2 not in handycon.event_queue:
-        await handycon.handle_key_down(seed_event, button2)
-    elif active_keys == [] and seed_event.code in [1] and button_on == 0 and button2 in handycon.event_queue:
-        await handycon.handle_key_up(seed_event, button2)
-
-    # Handle L_META from power button
-    elif active_keys == [] and seed_event.code == 125 and button_on == 0 and  handycon.event_queue == [] and handycon.shutdown == True:
-        handycon.shutdown = False
-
-    if handycon.last_button:
-        await handycon.handle_key_up(seed_event, handycon.last_button)
@@ -48,7 +48,7 @@ async def process_event(seed_event, active_keys):
     if active_keys == [99, 125] and button_on == 1 and button1 not in handycon.event_queue:
         handycon.event_queue.append(button1)
     elif active_keys == [] and seed_event.code in [99, 125] and button_on == 0 and button1 in handycon.event_queue:
-        this_button - button1
+        this_button = button1
 
     # BUTTON 2 (Default: QAM) Short press orange
     if active_keys == [32, 125] and button_on == 1 and button2 not in handycon.event_queue:
@@ -2,6 +2,7 @@
 # This file is part of Handheld Game Console Controller System (HandyGCCS)
 # Copyright 2022-2023 Derek J. Clark <derekjohn.clark@gmail.com>
 
+import os
 import sys
 from evdev import InputDevice, InputEvent, UInput, ecodes as e, list_devices, ff
 
@@ -40,6 +41,7 @@ async def process_event(seed_event, active_keys):
     button3 = handycon.button_map["button3"]  # Default ESC
     button4 = handycon.button_map["button4"]  # Default OSK
     button5 = handycon.button_map["button5"]  # Default MODE
+    button6 = handycon.button_map["button6"]  # Default OPEN_CHIMERA
 
     ## Loop variables
     events = []
@@ -72,7 +74,7 @@ async def process_event(seed_event, active_keys):
     # BUTTON 3 (Default: ESC) Short press orange + KB
     if active_keys == [97, 100, 111] and button_on == 1 and button3 not in handycon.event_queue:
         handycon.event_queue.append(button3)
-    elif active_keys == [] and seed_event.code in [100, 111] and button_on == 0 and button3 in handycon.event_queued:
+    elif active_keys == [] and seed_event.code in [100, 111] and button_on == 0 and button3 in handycon.event_queue:
         this_button = button3
 
     # BUTTON 4 (Default: OSK) Short press KB
@@ -0,0 +1,225 @@
+#!/usr/bin/env python3
+# This file is part of Handheld Game Console Controller System (HandyGCCS)
+# Copyright 2022-2023 Derek J. Clark <derekjohn.clark@gmail.com>
+
+# Python Modules
+import asyncio
+import json
+import os
+import socket
+import sys
+
+## Local modules
+from .constants import *
+from .notify import sd_notify
+
+## Partial imports
+from evdev import InputDevice, UInput
+
+HANDOVER_SOCKET = "/run/handygccs/handover.sock"
+# Longest wait for the replacement process to connect and adopt the devices.
+HANDOVER_TIMEOUT = 10.0
+# Longest wait for an in-flight chord to finish before handing over anyway.
+HANDOVER_SETTLE = 2.0
+MAX_FDS = 16
+
+
+# Opens the node again for its name and capabilities, then points the new
+# descriptor at the handed over open file so the grab comes along with it.
+def adopt_device(fd, path) -> InputDevice:
+    device = InputDevice(path)
+    os.dup2(fd, device.fd)
+    os.close(fd)
+    return device
+
+
+# Wraps a handed over uinput descriptor. The device already exists, so the
+# creation in UInput.__init__ is skipped.
+def adopt_uinput(fd, info) -> UInput:
+    ui_device = UInput.__new__(UInput)
+    ui_device.name = info["name"]
+    ui_device.vendor = info["vendor"]
+    ui_device.product = info["product"]
+    ui_device.version = info["version"]
+    ui_device.bustype = info["bustype"]
+    ui_device.phys = info["phys"]
+    ui_device.devnode = info["devnode"]
+    ui_device.fd = fd
+    ui_device.device = None
+    return ui_device
+
+
+# Everything the replacement needs. Each device entry holds the index of its
+# descriptor in the returned list.
+def collect(handycon) -> tuple:
+    fds = [handycon.ui_device.fd]
+
+    def device_state(device, event=None, path=None):
+        if device is None:
+            return None
+        fds.append(device.fd)
+        return {"fd": len(fds) - 1, "event": event, "path": path,
+                "node": str(HIDE_PATH / event) if event else device.path}
+
+    ui_device = handycon.ui_device
+    state = {
+        "uinput": {
+            "name": ui_device.name,
+            "vendor": ui_device.vendor,
+            "product": ui_device.product,
+            "version": ui_device.version,
+            "bustype": ui_device.bustype,
+            "phys": ui_device.phys,
+            "devnode": ui_device.devnode,
+        },
+        "controller": device_state(handycon.controller_device, handycon.controller_event, handycon.controller_path),
+        "power": device_state(handycon.power_device),
+        "power_2": device_state(handycon.power_device_2),
+        "keyboards": {
+            source.role: dict(device_state(source.device, source.event, source.path), keys=sorted(source.keys))
+            for source in handycon.keyboard_sources if source.device
+        },
+        "event_queue": list(handycon.event_queue),
+        "last_button": handycon.last_button,
+        "turbo": handycon.turbo.current if handycon.turbo else None,
+    }
+    return state, fds
+
+
+# Waits for the replacement to connect. Gives up early if it exits first.
+async def accept(loop, server, child) -> socket.socket:
+    accepting = asyncio.ensure_future(loop.sock_accept(server))
+    exiting = asyncio.ensure_future(child.wait())
+    try:
+        done, _ = await asyncio.wait((accepting, exiting), timeout=HANDOVER_TIMEOUT,
+                return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        for task in (accepting, exiting):
+            task.cancel()
+    if accepting in done:
+        return accepting.result()[0]
+    if exiting in done:
+        raise ConnectionError(f"the new process exited with code {child.returncode}")
+    raise asyncio.TimeoutError()
+
+
+# Runs in the old process on SIGHUP. Starts a replacement with --takeover,
+# passes it the grabbed devices and the virtual controller, then exits
+# without ungrabbing or restoring anything.
+async def hand_over(handycon):
+    loop = asyncio.get_running_loop()
+    handycon.logger.info("Handing input devices over to a new process.")
+
+    # Let a chord in flight finish so its release isn't lost.
+    deadline = loop.time() + HANDOVER_SETTLE
+    while (handycon.event_queue or handycon.last_button or handycon.chord_timer.busy()) and loop.time() < deadline:
+        await asyncio.sleep(0.01)
+
+    os.makedirs(os.path.dirname(HANDOVER_SOCKET), exist_ok=True)
+    if os.path.exists(HANDOVER_SOCKET):
+        os.unlink(HANDOVER_SOCKET)
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM | socket.SOCK_CLOEXEC)
+    server.bind(HANDOVER_SOCKET)
+    os.chmod(HANDOVER_SOCKET, 0o600)
+    server.listen(1)
+    server.setblocking(False)
+    child = await asyncio.create_subprocess_exec(
+        sys.executable, *[arg for arg in sys.argv if arg != "--takeover"], "--takeover")
+    conn = None
+    stopped = False
+    try:
+        conn = await accept(loop, server, child)
+        # Stop reading before the replacement starts, or events would be
+        # split between the two processes.
+        await handycon.stop_capture()
+        stopped = True
+        state, fds = collect(handycon)
+        for fd in fds:
+            loop.remove_reader(fd)
+        conn.setblocking(True)
+        conn.settimeout(HANDOVER_TIMEOUT)
+        socket.send_fds(conn, [json.dumps(state).encode()], fds)
+        reply = await loop.run_in_executor(None, conn.recv, 16)
+        if reply != b"ok":
+            raise ConnectionError("the new process did not adopt the devices")
+    except (OSError, asyncio.TimeoutError, ConnectionError) as err:
+        handycon.logger.error(f"{err} | Handover failed. Continuing in this process.")
+        if child.returncode is None:
+            child.kill()
+        # The capture tasks are still running unless they were stopped for
+        # the handover.
+        if stopped:
+            handycon.start_capture()
+        await child.wait()
+        return
+    finally:
+        if conn:
+            conn.close()
+        server.close()
+        os.unlink(HANDOVER_SOCKET)
+
+    handycon.logger.info(f"Handed over to process {child.pid}.")
+    await handycon.exit(restore=False)
+
+
+# Runs in the new process before any device is touched. Returns the state,
+# the descriptors and the connection to reply on, or None if nothing was
+# handed over.
+def receive(handycon) -> tuple | None:
+    try:
+        conn = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM | socket.SOCK_CLOEXEC)
+        conn.settimeout(HANDOVER_TIMEOUT)
+        conn.connect(HANDOVER_SOCKET)
+        message, fds, _, _ = socket.recv_fds(conn, 1 << 20, MAX_FDS)
+        state = json.loads(message)
+    except (OSError, ValueError) as err:
+        handycon.logger.error(f"{err} | No handover received. Starting normally.")
+        return None
+    return state, fds, conn
+
+
+# Installs the received devices and chord state, then tells the old process
+# and systemd that this process has taken over.
+def adopt(handycon, state, fds, conn):
+    unused = set(fds)
+
+    def take(entry) -> InputDevice:
+        fd = fds[entry["fd"]]
+        unused.discard(fd)
+        return adopt_device(fd, entry["node"])
+
+    handycon.ui_device = adopt_uinput(fds[0], state["uinput"])
+    unused.discard(fds[0])
+    controller = state["controller"]
+    if controller:
+        handycon.controller_device = take(controller)
+        handycon.controller_event = controller["event"]
+        handycon.controller_path = controller["path"]
+    if state["power"]:
+        handycon.power_device = take(state["power"])
+    if state["power_2"]:
+        handycon.power_device_2 = take(state["power_2"])
+    for source in handycon.keyboard_sources:
+        keyboard = state["keyboards"].get(source.role)
+        if keyboard:
+            source.device = take(keyboard)
+            source.event = keyboard["event"]
+            source.path = keyboard["path"]
+            source.keys = set(keyboard["keys"])
+    # Sources this handheld no longer declares are dropped.
+    for fd in unused:
+        os.close(fd)
+
+    for queued_event in state["event_queue"]:
+        handycon.event_queue.append(queued_event)
+    handycon.last_button = state["last_button"]
+    if handycon.turbo and state["turbo"] is not None and state["turbo"] < len(handycon.turbo.speeds):
+        # The hardware is already at this speed, so it isn't applied again.
+        handycon.turbo.current = state["turbo"]
+        if handycon.turbo.startup_task:
+            handycon.turbo.startup_task.cancel()
+
+    sd_notify(f"MAINPID={os.getpid()}")
+    conn.sendall(b"ok")
+    conn.close()
+    handycon.logger.info("Took over input devices from the previous process.")
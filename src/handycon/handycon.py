@@ -3,6 +3,10 @@
 # Copyright 2022-2023 Derek J. Clark <derekjohn.clark@gmail.com>
 
 # Python Modules
+import time
+IMPORT_START = time.monotonic()
+
+import argparse
 import asyncio
 import logging
 import os
@@ -12,33 +16,61 @@ import warnings
 
 ## Local modules
 from .constants import *
+from . import chords
+from . import config_watcher
 from . import devices
+from . import engine
+from . import idle
+from . import keyboards
+from . import logs
+from . import notify
+from . import pending
+from . import trace
 from . import utilities
+from . import watchdog
+from .startup import StartupReport
 
 ## Partial imports
 from pathlib import Path
 
+IMPORT_END = time.monotonic()
+
 
 warnings.filterwarnings("ignore", category=DeprecationWarning)
 class HandheldController:
     # Logging
-    logging.basicConfig(format="[%(asctime)s | %(filename)s:%(lineno)s:%(funcName)s] %(message)s",
-                        datefmt="%y%m%d_%H:%M:%S",
-                        level=logging.DEBUG
-                        )
     logger= logging.getLogger(__name__)
 
     # Session Variables
     config = None
+    fans = None
+    forwarding = None # Set once controller events are being forwarded
+    pending_config = None
+    profiler = None
+    readiness = None
+    resume = None
     button_map = {}
-    event_queue = [] # Stores inng button presses to block spam
+    capture_tasks = {}
+    chord_timer = None
+    fusion = None
+    governor = None
+    handing_over = False
+    idle = None
+    imu = None
+    keyboard_sources = None
+    event_queue = None # Stores inng button presses to block spam
     last_button = None
     last_x_val = 0
     last_y_val = 0
+    mouse = None
     power_action = "Suspend"
     running = False
     shutdown = False
+    sticks = None
+    trace = None
+    triggers = None
     turbo = None
+    watchdog = None
 
     # Handheld Config
     BUTTON_DELAY = 0.00
@@ -49,8 +81,6 @@ class HandheldController:
     GAMEPAD_NAME = ''
     KEYBOARD_ADDRESS = ''
     KEYBOARD_NAME = ''
-    KEYBOARD_2_ADDRESS = ''
-    KEYBOARD_2_NAME = ''
     POWER_BUTTON_PRIMARY = "LNXPWRBN/button/input0"
     POWER_BUTTON_SECONDARY = "PNP0C0C/button/input0"
 
@@ -61,50 +91,88 @@ class HandheldController:
 
     # UInput Devices
     controller_device = None
-    keyboard_device = None
-    keyboard_2_device = None
     power_device = None
     power_device_2 = None
 
     # Paths
     controller_event = None
     controller_path = None
-    keyboard_event = None
-    keyboard_path = None
-    keyboard_2_event = None
-    keyboard_2_path = None
 
-    def __init__(self):
+    def __init__(self, startup_report=False, profile_hz=PROFILE_HZ, takeover=False):
         self.running = True
+        self.startup = StartupReport(enabled=startup_report)
+        self.trace = trace.EventTrace()
+        self.profile_hz = profile_hz
+        self.startup.add_phase("imports", IMPORT_START, IMPORT_END)
+        config_watcher.set_handycon(self)
         devices.set_handycon(self)
+        keyboards.set_handycon(self)
         utilities.set_handycon(self)
         self.logger.info("Starting Handhend Game Console Controller Service...")
         if utilities.is_process_running("opengamepadui"):
             self.logger.warn("Detected an OpenGamepadUI Process. Input management not possible. Exiting.")
             exit()
         Path(HIDE_PATH).mkdir(parents=True, exist_ok=True)
-        devices.restore_hidden()
-        utilities.get_user()
+        # A takeover inherits the hidden devices, so they stay where they are.
+        received = None
+        if takeover:
+            from . import handover
+            with self.startup.phase("handover"):
+                received = handover.receive(self)
+            if received is None:
+                sys.exit(1)
+        else:
+            with self.startup.phase("restore_hidden"):
+                devices.restore_hidden()
+        with self.startup.phase("get_user"):
+            utilities.get_user()
         self.HAS_CHIMERA_LAUNCHER=os.path.isfile(CHIMERA_LAUNCHER_PATH)
-        utilities.id_system()
-        devices.make_controller()
+        self.keyboard_sources = []
+        self.chord_timer = chords.ChordTimer()
+        # A config swap deferred for a timed chord is retried once it finishes.
+        self.chord_timer.on_settle.append(self.apply_pending_config)
+        self.event_queue = pending.PendingActions()
+        self.idle = idle.IdleMonitor(self)
+        self.forwarding = asyncio.Event()
+        self.readiness = notify.Readiness(self)
+        self.watchdog = watchdog.LoopWatchdog(self)
+        from . import resume
+        self.resume = resume.ResumeMonitor(self)
+        with self.startup.phase("id_system"):
+            utilities.id_system()
+        if received:
+            with self.startup.phase("adopt_devices"):
+                handover.adopt(self, *received)
+        else:
+            with self.startup.phase("make_controller"):
+                devices.make_controller()
+        self.startup.mark("loop start")
 
         # Run asyncio loop to capture all events.
         self.loop = asyncio.get_event_loop()
+        self.loop.set_exception_handler(self.handle_exception)
 
-        # Attach the event loop of each device to the asyncio loop.
-        asyncio.ensure_future(devices.capture_controller_events())
-        asyncio.ensure_future(devices.capture_ff_events())
-        asyncio.ensure_future(devices.capture_keyboard_events())
-        if self.KEYBOARD_2_NAME != '' and self.KEYBOARD_2_ADDRESS != '':
-            asyncio.ensure_future(devices.capture_keyboard_2_events())
-
-        asyncio.ensure_future(devices.capture_power_events())
+        # Attach the event loop of each device to the asyncio loop. Every
+        # device is acquired concurrently against one deadline.
+        self.readiness.expect("controller")
+        self.readiness.expect("power")
+        for source in self.keyboard_sources:
+            self.readiness.expect(source.role)
+        self.readiness.start()
+        self.start_capture()
+        asyncio.ensure_future(config_watcher.watch_config())
+        self.idle.start()
+        self.watchdog.start()
+        self.resume.start()
         self.logger.info("Handheld Game Console Controller Service started.")
 
         # Establish signaling to handle gracefull shutdown.
-        for s in (signal.SIGHUP, signal.SIGTERM, signal.SIGINT, signal.SIGQUIT):
+        for s in (signal.SIGTERM, signal.SIGINT, signal.SIGQUIT):
             self.loop.add_signal_handler(s, lambda s=s: asyncio.create_task(self.exit()))
+        # SIGHUP restarts by handing the devices over to a new process.
+        self.loop.add_signal_handler(signal.SIGHUP, self.restart)
+        self.loop.add_signal_handler(signal.SIGUSR1, self.dump_trace)
+        self.loop.add_signal_handler(signal.SIGUSR2, self.toggle_profiler)
 
         try:
             self.loop.run_forever()
@@ -114,24 +182,109 @@ class HandheldController:
             exit_code = 1
         except Exception as err:
             self.logger.error(f"{err} | Hit exception condition.")
+            self.dump_trace()
             exit_code = 2
         finally:
             self.loop.stop()
             sys.exit(exit_code)
 
+    # Called once the first controller event has been forwarded.
+    def finish_startup(self):
+        self.startup.mark("first event")
+        self.startup.complete = True
+        self.logger.info(f"First controller event forwarded {self.startup.since_start('first event'):.3f}s after start.")
+        if self.startup.enabled:
+            print(self.startup.format(), flush=True)
+
+    # Starts a task reading each input device and the virtual controller,
+    # keyed by the role of the device it reads.
+    def start_capture(self):
+        self.capture_tasks = {
+            "controller": asyncio.ensure_future(devices.capture_controller_events()),
+            "ff": asyncio.ensure_future(devices.capture_ff_events()),
+            "power": asyncio.ensure_future(devices.capture_power_events()),
+        }
+        for source in self.keyboard_sources:
+            self.capture_tasks[source.role] = asyncio.ensure_future(keyboards.capture_events(source))
+
+    async def stop_capture(self):
+        for task in self.capture_tasks.values():
+            task.cancel()
+        await asyncio.gather(*self.capture_tasks.values(), return_exceptions=True)
+        self.capture_tasks = {}
+
+    def restart(self):
+        if self.handing_over:
+            return
+        self.handing_over = True
+
+        async def restart_task():
+            from . import handover
+            try:
+                await handover.hand_over(self)
+            finally:
+                self.handing_over = False
+        asyncio.ensure_future(restart_task())
+
+    # The profiler is only loaded once SIGUSR2 first asks for it.
+    def toggle_profiler(self):
+        if self.profiler is None:
+            from . import profiler
+            self.profiler = profiler.SamplingProfiler(self, self.profile_hz)
+        self.profiler.toggle()
+
+    # Exceptions escaping a task or callback never reach run_forever, so the
+    # trace is dumped here before the default handler logs them.
+    def handle_exception(self, loop, context):
+        self.dump_trace()
+        loop.default_exception_handler(context)
+
+    # Writes the event trace ring buffer to disk for post-mortem debugging.
+    def dump_trace(self):
+        try:
+            path = self.trace.dump()
+        except OSError as err:
+            self.logger.error(f"{err} | Unable to dump the event trace.")
+            return
+        self.logger.info(f"Dumped {min(self.trace.count, self.trace.capacity)} trace records to {path}.")
+
     # These functions avoid recursive imports.
     def steam_ifrunning_deckui(self, cmd):
         return utilities.steam_ifrunning_deckui(cmd)
 
+    def apply_pending_config(self):
+        return utilities.apply_pending_config()
+
+    def compile_gyro(self, config) -> dict:
+        return utilities.compile_gyro(config)
+
+    def compile_mouse(self, config) -> dict:
+        return utilities.compile_mouse(config)
+
+    def load_mouse(self):
+        return devices.load_mouse()
+
     def launch_chimera(self):
         utilities.launch_chimera()
 
     async def emit_events(self, events: list):
         await devices.emit_events(events)
 
+    def write_events(self, events: list):
+        devices.write_events(events)
+
     async def emit_now(self, seed_event, event_list, value):
         await devices.emit_now(seed_event, event_list, value)
 
+    def add_keyboard(self, role, name, phys, handler=None):
+        return keyboards.add_keyboard(role, name, phys, handler)
+
+    def fire_action(self, event_list, value):
+        return devices.fire_action(event_list, value)
+
+    def tap_action(self, event_list):
+        return devices.tap_action(event_list)
+
     async def do_rumble(self, button=0, interval=10, length=1000, delay=0):
         await devices.do_rumble(button, interval, length, delay)
 
@@ -142,39 +295,53 @@ class HandheldController:
         await devices.handle_key_down(seed_event, queued_event)
 
     # Gracefull shutdown.
-    async def exit(self):
-        self.logger.info("Receved exit signal. Restoring devices.")
+    # With restore False the devices are left grabbed and hidden for the
+    # process that took them over.
+    async def exit(self, restore=True):
+        self.logger.info("Receved exit signal. Restoring devices." if restore else "Exiting after handover.")
         self.running = False
+        self.readiness.stop(notify=restore)
+        self.idle.stop()
+        self.watchdog.stop()
+        if self.profiler:
+            self.profiler.stop()
+        self.resume.stop()
+        stats = self.watchdog.stats()
+        self.logger.info(f"Event loop lag: max {stats['lag_max_ms']:.1f}ms, mean {stats['lag_mean_ms']:.2f}ms over {stats['probes']} probes, {stats['stalls']} stalls.")
+        stats = self.resume.stats()
+        if stats["resumes"]:
+            self.logger.info(f"Resumed {stats['resumes']} times. Input devices ready after at most {stats['ready_max_ms']:.0f}ms, first input after at most {stats['first_input_max_ms']:.0f}ms.")
+        if self.governor:
+            self.governor.stop()
+        if self.fans:
+            self.fans.stop()
 
-        if self.controller_device:
-            try:
-                self.controller_device.ungrab()
-            except IOError as err:
-                pass
-            devices.restore_device(self.controller_event, self.controller_path)
-        if self.keyboard_device:
-            try:
-                self.keyboard_device.ungrab()
-            except IOError as err:
-                pass
-            devices.restore_device(self.keyboard_event, self.keyboard_path)
-        if self.keyboard_2_device:
-            try:
-                self.keyboard_2_device.ungrab()
-            except IOError as err:
-                pass
-            devices.restore_device(self.keyboard_2_event, self.keyboard_2_path)
-        if self.power_device and self.CAPTURE_POWER:
-            try:
-                self.power_device.ungrab()
-            except IOError as err:
-                pass
-        if self.power_device_2 and self.CAPTURE_POWER:
-            try:
-                self.power_device_2.ungrab()
-            except IOError as err:
-                pass
-        self.logger.info("Devices restored.")
+        if self.mouse and self.mouse.enabled:
+            self.mouse.disable()
+        if self.imu and self.imu.enabled:
+            self.imu.stop()
+            self.fusion.stop()
+
+        if restore:
+            if self.controller_device:
+                try:
+                    self.controller_device.ungrab()
+                except IOError as err:
+                    pass
+                devices.restore_device(self.controller_event, self.controller_path)
+            for source in self.keyboard_sources:
+                keyboards.release(source)
+            if self.power_device and self.CAPTURE_POWER:
+                try:
+                    self.power_device.ungrab()
+                except IOError as err:
+                    pass
+            if self.power_device_2 and self.CAPTURE_POWER:
+                try:
+                    self.power_device_2.ungrab()
+                except IOError as err:
+                    pass
+            self.logger.info("Devices restored.")
 
         # Kill all tasks. They are infinite loops so we will wait forver.
         for task in [t for t in asyncio.all_tasks() if t is not asyncio.current_task()]:
@@ -188,4 +355,33 @@ class HandheldController:
 
 
 def main():
-    handycon = HandheldController()
+    parser = argparse.ArgumentParser(prog="handycon")
+    parser.add_argument("--startup-report", action="store_true",
+                        help="print per-phase startup timings once the first controller event is forwarded")
+    parser.add_argument("--log-level", choices=logs.LOG_LEVELS, type=str.upper,
+                        help=f"log verbosity, overrides HANDYCON_LOG_LEVEL (default {logs.DEFAULT_LOG_LEVEL})")
+    parser.add_argument("--loop", choices=engine.ENGINES, type=str.lower,
+                        help=f"event loop implementation, overrides HANDYCON_LOOP and the config (default {engine.DEFAULT_ENGINE})")
+    parser.add_argument("--profile-hz", type=int, default=PROFILE_HZ,
+                        help=f"sampling rate of the profiler started with SIGUSR2 (default {PROFILE_HZ})")
+    parser.add_argument("--takeover", action="store_true",
+                        help="adopt the grabbed devices of the running instance instead of grabbing them again")
+    args = parser.parse_args()
+    if args.profile_hz <= 0:
+        parser.error("--profile-hz must be greater than 0")
+
+    try:
+        level = logs.resolve_level(args.log_level)
+    except ValueError as err:
+        parser.error(str(err))
+    listener = logs.setup_logging(level)
+    try:
+        engine.install(engine.resolve_engine(args.loop))
+    except ValueError as err:
+        listener.stop()
+        parser.error(str(err))
+    try:
+        handycon = HandheldController(startup_report=args.startup_report, profile_hz=args.profile_hz,
+                                      takeover=args.takeover)
+    finally:
+        listener.stop()
@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+# This file is part of Handheld Game Console Controller System (HandyGCCS)
+# Copyright 2022-2023 Derek J. Clark <derekjohn.clark@gmail.com>
+
+# Python Modules
+import asyncio
+import glob
+import os
+import time
+
+## Local modules
+from .constants import *
+from . import config_watcher
+
+# inotify flags from linux/inotify.h
+IN_ATTRIB = 0x00000004
+IN_CREATE = 0x00000100
+
+# No input for this long counts as idle.
+IDLE_AFTER = 60.0
+
+
+# Total context switches across every thread of a process. Each one is a
+# wakeup or a preemption, so the rate is a direct measure of idle cost.
+def read_wakeups(pid="self") -> int:
+    total = 0
+    for status_path in glob.glob(f"/proc/{pid}/task/*/status"):
+        try:
+            with open(status_path, "r") as f:
+                for line in f:
+                    if line.startswith(("voluntary_ctxt_switches", "nonvoluntary_ctxt_switches")):
+                        total += int(line.split(":", 1)[1])
+        except OSError:
+            continue
+    return total
+
+
+class IdleMonitor:
+    """Notices when input stops and lets background work park until it resumes.
+
+    While active, a single timer checks for input once every idle_after
+    seconds. Once idle, no timer is armed at all and the daemon only wakes
+    when an input device or /dev/input becomes readable."""
+
+    def __init__(self, handycon, idle_after=IDLE_AFTER):
+        self.handycon = handycon
+        self.idle_after = idle_after
+        self.idle = False
+        self.active = False
+        self.handle = None
+        self.loop = None
+        self.hotplug_fd = None
+        self.device_added = asyncio.Event()
+        self.on_idle = []
+        self.on_wake = []
+        self.idle_since = 0.0
+        self.idle_wakeups = 0
+
+    def start(self):
+        self.loop = asyncio.get_event_loop()
+        try:
+            self.hotplug_fd = config_watcher.open_watch("/dev/input", IN_CREATE | IN_ATTRIB)
+            self.loop.add_reader(self.hotplug_fd, self.on_hotplug)
+        except (OSError, AttributeError) as err:
+            self.handycon.logger.warn(f"{err} | Missing devices will be polled for.")
+            self.hotplug_fd = None
+        self.arm()
+
+    def stop(self):
+        if self.handle:
+            self.handle.cancel()
+            self.handle = None
+        if self.hotplug_fd is not None:
+            self.loop.remove_reader(self.hotplug_fd)
+            os.close(self.hotplug_fd)
+            self.hotplug_fd = None
+
+    def arm(self):
+        self.handle = self.loop.call_later(self.idle_after, self.check)
+
+    # Called for every input event, so it only sets a flag.
+    def touch(self):
+        self.active = True
+        if self.idle:
+            self.wake()
+
+    # Work that keeps running without input events also counts as activity.
+    def busy(self) -> bool:
+        handycon = self.handycon
+        if handycon.mouse and handycon.mouse.enabled and handycon.mouse.moving.is_set():
+            return True
+        return handycon.chord_timer.busy()
+
+    def check(self):
+        self.handle = None
+        if self.active or self.busy():
+            self.active = False
+            self.arm()
+            return
+        self.idle = True
+        self.idle_since = time.monotonic()
+        self.idle_wakeups = read_wakeups()
+        self.handycon.logger.info(f"No input for {self.idle_after:.0f}s. Entering idle mode.")
+        for listener in self.on_idle:
+            listener()
+
+    def wake(self):
+        self.idle = False
+        elapsed = time.monotonic() - self.idle_since
+        wakeups = read_wakeups() - self.idle_wakeups
+        self.handycon.logger.info(f"Leaving idle mode after {elapsed:.0f}s with {wakeups / max(elapsed, 1e-3):.3f} wakeups/s.")
+        for listener in self.on_wake:
+            listener()
+        self.arm()
+
+    def on_hotplug(self):
+        if config_watcher.read_names(self.hotplug_fd):
+            # Wake every waiter, then start a fresh event for the next change.
+            self.device_added.set()
+            self.device_added = asyncio.Event()
+
+    # Take a marker before trying to grab a device, then pass it to
+    # wait_for_device so a node created in between is never missed.
+    def device_marker(self) -> asyncio.Event:
+        return self.device_added
+
+    # Missing devices are polled for until the acquisition deadline, which
+    # covers devices still initializing at boot. After that they are only
+    # retried when a node appears in /dev/input. Right after a resume they
+    # are retried on a new node or every RESUME_POLL, whichever comes first.
+    async def wait_for_device(self, marker):
+        if self.handycon.resume.recovering():
+            try:
+                await asyncio.wait_for(marker.wait(), RESUME_POLL)
+            except asyncio.TimeoutError:
+                pass
+            return
+        if self.handycon.readiness.polling() or self.hotplug_fd is None:
+            await asyncio.sleep(DETECT_DELAY)
+            return
+        await marker.wait()
@@ -0,0 +1,394 @@
+#!/usr/bin/env python3
+# This file is part of Handheld Game Console Controller System (HandyGCCS)
+# Copyright 2022-2023 Derek J. Clark <derekjohn.clark@gmail.com>
+
+# Python Modules
+import asyncio
+import os
+import re
+import struct
+
+## Partial imports
+from array import array
+from pathlib import Path
+
+IIO_SYSFS_PATH = Path("/sys/bus/iio/devices")
+IIO_DEV_PATH = Path("/dev")
+IMU_CHANNELS = (
+    "anglvel_x",
+    "anglvel_y",
+    "anglvel_z",
+    "accel_x",
+    "accel_y",
+    "accel_z",
+    "timestamp",
+)
+IMU_DEFAULTS = {
+    "rate": 1000,
+    "watermark": 16,
+}
+STORAGE_FORMATS = {
+    (8, True): "b", (8, False): "B",
+    (16, True): "h", (16, False): "H",
+    (32, True): "i", (32, False): "I",
+    (64, True): "q", (64, False): "Q",
+}
+TYPE_PATTERN = re.compile(r"(be|le):(s|u)(\d+)/(\d+)(?:X(\d+))?>>(\d+)")
+
+
+class Channel:
+    """One enabled IIO scan element and how to decode it."""
+
+    def __init__(self, name, index, type_str, scale=1.0, offset=0.0):
+        match = TYPE_PATTERN.fullmatch(type_str.strip())
+        if not match:
+            raise ValueError(f"Unsupported scan element type {type_str} for {name}.")
+        endian, sign, bits, storage, repeat, shift = match.groups()
+        if repeat not in (None, "1"):
+            raise ValueError(f"Repeated scan element {name} is not supported.")
+        self.name = name
+        self.index = index
+        self.big_endian = endian == "be"
+        self.signed = sign == "s"
+        self.bits = int(bits)
+        self.storage = int(storage)
+        self.shift = int(shift)
+        self.scale = scale
+        self.offset = offset
+        if (self.storage, self.signed) not in STORAGE_FORMATS:
+            raise ValueError(f"Unsupported storage size {storage} for {name}.")
+
+    # Only channels that don't fill their storage need masking and sign extension.
+    def needs_fixup(self) -> bool:
+        return self.shift != 0 or self.bits != self.storage
+
+    # Masks and sign extends a whole column of raw values at once.
+    def fixup(self, column) -> list:
+        shift = self.shift
+        mask = (1 << self.bits) - 1
+        if not self.signed:
+            return [(value >> shift) & mask for value in column]
+        sign = 1 << (self.bits - 1)
+        return [(((value >> shift) & mask) ^ sign) - sign for value in column]
+
+    # Scales a whole column of values at once.
+    def convert(self, column) -> list:
+        scale = self.scale
+        if self.offset:
+            offset = self.offset
+            return [(value + offset) * scale for value in column]
+        return [value * scale for value in column]
+
+
+# Builds a struct describing one scan record. The kernel aligns each element to
+# its own storage size and pads the record to its largest element.
+def record_layout(channels) -> struct.Struct:
+    endian = ">" if channels and all(channel.big_endian for channel in channels) else "<"
+    if any(channel.big_endian != (endian == ">") for channel in channels):
+        raise ValueError("Mixed endian scan elements are not supported.")
+    fmt = endian
+    offset = 0
+    largest = 1
+    for channel in sorted(channels, key=lambda channel: channel.index):
+        size = channel.storage // 8
+        largest = max(largest, size)
+        padding = -offset % size
+        fmt += "x" * padding + STORAGE_FORMATS[(channel.storage, channel.signed)]
+        offset += padding + size
+    fmt += "x" * (-offset % largest)
+    return struct.Struct(fmt)
+
+
+class SampleRing:
+    """Preallocated ring of decoded samples, one row of floats per sample."""
+
+    def __init__(self, capacity, width):
+        self.capacity = capacity
+        self.width = width
+        self.data = array("d", bytes(8 * capacity * width))
+        self.view = memoryview(self.data)
+        self.count = 0
+
+    # Copies count rows from a flat view of doubles, wrapping at the end.
+    def extend(self, rows, count):
+        width = self.width
+        if count > self.capacity:
+            # Only the newest rows fit.
+            rows = rows[(count - self.capacity) * width:count * width]
+            self.count += count - self.capacity
+            count = self.capacity
+        start = self.count % self.capacity
+        first = min(count, self.capacity - start)
+        self.view[start * width:(start + first) * width] = rows[:first * width]
+        if first < count:
+            self.view[:(count - first) * width] = rows[first * width:count * width]
+        self.count += count
+
+    # Returns the first and end sample numbers written after cursor, for
+    # reading data in place. The row of a sample starts at
+    # (sample % capacity) * width. Rows overwritten before being read are
+    # skipped.
+    def unread(self, cursor) -> tuple:
+        return max(cursor, self.count - self.capacity), self.count
+
+    # Copies out the rows written after cursor and returns them with the
+    # cursor to use next time.
+    def read_since(self, cursor) -> tuple:
+        first, end = self.unread(cursor)
+        rows = []
+        for sample in range(first, end):
+            start = (sample % self.capacity) * self.width
+            rows.append(self.data[start:start + self.width])
+        return rows, end
+
+
+class IIOReader:
+    """Reads scan records from an IIO buffer character device, or any file or
+    FIFO carrying the same record layout."""
+
+    def __init__(self, path, channels, capacity=2048, chunk=64, on_eof=None):
+        self.path = path
+        self.on_eof = on_eof
+        self.channels = sorted(channels, key=lambda channel: channel.index)
+        self.layout = record_layout(self.channels)
+        self.ring = SampleRing(capacity, len(self.channels))
+        self.buffer = bytearray(self.layout.size * chunk)
+        self.view = memoryview(self.buffer)
+        self.pending = 0
+        self.fd = None
+        self.loop = None
+        self.listeners = []
+        # Decoded rows of the chunk being read, before they go into the ring.
+        self.scratch = memoryview(array("d", bytes(8 * len(self.channels) * chunk)))
+        # Structs unpacking a whole chunk of records in one call, by record count.
+        self.chunk_layouts = {}
+
+    def open(self):
+        self.fd = os.open(self.path, os.O_RDONLY | os.O_NONBLOCK)
+
+    def close(self):
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+
+    # Reads everything currently available and decodes it a chunk at a time.
+    # Returns the number of samples decoded.
+    def read_available(self) -> int:
+        decoded = 0
+        size = self.layout.size
+        while True:
+            try:
+                count = os.readv(self.fd, [self.view[self.pending:]])
+            except BlockingIOError:
+                break
+            if count == 0:
+                # The writer of a FIFO or file went away. The fd stays
+                # readable at EOF, so keeping the reader would spin the loop.
+                self.stop()
+                if self.on_eof:
+                    self.on_eof()
+                break
+            available = self.pending + count
+            whole = available - available % size
+            decoded += self.decode(self.view[:whole])
+
+            # Carry a partial record over to the next read.
+            self.pending = available - whole
+            if self.pending:
+                self.buffer[:self.pending] = self.buffer[whole:available]
+            if available < len(self.buffer):
+                break
+        if decoded:
+            for listener in self.listeners:
+                listener(self)
+        return decoded
+
+    def chunk_layout(self, count) -> struct.Struct:
+        layout = self.chunk_layouts.get(count)
+        if layout is None:
+            fmt = self.layout.format
+            layout = self.chunk_layouts[count] = struct.Struct(fmt[0] + fmt[1:] * count)
+        return layout
+
+    # Unpacks every record in one call, converts each channel as a column
+    # into the scratch rows, then copies them into the ring.
+    def decode(self, records) -> int:
+        count = len(records) // self.layout.size
+        if not count:
+            return 0
+        values = self.chunk_layout(count).unpack(records)
+        width = len(self.channels)
+        end = count * width
+        for position, channel in enumerate(self.channels):
+            column = values[position::width]
+            if channel.needs_fixup():
+                column = channel.fixup(column)
+            self.scratch[position:end:width] = array("d", channel.convert(column))
+        self.ring.extend(self.scratch, count)
+        return count
+
+    def start(self, loop=None):
+        if self.fd is None:
+            self.open()
+        self.loop = loop or asyncio.get_event_loop()
+        self.loop.add_reader(self.fd, self.read_available)
+
+    def stop(self):
+        if self.fd is None:
+            return
+        if self.loop:
+            self.loop.remove_reader(self.fd)
+            self.loop = None
+        self.close()
+
+
+def read_attr(path, default=None):
+    try:
+        with open(path, "r") as f:
+            return f.read().strip()
+    except OSError:
+        return default
+
+
+def write_attr(path, value):
+    with open(path, "w") as f:
+        f.write(str(value))
+
+
+# Finds the first IIO device exposing both gyro and accelerometer scan elements.
+def find_imu(sysfs_path=IIO_SYSFS_PATH) -> Path | None:
+    if not sysfs_path.exists():
+        return None
+    for device in sorted(sysfs_path.glob("iio:device*")):
+        scan_elements = device / "scan_elements"
+        if (scan_elements / "in_anglvel_x_en").exists() and (scan_elements / "in_accel_x_en").exists():
+            return device
+    return None
+
+
+# Enables the IMU scan elements, attaches a trigger and starts the buffer.
+# Returns the channels in the order they appear in each record.
+def setup_buffer(device, rate, watermark) -> list:
+    scan_elements = device / "scan_elements"
+    write_attr(device / "buffer" / "enable", 0)
+
+    for element in scan_elements.glob("*_en"):
+        write_attr(element, 0)
+
+    channels = []
+    for name in IMU_CHANNELS:
+        prefix = scan_elements / f"in_{name}"
+        if not Path(f"{prefix}_en").exists():
+            continue
+        write_attr(f"{prefix}_en", 1)
+        kind = name.split("_")[0]
+        if kind == "timestamp":
+            scale = 1e-9
+        else:
+            scale = float(read_attr(device / f"in_{name}_scale", None) or read_attr(device / f"in_{kind}_scale", "1"))
+        offset = float(read_attr(device / f"in_{kind}_offset", "0"))
+        channels.append(Channel(name, int(read_attr(f"{prefix}_index")), read_attr(f"{prefix}_type"), scale, offset))
+
+    for kind in ("anglvel", "accel"):
+        frequency = device / f"in_{kind}_sampling_frequency"
+        if frequency.exists():
+            write_attr(frequency, rate)
+
+    # Devices without a hardware trigger need one from the sysfs or hrtimer drivers.
+    trigger = device / "trigger" / "current_trigger"
+    if trigger.exists() and not read_attr(trigger):
+        name = read_attr(device / "name", "")
+        for candidate in sorted(IIO_SYSFS_PATH.glob("trigger*")):
+            if read_attr(candidate / "name", "").startswith(name):
+                write_attr(trigger, read_attr(candidate / "name"))
+                break
+
+    write_attr(device / "buffer" / "length", max(watermark * 8, 128))
+    if (device / "buffer" / "watermark").exists():
+        write_attr(device / "buffer" / "watermark", watermark)
+    write_attr(device / "buffer" / "enable", 1)
+    return channels
+
+
+def teardown_buffer(device):
+    try:
+        write_attr(device / "buffer" / "enable", 0)
+    except OSError:
+        pass
+
+
+class ImuSource:
+    """Owns the IIO device while gyro input is enabled."""
+
+    def __init__(self, handycon, settings: dict):
+        self.handycon = handycon
+        self.settings = settings
+        self.device = None
+        self.reader = None
+        self.listeners = []
+
+    @property
+    def enabled(self) -> bool:
+        # The reader closes itself if its stream ends.
+        return self.reader is not None and self.reader.fd is not None
+
+    def update(self, settings: dict):
+        self.settings = settings
+
+    def toggle(self):
+        if self.enabled:
+            self.stop()
+        else:
+            self.start()
+
+    def start(self):
+        self.device = find_imu()
+        if self.device is None:
+            self.handycon.logger.warn("No IIO gyro/accelerometer found. Gyro is unavailable.")
+            return
+        try:
+            channels = setup_buffer(self.device, self.settings["rate"], self.settings["watermark"])
+            self.reader = IIOReader(IIO_DEV_PATH / self.device.name, channels, on_eof=self.ended)
+            self.reader.listeners.extend(self.listeners)
+            self.reader.start()
+        except (OSError, ValueError) as err:
+            self.handycon.logger.error(f"{err} | Unable to start IIO buffer on {self.device}.")
+            teardown_buffer(self.device)
+            self.reader = None
+            return
+        self.handycon.logger.info(f"Gyro enabled from {self.device.name} at {self.settings['rate']} Hz.")
+
+    # The reader has already closed itself. Releases the gyro output so it
+    # doesn't hold its last value.
+    def ended(self):
+        self.handycon.logger.warn(f"IMU stream {self.reader.path} ended. Gyro disabled.")
+        teardown_buffer(self.device)
+        if self.handycon.fusion:
+            self.handycon.fusion.stop()
+
+    def stop(self):
+        if self.reader:
+            self.reader.stop()
+            self.reader = None
+        if self.device:
+            teardown_buffer(self.device)
+        self.handycon.logger.info("Gyro disabled.")
+
+
+# Reads and validates the [Gyro] config section.
+def compile_imu(section) -> dict:
+    settings = {}
+    try:
+        for key, default in IMU_DEFAULTS.items():
+            settings[key] = section.getint(key, default)
+    except ValueError as err:
+        raise ValueError(f"Invalid value in [Gyro]: {err}")
+    if not 1 <= settings["rate"] <= 4000:
+        raise ValueError("Gyro rate must be between 1 and 4000 Hz.")
+    if settings["watermark"] < 1:
+        raise ValueError("Gyro watermark must be at least 1.")
+    return settings
+
+
+def get_default_config() -> dict:
+    return dict(IMU_DEFAULTS)
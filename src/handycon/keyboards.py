@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+# This file is part of Handheld Game Console Controller System (HandyGCCS)
+# Copyright 2022-2023 Derek J. Clark <derekjohn.clark@gmail.com>
+
+# Python Modules
+import logging
+
+## Local modules
+from .constants import *
+from . import devices
+from . import trace
+
+## Partial imports
+from evdev import ecodes as e
+from pathlib import Path
+from shutil import move
+
+handycon = None
+
+def set_handycon(handheld_controller):
+    global handycon
+    handycon = handheld_controller
+
+
+class KeyboardSource:
+    """One keyboard interface a handheld reports its extra buttons on."""
+
+    def __init__(self, role, name, phys, handler):
+        self.role = role
+        self.name = name
+        self.phys = phys
+        self.handler = handler
+        self.device = None
+        self.event = None
+        self.path = None
+        self.keys = set()
+        self.trace_source = trace.KEYBOARD
+
+
+# Declares a keyboard source. The handler is awaited with each event and the
+# merged key state of every source. It defaults to the handheld's process_event.
+def add_keyboard(role, name, phys, handler=None) -> KeyboardSource:
+    global handycon
+
+    source = KeyboardSource(role, name, phys, handler or handycon.system_handler.process_event)
+    source.trace_source = trace.KEYBOARD + len(handycon.keyboard_sources)
+    handycon.keyboard_sources.append(source)
+    return source
+
+
+# Keys held across all sources, in the sorted order handheld chords are written in.
+def merged_keys() -> list:
+    global handycon
+
+    keys = set()
+    for source in handycon.keyboard_sources:
+        keys |= source.keys
+    return sorted(keys)
+
+
+def grab(source):
+    global handycon
+
+    handycon.logger.debug(f"Attempting to grab {source.name} ({source.role}).")
+    try:
+        # Grab the built-in devices. This will give us exclusive acces to the devices and their capabilities.
+        device = devices.find_device(source.role, source.name, source.phys)
+        if device:
+            source.path = device.path
+            source.device = device
+            source.keys = set(device.active_keys())
+            if handycon.CAPTURE_KEYBOARD:
+                source.device.grab()
+                source.event = Path(source.path).name
+                move(source.path, str(HIDE_PATH / source.event))
+
+        # Sometimes the service loads before all input devices have full initialized. Try a few times.
+        if not source.device:
+            handycon.logger.warn(f"Keyboard device {source.role} not yet found. Restarting scan.")
+            return False
+        else:
+            handycon.logger.info(f"Found {source.device.name} ({source.role}). Capturing input data.")
+            return True
+
+    # Some funky stuff happens sometimes when booting. Give it another shot.
+    except Exception as err:
+        handycon.logger.error("Error when scanning event devices. Restarting scan.")
+        return False
+
+
+def release(source):
+    if source.device and handycon.CAPTURE_KEYBOARD:
+        try:
+            source.device.ungrab()
+        except IOError as err:
+            pass
+    if source.event:
+        devices.restore_device(source.event, source.path)
+    source.device = None
+    source.event = None
+    source.path = None
+    source.keys = set()
+
+
+# Captures keyboard events and translates them to virtual device events.
+async def capture_events(source):
+    global handycon
+
+    # Capture keyboard events and translate them to mapped events.
+    while handycon.running:
+        if source.device:
+            handycon.readiness.acquired(source.role)
+            handycon.resume.acquired(source.role)
+            try:
+                async for seed_event in source.device.async_read_loop():
+                    handycon.idle.touch()
+                    handycon.trace.record(trace.INPUT, source.trace_source, seed_event.type, seed_event.code, seed_event.value)
+                    if handycon.resume.awaiting_input:
+                        handycon.resume.first_input(source.role)
+                    # Track key state from the events themselves rather than
+                    # asking the kernel, which may already be ahead of this event.
+                    if seed_event.type == e.EV_KEY:
+                        if seed_event.value:
+                            source.keys.add(seed_event.code)
+                        else:
+                            source.keys.discard(seed_event.code)
+                    active_keys = merged_keys()
+
+                    # Debugging variables
+                    if handycon.logger.isEnabledFor(logging.DEBUG):
+                        handycon.logger.debug("Seed Value: %s, Seed Code: %s, Seed Type: %s.", seed_event.value, seed_event.code, seed_event.type)
+                        if active_keys != []:
+                            handycon.logger.debug("Active Keys: %s", active_keys)
+                        else:
+                            handycon.logger.debug("No active keys")
+                        if handycon.event_queue != []:
+                            # Copied since the queue changes before the record is formatted.
+                            handycon.logger.debug("Queued events: %s", list(handycon.event_queue))
+                        else:
+                            handycon.logger.debug("No active events.")
+
+                    # Capture keyboard events and translate them to mapped events.
+                    await source.handler(seed_event, active_keys)
+                    if handycon.event_queue.expire(active_keys):
+                        handycon.trace.record(trace.DECISION, source.trace_source, trace.EXPIRED, 0, len(handycon.event_queue))
+                        handycon.logger.debug("Expired stale queued events. Queue: %s", list(handycon.event_queue))
+                    if handycon.pending_config:
+                        handycon.apply_pending_config()
+
+            except Exception as err:
+                handycon.logger.error(f"{err} | Error reading events from {source.device.name} ({source.role})")
+                handycon.dump_trace()
+                handycon.resume.check()
+                devices.close_device(source.device)
+                release(source)
+                handycon.readiness.lost(source.role)
+        else:
+            handycon.logger.info(f"Attempting to grab keyboard device {source.role}...")
+            marker = handycon.idle.device_marker()
+            if not grab(source):
+                await handycon.idle.wait_for_device(marker)
@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+# This file is part of Handheld Game Console Controller System (HandyGCCS)
+# Copyright 2022-2023 Derek J. Clark <derekjohn.clark@gmail.com>
+
+# Python Modules
+import glob
+import os
+
+EPP_VALUES = ("default", "performance", "balance_performance", "balance_power", "power")
+GPU_LEVELS = ("auto", "low", "high", "manual", "profile_standard", "profile_min_sclk",
+        "profile_min_mclk", "profile_peak")
+# throttle_thermal_policy on asus-nb-wmi: 0 balanced, 1 turbo, 2 silent.
+THERMAL_POLICIES = (0, 1, 2)
+# cpus value that brings every core online. Filled in for speeds that leave
+# cpus unset when another speed parks cores.
+ALL_CPUS = None
+
+
+# Online files by cpu number. cpu0 is left out since it can't be parked.
+def cpu_online_paths(root) -> dict:
+    paths = {}
+    for path in glob.glob(os.path.join(root, "sys/devices/system/cpu/cpu[0-9]*/online")):
+        number = int(os.path.basename(os.path.dirname(path))[3:])
+        if number:
+            paths[number] = path
+    return paths
+
+
+# Each knob returns the (path, value) writes for a setting. Paths are relative
+# to root so a stand-in sysfs tree can be used.
+def platform_profile_writes(root, value) -> list:
+    return [(os.path.join(root, "sys/firmware/acpi/platform_profile"), value)]
+
+
+def thermal_policy_writes(root, value) -> list:
+    return [(os.path.join(root, "sys/devices/platform/asus-nb-wmi/throttle_thermal_policy"), str(value))]
+
+
+# Keeps the first value cpus online and parks the rest.
+def cpus_writes(root, value) -> list:
+    return [(path, "1" if value is ALL_CPUS or number < value else "0")
+            for number, path in sorted(cpu_online_paths(root).items())]
+
+
+# EPP can only be written to online cores, so this knob runs after cpus.
+def epp_writes(root, value) -> list:
+    writes = []
+    for path in sorted(glob.glob(os.path.join(root, "sys/devices/system/cpu/cpu[0-9]*/cpufreq/energy_performance_preference"))):
+        online = os.path.join(os.path.dirname(os.path.dirname(path)), "online")
+        if os.path.exists(online) and read_value(online) == "0":
+            continue
+        writes.append((path, value))
+    return writes
+
+
+def gpu_level_writes(root, value) -> list:
+    writes = []
+    for path in sorted(glob.glob(os.path.join(root, "sys/class/drm/card[0-9]*/device/power_dpm_force_performance_level"))):
+        writes.append((path, value))
+    return writes
+
+
+# Knobs are applied in this order.
+KNOBS = {
+    "platform_profile": platform_profile_writes,
+    "thermal_policy": thermal_policy_writes,
+    "cpus": cpus_writes,
+    "epp": epp_writes,
+    "gpu_level": gpu_level_writes,
+}
+
+
+def read_value(path) -> str:
+    with open(path, "r") as f:
+        return f.read().strip()
+
+
+# Reads back what a write left behind. Some files list every choice with the
+# active one in brackets.
+def active_value(text) -> str:
+    if "[" in text:
+        return text.split("[", 1)[1].split("]", 1)[0]
+    return text
+
+
+# Validates the knobs of one turbo speed.
+def compile_knobs(knobs) -> dict:
+    if not isinstance(knobs, dict):
+        raise ValueError("Turbo knobs must be a mapping of knob settings.")
+    compiled = {}
+    for name, value in knobs.items():
+        if name not in KNOBS:
+            raise ValueError(f"Unknown turbo knob {name}. Expected one of {', '.join(KNOBS)}.")
+        if name == "epp" and value not in EPP_VALUES:
+            raise ValueError(f"Invalid epp {value}. Expected one of {', '.join(EPP_VALUES)}.")
+        if name == "gpu_level" and value not in GPU_LEVELS:
+            raise ValueError(f"Invalid gpu_level {value}. Expected one of {', '.join(GPU_LEVELS)}.")
+        if name == "thermal_policy" and value not in THERMAL_POLICIES:
+            raise ValueError(f"Invalid thermal_policy {value}. Expected 0, 1 or 2.")
+        if name == "cpus" and (not isinstance(value, int) or value < 1):
+            raise ValueError(f"Invalid cpus {value}. Expected a count of at least 1.")
+        if name == "platform_profile" and not isinstance(value, str):
+            raise ValueError(f"Invalid platform_profile {value}.")
+        compiled[name] = value
+    return compiled
+
+
+# Writes each knob in KNOBS order and reads it back. Returns a list of failure
+# messages, including knobs this system doesn't have.
+def apply_knobs(knobs, root="/") -> list:
+    failures = []
+    for name, writes_for in KNOBS.items():
+        if name not in knobs:
+            continue
+        writes = [(path, value) for path, value in writes_for(root, knobs[name]) if os.path.exists(path)]
+        if not writes:
+            failures.append(f"{name} is not supported on this system")
+            continue
+        for path, value in writes:
+            try:
+                # Skip files already at the value. Parking cores is slow.
+                if active_value(read_value(path)) == value:
+                    continue
+                with open(path, "w") as f:
+                    f.write(value)
+                actual = active_value(read_value(path))
+            except OSError as err:
+                failures.append(f"{name}: {err}")
+                continue
+            if actual != value:
+                failures.append(f"{name}: {path} reads back {actual}, expected {value}")
+    return failures
@@ -0,0 +1,48 @@
+#!/usr/bin/env python3
+# This file is part of Handheld Game Console Controller System (HandyGCCS)
+# Copyright 2022-2023 Derek J. Clark <derekjohn.clark@gmail.com>
+
+# Python Modules
+import logging
+import logging.handlers
+import os
+import queue
+
+LOG_FORMAT = "[%(asctime)s | %(filename)s:%(lineno)s:%(funcName)s] %(message)s"
+LOG_DATE_FORMAT = "%y%m%d_%H:%M:%S"
+LOG_LEVELS = ("DEBUG", "INFO", "WARNING", "ERROR", "CRITICAL")
+DEFAULT_LOG_LEVEL = "INFO"
+
+
+class DeferredQueueHandler(logging.handlers.QueueHandler):
+    """Queues records as they are, so the message is formatted on the
+    listener thread instead of the thread that logged it. Callers pass
+    arguments that won't change before then."""
+
+    def prepare(self, record):
+        return record
+
+
+# The level from the command line, then HANDYCON_LOG_LEVEL, then the default.
+def resolve_level(level=None) -> str:
+    level = (level or os.environ.get("HANDYCON_LOG_LEVEL") or DEFAULT_LOG_LEVEL).upper()
+    if level not in LOG_LEVELS:
+        raise ValueError(f"Invalid log level {level}. Expected one of {', '.join(LOG_LEVELS)}.")
+    return level
+
+
+# Routes every log record through a queue to a background thread that formats
+# and writes it. Returns the listener, which must be stopped to flush.
+def setup_logging(level) -> logging.handlers.QueueListener:
+    records = queue.SimpleQueue()
+    output = logging.StreamHandler()
+    output.setFormatter(logging.Formatter(LOG_FORMAT, LOG_DATE_FORMAT))
+    listener = logging.handlers.QueueListener(records, output, respect_handler_level=True)
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(DeferredQueueHandler(records))
+    root.setLevel(level)
+    listener.start()
+    return listener
@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+# This file is part of Handheld Game Console Controller System (HandyGCCS)
+# Copyright 2022-2023 Derek J. Clark <derekjohn.clark@gmail.com>
+
+# Python Modules
+import asyncio
+import math
+
+## Local modules
+from .constants import *
+
+## Partial imports
+from evdev import ecodes as e, UInput
+
+MOUSE_STICKS = {
+    "left": (e.ABS_X, e.ABS_Y),
+    "right": (e.ABS_RX, e.ABS_RY),
+}
+MOUSE_DEFAULTS = {
+    "stick": "right",
+    "rate": 500,
+    "speed": 1200.0,
+    "acceleration": 2.0,
+    "deadzone": 0.1,
+    "left_click": "BTN_TR",
+    "right_click": "BTN_TL",
+    "middle_click": "BTN_THUMBR",
+}
+MOUSE_CLICKS = {
+    "left_click": e.BTN_LEFT,
+    "right_click": e.BTN_RIGHT,
+    "middle_click": e.BTN_MIDDLE,
+}
+
+
+class MouseMode:
+    """Drives a virtual mouse from a controller stick on a fixed rate timer."""
+
+    def __init__(self, handycon, settings: dict):
+        self.handycon = handycon
+        self.device = None
+        self.enabled = False
+        self.task = None
+        self.moving = asyncio.Event()
+        self.x = 0
+        self.y = 0
+        self.remainder_x = 0.0
+        self.remainder_y = 0.0
+        self.update(settings)
+
+    def update(self, settings: dict):
+        self.settings = settings
+        self.axes = MOUSE_STICKS[settings["stick"]]
+        self.clicks = {settings[name]: button for name, button in MOUSE_CLICKS.items()}
+        self.period = 1.0 / settings["rate"]
+        self.deadzone = settings["deadzone"] * JOY_MAX
+
+    def toggle(self):
+        if self.enabled:
+            self.disable()
+        else:
+            self.enable()
+
+    def ensure_device(self):
+        if self.device is None:
+            self.device = UInput(MOUSE_EVENTS, name='Handheld Controller Mouse', bustype=0x3)
+
+    def enable(self):
+        self.ensure_device()
+
+        # Center the gamepad stick so games don't see it held while it drives the mouse.
+        for code in self.axes:
+            self.handycon.ui_device.write(e.EV_ABS, code, 0)
+        self.handycon.ui_device.syn()
+
+        self.enabled = True
+        self.x = self.y = 0
+        self.remainder_x = self.remainder_y = 0.0
+        self.task = asyncio.ensure_future(self.run())
+        self.handycon.logger.info("Mouse mode enabled.")
+
+    def disable(self):
+        self.enabled = False
+        self.moving.set()
+        if self.task:
+            self.task.cancel()
+            self.task = None
+        if self.device:
+            for button in MOUSE_CLICKS.values():
+                self.device.write(e.EV_KEY, button, 0)
+            self.device.syn()
+        self.handycon.logger.info("Mouse mode disabled.")
+
+    # Consumes controller events that belong to the mouse. Returns True if the
+    # event should not be forwarded to the virtual controller.
+    def capture(self, event) -> bool:
+        if event.type == e.EV_ABS and event.code in self.axes:
+            if event.code == self.axes[0]:
+                self.x = event.value
+            else:
+                self.y = event.value
+            if abs(self.x) > self.deadzone or abs(self.y) > self.deadzone:
+                self.moving.set()
+            return True
+        if event.type == e.EV_KEY and event.code in self.clicks:
+            self.device.write(e.EV_KEY, self.clicks[event.code], event.value)
+            self.device.syn()
+            return True
+        return False
+
+    # Moves the cursor by one timer step.
+    def step(self, dt):
+        magnitude = math.hypot(self.x, self.y)
+        if magnitude <= self.deadzone:
+            return False
+        deflection = min((magnitude - self.deadzone) / (JOY_MAX - self.deadzone), 1.0)
+        velocity = self.settings["speed"] * deflection ** self.settings["acceleration"] / magnitude
+
+        self.move_by(self.x * velocity * dt, self.y * velocity * dt)
+        return True
+
+    # Moves the cursor by a fractional amount, carrying sub-pixel motion forward.
+    def move_by(self, fx, fy):
+        self.remainder_x += fx
+        self.remainder_y += fy
+        dx = int(self.remainder_x)
+        dy = int(self.remainder_y)
+        self.remainder_x -= dx
+        self.remainder_y -= dy
+        if dx or dy:
+            self.device.write(e.EV_REL, e.REL_X, dx)
+            self.device.write(e.EV_REL, e.REL_Y, dy)
+            self.device.syn()
+
+    # Integrates on absolute monotonic deadlines so timer jitter never
+    # accumulates into drift. The task parks on an event while the stick rests
+    # inside the deadzone.
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        deadline = loop.time()
+        while self.enabled:
+            if not self.step(self.period):
+                self.moving.clear()
+                self.remainder_x = self.remainder_y = 0.0
+                await self.moving.wait()
+                deadline = loop.time()
+                continue
+
+            deadline += self.period
+            delay = deadline - loop.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            elif delay < -self.period:
+                # We fell more than a step behind. Resync instead of bursting.
+                deadline = loop.time()
+
+
+# Reads and validates the [Mouse] config section.
+def compile_mouse(section) -> dict:
+    settings = {}
+    try:
+        settings["stick"] = section.get("stick", MOUSE_DEFAULTS["stick"])
+        settings["rate"] = section.getint("rate", MOUSE_DEFAULTS["rate"])
+        for key in ("speed", "acceleration", "deadzone"):
+            settings[key] = section.getfloat(key, MOUSE_DEFAULTS[key])
+    except ValueError as err:
+        raise ValueError(f"Invalid value in [Mouse]: {err}")
+    for key in MOUSE_CLICKS:
+        button = section.get(key, MOUSE_DEFAULTS[key])
+        if button not in e.ecodes:
+            raise ValueError(f"Unknown button {button} for {key} in [Mouse].")
+        settings[key] = e.ecodes[button]
+
+    if settings["stick"] not in MOUSE_STICKS:
+        raise ValueError(f"Unknown stick {settings['stick']} in [Mouse].")
+    if not 1 <= settings["rate"] <= 1000:
+        raise ValueError("Mouse rate must be between 1 and 1000 Hz.")
+    if not 0.0 <= settings["deadzone"] < 1.0:
+        raise ValueError("Mouse deadzone must be between 0 and 1.")
+    if settings["acceleration"] <= 0.0:
+        raise ValueError("Mouse acceleration must be greater than 0.")
+    return settings
+
+
+def get_default_config() -> dict:
+    return dict(MOUSE_DEFAULTS)
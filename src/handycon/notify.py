@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+# This file is part of Handheld Game Console Controller System (HandyGCCS)
+# Copyright 2022-2023 Derek J. Clark <derekjohn.clark@gmail.com>
+
+# Python Modules
+import asyncio
+import os
+import socket
+import time
+
+# Every input device is searched for at DETECT_DELAY until this many seconds
+# after startup. After that, missing devices are only retried when a node
+# appears in /dev/input.
+ACQUIRE_TIMEOUT = 5.0
+
+
+# Sends a state update to systemd. Does nothing outside a notify service.
+def sd_notify(*states) -> bool:
+    address = os.environ.get("NOTIFY_SOCKET")
+    if not address:
+        return False
+    if address.startswith("@"):
+        # Abstract namespace socket.
+        address = "\0" + address[1:]
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM | socket.SOCK_CLOEXEC) as sock:
+            sock.sendto("\n".join(states).encode(), address)
+    except OSError:
+        return False
+    return True
+
+
+class Readiness:
+    """Tracks which input devices are still being acquired and reports it to
+    systemd. The service is ready once the controller is forwarding."""
+
+    def __init__(self, handycon, timeout=ACQUIRE_TIMEOUT):
+        self.handycon = handycon
+        self.timeout = timeout
+        self.deadline = time.monotonic() + timeout
+        self.pending = set()
+        self.ready = False
+        self.handle = None
+
+    def expect(self, role):
+        self.pending.add(role)
+
+    def start(self):
+        self.deadline = time.monotonic() + self.timeout
+        self.handle = asyncio.get_event_loop().call_later(self.timeout, self.expire)
+        self.report()
+
+    # A process that handed over its devices isn't the service any more, so
+    # it leaves systemd alone.
+    def stop(self, notify=True):
+        if self.handle:
+            self.handle.cancel()
+            self.handle = None
+        if notify:
+            sd_notify("STOPPING=1")
+
+    # True until the deadline, while missing devices are still polled for.
+    def polling(self) -> bool:
+        return time.monotonic() < self.deadline
+
+    def acquired(self, role):
+        if role not in self.pending:
+            return
+        self.pending.discard(role)
+        if role == "controller" and not self.ready:
+            self.ready = True
+            sd_notify("READY=1")
+        self.report()
+
+    def lost(self, role):
+        if role in self.pending:
+            return
+        self.pending.add(role)
+        self.report()
+
+    def report(self):
+        if not self.pending:
+            status = "Forwarding. All input devices acquired."
+        elif "controller" in self.pending:
+            status = f"{'Not forwarding' if self.ready else 'Starting'}. Waiting for: {', '.join(sorted(self.pending))}"
+        else:
+            status = f"Forwarding. Waiting for: {', '.join(sorted(self.pending))}"
+        sd_notify(f"STATUS={status}")
+
+    # At the deadline, report what is missing. A handheld without its
+    # controller still signals ready so systemd doesn't kill the service.
+    def expire(self):
+        self.handle = None
+        if not self.pending:
+            return
+        self.handycon.logger.warn(f"Input devices not found after {self.timeout:.0f}s: {', '.join(sorted(self.pending))}")
+        if not self.ready:
+            self.ready = True
+            sd_notify("READY=1")
+        self.report()
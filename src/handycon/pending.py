@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+# This file is part of Handheld Game Console Controller System (HandyGCCS)
+# Copyright 2022-2023 Derek J. Clark <derekjohn.clark@gmail.com>
+
+# Python Modules
+import time
+
+# No handheld has more than a few chords in flight at once.
+PENDING_LIMIT = 8
+# Entries still queued this long after every key was released missed their
+# release path and are dropped.
+STALE_AFTER = 2.0
+
+
+class PendingActions:
+    """Button actions waiting for their chord to be released.
+
+    Behaves like the list the handheld modules have always used, but never
+    holds more than limit entries or the same entry twice, and drops entries
+    left behind once no keys are held."""
+
+    def __init__(self, limit=PENDING_LIMIT, stale_after=STALE_AFTER, clock=time.monotonic):
+        self.limit = limit
+        self.stale_after = stale_after
+        self.clock = clock
+        self.entries = []
+        self.stamps = []
+        self.dropped = 0
+        self.expired = 0
+
+    def append(self, action):
+        if action in self.entries:
+            return
+        if len(self.entries) >= self.limit:
+            del self.entries[0]
+            del self.stamps[0]
+            self.dropped += 1
+        self.entries.append(action)
+        self.stamps.append(self.clock())
+
+    # Removing an entry that is already gone is not an error, so a release
+    # path that races an expiry can't take down the keyboard loop.
+    def remove(self, action):
+        try:
+            index = self.entries.index(action)
+        except ValueError:
+            return
+        del self.entries[index]
+        del self.stamps[index]
+
+    def clear(self):
+        self.entries.clear()
+        self.stamps.clear()
+
+    # Drops stale entries. Called after each keyboard event with the keys
+    # still held; nothing expires while any key is down.
+    def expire(self, active_keys) -> int:
+        if active_keys or not self.entries:
+            return 0
+        cutoff = self.clock() - self.stale_after
+        if self.stamps[0] > cutoff:
+            return 0
+        keep = [index for index, stamp in enumerate(self.stamps) if stamp > cutoff]
+        expired = len(self.entries) - len(keep)
+        self.entries = [self.entries[index] for index in keep]
+        self.stamps = [self.stamps[index] for index in keep]
+        self.expired += expired
+        return expired
+
+    def __contains__(self, action) -> bool:
+        return action in self.entries
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def __iter__(self):
+        return iter(self.entries)
+
+    def __getitem__(self, index):
+        return self.entries[index]
+
+    def __eq__(self, other) -> bool:
+        if isinstance(other, PendingActions):
+            return self.entries == other.entries
+        return self.entries == other
+
+    def __repr__(self) -> str:
+        return repr(self.entries)
@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+# This file is part of Handheld Game Console Controller System (HandyGCCS)
+# Copyright 2022-2023 Derek J. Clark <derekjohn.clark@gmail.com>
+
+# Python Modules
+import asyncio
+import os
+import sys
+import threading
+import time
+
+## Local modules
+from .constants import PROFILE_HZ
+
+## Partial imports
+from collections import Counter
+
+PROFILE_DIR = "/var/log/handygccs"
+# The loop waiting in one of these is idle, not busy.
+IDLE_FRAMES = {("selectors.py", "select"), ("selectors.py", "poll")}
+
+
+class SamplingProfiler:
+    """Samples the event loop thread's stack from another thread and counts
+    each distinct stack. Stacks are rooted at the task that was running, so a
+    flame graph splits by coroutine.
+
+    The result is written in collapsed stack format, one
+    'frame;frame;frame count' line per stack, as read by flamegraph.pl."""
+
+    def __init__(self, handycon, hz=PROFILE_HZ):
+        self.handycon = handycon
+        self.hz = hz
+        self.loop = None
+        self.loop_thread = None
+        self.thread = None
+        self.stopping = threading.Event()
+        self.stacks = Counter()
+        self.samples = 0
+        self.started = 0.0
+
+    def running(self) -> bool:
+        return self.thread is not None
+
+    # Called from the loop, for instance on SIGUSR2.
+    def toggle(self):
+        if self.running():
+            self.stop()
+        else:
+            self.start()
+
+    def start(self):
+        self.loop = asyncio.get_event_loop()
+        self.loop_thread = threading.get_ident()
+        self.stacks = Counter()
+        self.samples = 0
+        self.started = time.monotonic()
+        self.stopping.clear()
+        self.thread = threading.Thread(target=self.run, name="profiler", daemon=True)
+        self.thread.start()
+        self.handycon.logger.info(f"Profiling the event loop at {self.hz} Hz. Send SIGUSR2 again to stop.")
+
+    def stop(self, path=None) -> str | None:
+        if not self.running():
+            return None
+        self.stopping.set()
+        self.thread.join()
+        self.thread = None
+        try:
+            path = self.write(path)
+        except OSError as err:
+            self.handycon.logger.error(f"{err} | Unable to write the profile.")
+            return None
+        self.handycon.logger.info(f"Wrote {self.samples} samples over {time.monotonic() - self.started:.1f}s to {path}.")
+        return path
+
+    def tag(self) -> str:
+        try:
+            task = asyncio.current_task(self.loop)
+        except RuntimeError:
+            task = None
+        if task is None:
+            return "callbacks"
+        coro = task.get_coro()
+        return getattr(coro, "__qualname__", task.get_name())
+
+    def sample(self):
+        frame = sys._current_frames().get(self.loop_thread)
+        if frame is None:
+            return
+        tag = self.tag()
+        stack = []
+        while frame is not None:
+            code = frame.f_code
+            stack.append(f"{os.path.basename(code.co_filename)}:{getattr(code, 'co_qualname', code.co_name)}")
+            frame = frame.f_back
+        innermost = stack[0].split(":", 1)
+        if tag == "callbacks" and (innermost[0], innermost[1].rsplit(".", 1)[-1]) in IDLE_FRAMES:
+            tag = "idle"
+        stack.append(tag)
+        stack.reverse()
+        self.stacks[";".join(stack)] += 1
+        self.samples += 1
+
+    def run(self):
+        interval = 1 / self.hz
+        deadline = time.monotonic()
+        while True:
+            deadline += interval
+            if self.stopping.wait(max(deadline - time.monotonic(), 0)):
+                return
+            self.sample()
+
+    def write(self, path=None) -> str:
+        if path is None:
+            os.makedirs(PROFILE_DIR, exist_ok=True)
+            path = os.path.join(PROFILE_DIR, f"profile-{time.strftime('%Y%m%d-%H%M%S')}.folded")
+        with open(path, "w") as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+        return path
@@ -0,0 +1,236 @@
+#!/usr/bin/env python3
+# This file is part of Handheld Game Console Controller System (HandyGCCS)
+# Copyright 2022-2023 Derek J. Clark <derekjohn.clark@gmail.com>
+
+# Python Modules
+import marshal
+import os
+
+## Local modules
+from .constants import PROFILE_CACHE_PATH, PROFILE_OVERRIDE_DIR, PROFILES_DIR
+
+## Partial imports
+from evdev import ecodes as e
+
+# Bump when the compiled layout changes so stale caches are rebuilt.
+PROFILE_CACHE_VERSION = 2
+PROFILE_DEFAULTS = {
+    "products": "",
+    "cpu_vendor": "",
+    "button_delay": "0.0",
+    "capture_controller": "true",
+    "capture_keyboard": "true",
+    "capture_power": "true",
+    "gamepad_name": "Microsoft X-Box 360 pad",
+    "gamepad_address": "",
+    "keyboard_name": "AT Translated Set 2 keyboard",
+    "keyboard_address": "isa0060/serio0/input0",
+    "passthrough": "KEY_VOLUMEDOWN, KEY_VOLUMEUP",
+    "powersave": "",
+    "performance": "",
+}
+
+
+# Returns (path, mtime, size) for every profile source. Any change to the
+# sources changes the stamp and invalidates the compiled cache.
+def source_stamp(dirs) -> list:
+    stamp = []
+    for directory in dirs:
+        try:
+            names = sorted(os.listdir(directory))
+        except OSError:
+            continue
+        for name in names:
+            if not name.endswith(".conf"):
+                continue
+            path = os.path.join(directory, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            stamp.append((path, stat.st_mtime_ns, stat.st_size))
+    return stamp
+
+
+# Values may be quoted to keep leading or trailing spaces in device names.
+def unquote(value) -> str:
+    if len(value) >= 2 and value[0] == value[-1] and value[0] in "\"'":
+        return value[1:-1]
+    return value
+
+
+def parse_code(token) -> int:
+    token = token.strip()
+    if token.isdigit():
+        return int(token)
+    if token in e.ecodes:
+        return e.ecodes[token]
+    raise ValueError(f"Unknown key {token}")
+
+
+def parse_codes(value) -> list:
+    return [parse_code(token) for token in value.split(",") if token.strip()]
+
+
+def parse_lines(value) -> list:
+    return [line.strip() for line in value.splitlines() if line.strip()]
+
+
+# Validates one profile and compiles it into plain lists and dicts that
+# marshal can store.
+def compile_profile(name, parser) -> dict:
+    if not parser.has_section("Profile"):
+        raise ValueError("missing [Profile] section")
+    section = parser["Profile"]
+    profile = {"name": name}
+    profile["products"] = [unquote(product.strip()) for product in section["products"].split(",") if product.strip()]
+    if not profile["products"]:
+        raise ValueError("no products listed")
+    profile["cpu_vendor"] = section["cpu_vendor"]
+    profile["button_delay"] = section.getfloat("button_delay")
+    for key in ("capture_controller", "capture_keyboard", "capture_power"):
+        profile[key] = section.getboolean(key)
+    for key in ("gamepad_name", "gamepad_address", "keyboard_name", "keyboard_address"):
+        profile[key] = unquote(section[key])
+    if not profile["gamepad_address"]:
+        raise ValueError("gamepad_address is required")
+    profile["passthrough"] = parse_codes(section["passthrough"])
+    profile["powersave"] = parse_lines(section["powersave"])
+    profile["performance"] = parse_lines(section["performance"])
+
+    # [Button buttonN] sections map chords to entries in the button map. Each
+    # chord alternative is separated by ';' and is matched in sorted order.
+    profile["buttons"] = []
+    profile["keyboards"] = []
+    for section_name in parser.sections():
+        kind, _, target = section_name.partition(" ")
+        if kind == "Button":
+            if not target.startswith("button"):
+                raise ValueError(f"[{section_name}] must name a button map entry")
+            button = parser[section_name]
+            chords = [sorted(parse_codes(chord)) for chord in button.get("keys", "").split(";") if chord.strip()]
+            if not chords:
+                raise ValueError(f"[{section_name}] has no keys")
+            release = parse_codes(button["release"]) if "release" in button else sorted(set().union(*chords))
+            profile["buttons"].append([target, chords, release])
+        elif kind == "Keyboard":
+            keyboard = parser[section_name]
+            if not target or "name" not in keyboard or "phys" not in keyboard:
+                raise ValueError(f"[{section_name}] needs a role, name and phys")
+            profile["keyboards"].append([target, unquote(keyboard["name"]), unquote(keyboard["phys"])])
+        elif section_name != "Profile":
+            raise ValueError(f"unknown section [{section_name}]")
+    return profile
+
+
+# Parses every profile, with a file of the same name in the override
+# directory layered on top of the shipped one. Returns the valid profiles and
+# an error for each invalid one.
+def compile_profiles(dirs) -> tuple:
+    import configparser
+    sources = {}
+    for directory in dirs:
+        try:
+            names = sorted(os.listdir(directory))
+        except OSError:
+            continue
+        for name in names:
+            if name.endswith(".conf"):
+                sources.setdefault(name[:-len(".conf")], []).append(os.path.join(directory, name))
+
+    profiles = []
+    errors = []
+    for name, paths in sorted(sources.items()):
+        parser = configparser.ConfigParser(defaults=PROFILE_DEFAULTS, default_section="Defaults")
+        try:
+            parser.read(paths)
+            profiles.append(compile_profile(name, parser))
+        except (configparser.Error, KeyError, ValueError) as err:
+            errors.append(f"{name}: {err}")
+    return profiles, errors
+
+
+# Loads the compiled profiles, rebuilding the cache only when a source file
+# was added, removed or changed since it was written. Errors in the sources
+# are cached with the profiles so they are reported on every start.
+def load_profiles(dirs=(PROFILES_DIR, PROFILE_OVERRIDE_DIR), cache_path=PROFILE_CACHE_PATH) -> tuple:
+    stamp = source_stamp(dirs)
+    try:
+        with open(cache_path, "rb") as f:
+            version, cached_stamp, profiles, errors = marshal.load(f)
+        if version == PROFILE_CACHE_VERSION and cached_stamp == stamp:
+            return profiles, errors
+    except (OSError, EOFError, ValueError, TypeError):
+        pass
+
+    profiles, errors = compile_profiles(dirs)
+
+    # Write to a temporary file first so a crash never leaves a torn cache.
+    try:
+        os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+        tmp_path = f"{cache_path}.tmp"
+        with open(tmp_path, "wb") as f:
+            marshal.dump((PROFILE_CACHE_VERSION, stamp, profiles, errors), f)
+        os.replace(tmp_path, cache_path)
+    except OSError as err:
+        return profiles, errors + [f"unable to write {cache_path}: {err}"]
+    return profiles, errors
+
+
+def find_profile(profiles, system_id, cpu_vendor) -> dict | None:
+    for profile in profiles:
+        if system_id in profile["products"] and profile["cpu_vendor"] in ("", cpu_vendor):
+            return profile
+    return None
+
+
+class ProfileHandler:
+    """Stands in for a handheld module for devices described by a profile."""
+
+    def __init__(self, profile: dict):
+        self.profile = profile
+        self.handycon = None
+
+    def init_handheld(self, handheld_controller):
+        handycon = self.handycon = handheld_controller
+        profile = self.profile
+        handycon.BUTTON_DELAY = profile["button_delay"]
+        handycon.CAPTURE_CONTROLLER = profile["capture_controller"]
+        handycon.CAPTURE_KEYBOARD = profile["capture_keyboard"]
+        handycon.CAPTURE_POWER = profile["capture_power"]
+        handycon.GAMEPAD_ADDRESS = profile["gamepad_address"]
+        handycon.GAMEPAD_NAME = profile["gamepad_name"]
+        handycon.KEYBOARD_ADDRESS = profile["keyboard_address"]
+        handycon.KEYBOARD_NAME = profile["keyboard_name"]
+        for role, name, phys in profile["keyboards"]:
+            handycon.add_keyboard(role, name, phys)
+
+    # Captures keyboard events and translates them to virtual device events.
+    async def process_event(self, seed_event, active_keys):
+        handycon = self.handycon
+        button_on = seed_event.value
+
+        # Automatically pass default keycodes we dont intend to replace.
+        if seed_event.code in self.profile["passthrough"]:
+            await handycon.emit_events([seed_event])
+
+        for button, chords, release in self.profile["buttons"]:
+            event = handycon.button_map[button]
+            if active_keys in chords and button_on == 1 and event not in handycon.event_queue:
+                await handycon.handle_key_down(seed_event, event)
+            elif active_keys == [] and seed_event.code in release and button_on == 0 and event in handycon.event_queue:
+                await handycon.handle_key_up(seed_event, event)
+
+        # Handle L_META from power button
+        if active_keys == [] and seed_event.code == 125 and button_on == 0 and handycon.event_queue == [] and handycon.shutdown == True:
+            handycon.shutdown = False
+
+        if handycon.last_button:
+            await handycon.handle_key_up(seed_event, handycon.last_button)
+
+    # None keeps the turbo handler's stock defaults.
+    def get_powersave_config(self) -> list[str] | None:
+        return self.profile["powersave"] or None
+
+    def get_performance_config(self) -> list[str] | None:
+        return self.profile["performance"] or None
@@ -0,0 +1,267 @@
+#!/usr/bin/env python3
+# This file is part of Handheld Game Console Controller System (HandyGCCS)
+# Copyright 2022-2023 Derek J. Clark <derekjohn.clark@gmail.com>
+
+# Python Modules
+import asyncio
+import time
+
+## Local modules
+from . import bindings
+from . import devices
+from . import keyboards
+
+# logind announces suspend and resume with PrepareForSleep(true) and (false).
+SLEEP_MONITOR = ["gdbus", "monitor", "--system", "--dest", "org.freedesktop.login1",
+                 "--object-path", "/org/freedesktop/login1"]
+# CLOCK_BOOTTIME gaining this much on CLOCK_MONOTONIC means the system slept.
+SUSPEND_THRESHOLD = 0.5
+# Time between clock checks when logind can't be watched. Not checked while
+# idle, then the next input or read error checks instead.
+RESUME_CHECK_INTERVAL = 1.0
+# Missing devices are retried every RESUME_POLL for this long after a resume.
+RESUME_WINDOW = 5.0
+
+
+# Grows by the time spent in each suspend.
+def sleep_offset() -> float:
+    return time.clock_gettime(time.CLOCK_BOOTTIME) - time.clock_gettime(time.CLOCK_MONOTONIC)
+
+
+# True for a PrepareForSleep(true) line from gdbus monitor, False for
+# PrepareForSleep(false), None for anything else.
+def parse_sleep_signal(line) -> bool | None:
+    if "PrepareForSleep" not in line:
+        return None
+    return line.rsplit("(", 1)[-1].startswith("true")
+
+
+# A descriptor whose device was removed fails every ioctl with ENODEV.
+def fd_alive(fd) -> bool:
+    try:
+        bindings.read_string(fd, bindings.EVIOCGNAME)
+    except OSError:
+        return False
+    return True
+
+
+class ResumeMonitor:
+    """Notices the system resuming from suspend and gets input working again
+    without waiting for each capture loop to fail a read and rescan.
+
+    On resume every grabbed descriptor is checked. The ones still working are
+    left alone. Stale ones have their capture task restarted, which grabs the
+    device again from its cached binding, and missing devices are retried
+    every RESUME_POLL for RESUME_WINDOW seconds.
+
+    Resume is taken from logind's PrepareForSleep signal, or from the gap
+    between CLOCK_BOOTTIME and CLOCK_MONOTONIC where logind isn't reachable.
+    Both sources can be replaced for testing."""
+
+    def __init__(self, handycon, offset=sleep_offset, monitor=SLEEP_MONITOR):
+        self.handycon = handycon
+        self.offset = offset
+        self.monitor = monitor
+        self.loop = None
+        self.handle = None
+        self.window_handle = None
+        self.process = None
+        self.task = None
+        self.polling = False
+        self.idle = False
+        self.last_offset = 0.0
+        self.window_until = 0.0
+        self.resumed_at = 0.0
+        self.slept = 0.0
+        self.awaiting = set()
+        self.awaiting_input = False
+        self.resumes = 0
+        self.ready_max = 0.0
+        self.first_input_max = 0.0
+
+    def start(self):
+        self.loop = asyncio.get_event_loop()
+        self.last_offset = self.offset()
+        self.handycon.idle.on_idle.append(self.pause)
+        self.handycon.idle.on_wake.append(self.wake)
+        if self.monitor:
+            self.task = asyncio.ensure_future(self.watch_logind())
+        else:
+            self.start_polling()
+
+    def stop(self):
+        if self.task:
+            self.task.cancel()
+            self.task = None
+        if self.process and self.process.returncode is None:
+            self.process.kill()
+        for handle in (self.handle, self.window_handle):
+            if handle:
+                handle.cancel()
+        self.handle = None
+        self.window_handle = None
+
+    def stats(self) -> dict:
+        return {
+            "resumes": self.resumes,
+            "ready_max_ms": self.ready_max * 1000,
+            "first_input_max_ms": self.first_input_max * 1000,
+        }
+
+    async def watch_logind(self):
+        try:
+            self.process = await asyncio.create_subprocess_exec(
+                *self.monitor, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.DEVNULL)
+        except OSError as err:
+            self.handycon.logger.info(f"{err} | Unable to watch logind. Checking the clocks for resume.")
+            self.start_polling()
+            return
+        async for line in self.process.stdout:
+            sleeping = parse_sleep_signal(line.decode(errors="replace"))
+            if sleeping:
+                self.handycon.logger.info("System is suspending.")
+                self.last_offset = self.offset()
+            elif sleeping is False:
+                self.check()
+        await self.process.wait()
+        if self.handycon.running:
+            self.handycon.logger.info("Lost the logind connection. Checking the clocks for resume.")
+            self.start_polling()
+
+    def start_polling(self):
+        self.polling = True
+        self.arm()
+
+    def arm(self):
+        if self.polling and not self.idle and self.handle is None:
+            self.handle = self.loop.call_later(RESUME_CHECK_INTERVAL, self.poll)
+
+    def poll(self):
+        self.handle = None
+        self.check()
+        self.arm()
+
+    def pause(self):
+        self.idle = True
+        if self.handle:
+            self.handle.cancel()
+            self.handle = None
+
+    def wake(self):
+        self.idle = False
+        self.check()
+        self.arm()
+
+    # Also called by the capture loops on a read error, which right after a
+    # resume usually arrives before logind's signal does.
+    def check(self) -> bool:
+        offset = self.offset()
+        slept = offset - self.last_offset
+        self.last_offset = offset
+        if slept < SUSPEND_THRESHOLD:
+            return False
+        self.resumed(slept)
+        return True
+
+    # Whether missing devices should be retried quickly.
+    def recovering(self) -> bool:
+        return time.monotonic() < self.window_until
+
+    def held(self) -> dict:
+        handycon = self.handycon
+        held = {}
+        if handycon.controller_device:
+            held["controller"] = [handycon.controller_device]
+        power = [device for device in (handycon.power_device, handycon.power_device_2) if device]
+        if power:
+            held["power"] = power
+        for source in handycon.keyboard_sources:
+            if source.device:
+                held[source.role] = [source.device]
+        return held
+
+    def stale(self, held) -> list:
+        return [role for role, held_devices in held.items() if not all(fd_alive(device.fd) for device in held_devices)]
+
+    def resumed(self, slept):
+        self.resumes += 1
+        self.slept = slept
+        self.resumed_at = time.monotonic()
+        self.window_until = self.resumed_at + RESUME_WINDOW
+        if self.window_handle:
+            self.window_handle.cancel()
+        self.window_handle = self.loop.call_later(RESUME_WINDOW, self.settle)
+        held = self.held()
+        stale = self.stale(held)
+        self.awaiting = set(stale)
+        self.awaiting_input = True
+        self.handycon.logger.info(f"Resumed after {slept:.1f}s suspended. {len(held) - len(stale)} of {len(held)} input devices still grabbed.")
+        if stale and not self.handycon.handing_over:
+            asyncio.ensure_future(self.recover(stale))
+        elif not stale:
+            self.ready()
+
+    async def recover(self, roles):
+        handycon = self.handycon
+        handycon.logger.info(f"Grabbing stale input devices again: {', '.join(roles)}")
+        for role in roles:
+            # The capture loop may have noticed the failed read first.
+            if role not in self.stale(self.held()):
+                continue
+            task = handycon.capture_tasks.get(role)
+            if task:
+                task.cancel()
+                await asyncio.gather(task, return_exceptions=True)
+            handycon.capture_tasks[role] = asyncio.ensure_future(self.recapture(role))
+
+    # Drops the stale devices of a role, then runs its capture loop again.
+    async def recapture(self, role):
+        handycon = self.handycon
+        if role == "controller":
+            if handycon.controller_device and not fd_alive(handycon.controller_device.fd):
+                devices.release_controller()
+            await devices.capture_controller_events()
+            return
+        if role == "power":
+            for name in ("power_device", "power_device_2"):
+                device = getattr(handycon, name)
+                if device and not fd_alive(device.fd):
+                    devices.close_device(device)
+                    setattr(handycon, name, None)
+                    handycon.readiness.lost("power")
+            await devices.capture_power_events()
+            return
+        for source in handycon.keyboard_sources:
+            if source.role == role:
+                if source.device and not fd_alive(source.device.fd):
+                    devices.close_device(source.device)
+                    keyboards.release(source)
+                    handycon.readiness.lost(role)
+                await keyboards.capture_events(source)
+                return
+
+    # Called by the capture loops each time a device is being read.
+    def acquired(self, role):
+        if role not in self.awaiting:
+            return
+        self.awaiting.discard(role)
+        if not self.awaiting:
+            self.ready()
+
+    def ready(self):
+        elapsed = time.monotonic() - self.resumed_at
+        self.ready_max = max(self.ready_max, elapsed)
+        self.handycon.logger.info(f"Input devices ready {elapsed:.3f}s after resume.")
+
+    # Called with the first input event read after a resume.
+    def first_input(self, role):
+        self.awaiting_input = False
+        elapsed = time.monotonic() - self.resumed_at
+        self.first_input_max = max(self.first_input_max, elapsed)
+        self.handycon.logger.info(f"First input after resume from {role} {elapsed:.3f}s after resume.")
+
+    def settle(self):
+        self.window_handle = None
+        if self.awaiting:
+            self.handycon.logger.warn(f"Input devices not back {RESUME_WINDOW:.0f}s after resume: {', '.join(sorted(self.awaiting))}")
+            self.awaiting = set()
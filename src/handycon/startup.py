@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+# This file is part of Handheld Game Console Controller System (HandyGCCS)
+# Copyright 2022-2023 Derek J. Clark <derekjohn.clark@gmail.com>
+
+# Python Modules
+import os
+import time
+
+## Partial imports
+from contextlib import contextmanager
+
+
+# Returns the monotonic timestamp at which this process was exec'd by systemd.
+# /proc/self/stat reports the start time in clock ticks since boot, which shares
+# a timebase with CLOCK_BOOTTIME.
+def process_start_time() -> float:
+    now = time.monotonic()
+    try:
+        with open("/proc/self/stat", "r") as f:
+            # The command name may contain spaces, so split after the closing paren.
+            fields = f.read().rsplit(")", 1)[1].split()
+        start_ticks = int(fields[19])
+        since_start = time.clock_gettime(time.CLOCK_BOOTTIME) - start_ticks / os.sysconf("SC_CLK_TCK")
+    except (OSError, ValueError, IndexError):
+        return now
+    return now - max(since_start, 0.0)
+
+
+class StartupReport:
+    """Records per-phase timings from process start to the first forwarded event."""
+
+    def __init__(self, origin=None, enabled=False):
+        self.origin = origin if origin is not None else process_start_time()
+        self.enabled = enabled
+        self.phases = []
+        self.marks = {}
+        self.complete = False
+
+    @contextmanager
+    def phase(self, name):
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self.add_phase(name, start, time.monotonic())
+
+    def add_phase(self, name, start, end):
+        self.phases.append((name, start, end))
+
+    # Records a phase that began at a previously marked point and ends now.
+    def phase_since(self, name, mark):
+        if mark in self.marks and name not in [phase[0] for phase in self.phases]:
+            self.add_phase(name, self.marks[mark], time.monotonic())
+
+    # Records a single point in time, only the first occurrence is kept.
+    def mark(self, name):
+        if name not in self.marks:
+            self.marks[name] = time.monotonic()
+
+    def since_start(self, name) -> float | None:
+        if name not in self.marks:
+            return None
+        return self.marks[name] - self.origin
+
+    def format(self) -> str:
+        lines = ["Startup report (ms):", f"  {'phase':<24}{'duration':>10}{'at':>10}"]
+        for name, start, end in self.phases:
+            lines.append(f"  {name:<24}{(end - start) * 1000:>10.1f}{(end - self.origin) * 1000:>10.1f}")
+        for name, stamp in self.marks.items():
+            if name == "loop start":
+                continue
+            lines.append(f"  {name:<24}{'':>10}{(stamp - self.origin) * 1000:>10.1f}")
+        return "\n".join(lines)
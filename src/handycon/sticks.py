@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+# This file is part of Handheld Game Console Controller System (HandyGCCS)
+# Copyright 2022-2023 Derek J. Clark <derekjohn.clark@gmail.com>
+
+# Python Modules
+import math
+
+## Local modules
+from .constants import *
+
+## Partial imports
+from array import array
+from evdev import ecodes as e, InputEvent
+
+AXIS_MIN = -32768
+AXIS_MAX = 32767
+RADIAL_MAX = math.isqrt(2 * AXIS_MIN * AXIS_MIN) + 1
+
+STICK_AXES = {
+    "left": (e.ABS_X, e.ABS_Y),
+    "right": (e.ABS_RX, e.ABS_RY),
+}
+
+
+# Maps a normalized deflection (0..1) through the deadzones and response curve.
+def shape(magnitude, inner, outer, anti, curve) -> float:
+    if magnitude <= inner:
+        return 0.0
+    if magnitude >= outer:
+        return 1.0
+    return anti + (1.0 - anti) * ((magnitude - inner) / (outer - inner)) ** curve
+
+
+# Builds the table for one axis over the whole input range. Every ABS event
+# then costs a single index into the table.
+def build_axis_table(inner, outer, anti, curve) -> array:
+    def output(value):
+        scaled = shape(min(abs(value) / JOY_MAX, 1.0), inner, outer, anti, curve) * JOY_MAX
+        return -round(scaled) if value < 0 else round(scaled)
+
+    return array("i", map(output, range(AXIS_MIN, AXIS_MAX + 1)))
+
+
+# Builds a table of scale factors indexed by integer stick magnitude, used for
+# radial deadzones where both axes must be considered together.
+def build_radial_table(inner, outer, anti, curve) -> array:
+    def factor(magnitude):
+        if magnitude == 0:
+            return 0.0
+        normalized = magnitude / JOY_MAX
+        return shape(min(normalized, 1.0), inner, outer, anti, curve) / normalized
+
+    return array("d", map(factor, range(RADIAL_MAX + 1)))
+
+
+class RadialStick:
+    """Holds the latest position of one stick until the end of the frame."""
+
+    def __init__(self, code_x, code_y, table):
+        self.code_x = code_x
+        self.code_y = code_y
+        self.table = table
+        self.x = 0
+        self.y = 0
+        self.dirty = False
+
+    def set(self, code, value):
+        if code == self.code_x:
+            self.x = value
+        else:
+            self.y = value
+        self.dirty = True
+
+    def flush(self, seed_event) -> list:
+        self.dirty = False
+        factor = self.table[math.isqrt(self.x * self.x + self.y * self.y)]
+        x = max(AXIS_MIN, min(AXIS_MAX, round(self.x * factor)))
+        y = max(AXIS_MIN, min(AXIS_MAX, round(self.y * factor)))
+        return [
+            InputEvent(seed_event.sec, seed_event.usec, e.EV_ABS, self.code_x, x),
+            InputEvent(seed_event.sec, seed_event.usec, e.EV_ABS, self.code_y, y),
+        ]
+
+
+class StickPipeline:
+    """Applies precompiled deadzone and response curve tables to stick axes."""
+
+    def __init__(self, settings: dict):
+        self.tables = {}
+        self.radial = {}
+        self.sticks = []
+        for stick, (code_x, code_y) in STICK_AXES.items():
+            stick_settings = settings[stick]
+            if stick_settings == STICK_DEFAULTS:
+                continue
+            args = (
+                stick_settings["inner_deadzone"],
+                1.0 - stick_settings["outer_deadzone"],
+                stick_settings["anti_deadzone"],
+                stick_settings["curve"],
+            )
+            if stick_settings["radial"]:
+                radial = RadialStick(code_x, code_y, build_radial_table(*args))
+                self.radial[code_x] = radial
+                self.radial[code_y] = radial
+                self.sticks.append(radial)
+            else:
+                table = build_axis_table(*args)
+                self.tables[code_x] = table
+                self.tables[code_y] = table
+
+    def __bool__(self):
+        return bool(self.tables or self.radial)
+
+    # Returns the event to forward, or None if it is held until the frame ends.
+    def process(self, event):
+        table = self.tables.get(event.code)
+        if table is not None:
+            event.value = table[event.value - AXIS_MIN]
+            return event
+        radial = self.radial.get(event.code)
+        if radial is not None:
+            radial.set(event.code, event.value)
+            return None
+        return event
+
+    # Returns the shaped events of every radial stick that moved this frame.
+    def flush(self, seed_event) -> list:
+        events = []
+        for radial in self.sticks:
+            if radial.dirty:
+                events.extend(radial.flush(seed_event))
+        return events
+
+
+# Reads and validates the [Sticks] config section.
+def compile_sticks(section) -> dict:
+    settings = {}
+    for stick in STICK_AXES:
+        stick_settings = {}
+        for key, default in STICK_DEFAULTS.items():
+            option = f"{stick}_{key}"
+            try:
+                if isinstance(default, bool):
+                    stick_settings[key] = section.getboolean(option, fallback=default)
+                else:
+                    stick_settings[key] = section.getfloat(option, fallback=default)
+            except ValueError:
+                raise ValueError(f"Invalid value for {option} in [Sticks].")
+
+        if not 0.0 <= stick_settings["inner_deadzone"] < 1.0 - stick_settings["outer_deadzone"] <= 1.0:
+            raise ValueError(f"{stick} stick deadzones overlap.")
+        if not 0.0 <= stick_settings["anti_deadzone"] < 1.0:
+            raise ValueError(f"{stick}_anti_deadzone must be between 0 and 1.")
+        if stick_settings["curve"] <= 0.0:
+            raise ValueError(f"{stick}_curve must be greater than 0.")
+        settings[stick] = stick_settings
+    return settings
+
+
+def get_default_config() -> dict:
+    return {f"{stick}_{key}": value for stick in STICK_AXES for key, value in STICK_DEFAULTS.items()}
@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+# This file is part of Handheld Game Console Controller System (HandyGCCS)
+# Copyright 2022-2023 Derek J. Clark <derekjohn.clark@gmail.com>
+# Decode a dump with: python -m handycon.trace /var/log/handygccs/trace-*.bin
+
+# Python Modules
+import argparse
+import os
+import struct
+import time
+
+## Partial imports
+from time import monotonic_ns
+
+# Records kept. The oldest are overwritten once the buffer is full.
+TRACE_CAPACITY = 32768
+TRACE_DIR = "/var/log/handygccs"
+
+# Record kinds.
+INPUT = 1
+OUTPUT = 2
+DECISION = 3
+# Record sources. Keyboard sources count up from KEYBOARD.
+CONTROLLER = 0
+POWER = 1
+KEYBOARD = 2
+VIRTUAL = 255
+# Decision actions, stored in the type field. LAST_BUTTON is or'ed in while a
+# queued button is waiting for its release.
+KEY_UP = 0
+KEY_DOWN = 1
+EXPIRED = 2
+LAST_BUTTON = 0x100
+
+# monotonic ns, kind, source, type, code, value
+RECORD = struct.Struct("<qBBHHi")
+HEADER = struct.Struct("<4sHHIQqq")
+MAGIC = b"HCTR"
+VERSION = 1
+
+
+# The button slot number an event list is mapped to, or 0 if none is.
+def button_slot(button_map, event_list) -> int:
+    for button, events in button_map.items():
+        if events == event_list and button.startswith("button"):
+            return int(button[6:])
+    return 0
+
+
+class EventTrace:
+    """A preallocated ring of fixed-size binary records. Recording is a single
+    struct.pack_into, so it can stay on for every event."""
+
+    def __init__(self, capacity=TRACE_CAPACITY):
+        self.capacity = capacity
+        self.buffer = bytearray(capacity * RECORD.size)
+        self.count = 0
+        self.pack_into = RECORD.pack_into
+
+    def record(self, kind, source, type, code, value):
+        count = self.count
+        self.pack_into(self.buffer, (count % self.capacity) * RECORD.size,
+                monotonic_ns(), kind, source, type & 0xffff, code & 0xffff, value)
+        self.count = count + 1
+
+    # Writes the buffered records, oldest first. The header stores a pair of
+    # monotonic and wall clock readings so the decoder can show real times.
+    def dump(self, path=None) -> str:
+        if path is None:
+            os.makedirs(TRACE_DIR, exist_ok=True)
+            path = os.path.join(TRACE_DIR, f"trace-{time.strftime('%Y%m%d-%H%M%S')}.bin")
+        kept = min(self.count, self.capacity)
+        start = (self.count - kept) % self.capacity * RECORD.size
+        end = kept * RECORD.size
+        ordered = self.buffer[start:] + self.buffer[:start] if self.count > self.capacity else self.buffer[:end]
+        with open(path, "wb") as f:
+            f.write(HEADER.pack(MAGIC, VERSION, RECORD.size, kept, self.count,
+                    time.monotonic_ns(), time.time_ns()))
+            f.write(ordered)
+        return path
+
+
+def decode(path):
+    with open(path, "rb") as f:
+        data = f.read()
+    magic, version, size, kept, total, mono_ns, wall_ns = HEADER.unpack_from(data)
+    if magic != MAGIC or version != VERSION or size != RECORD.size:
+        raise ValueError(f"{path} is not a version {VERSION} handycon trace.")
+    yield f"# {kept} of {total} records"
+    for (stamp, kind, source, type, code, value) in RECORD.iter_unpack(data[HEADER.size:HEADER.size + kept * size]):
+        wall = (wall_ns - mono_ns + stamp) / 1e9
+        when = time.strftime("%H:%M:%S", time.localtime(wall)) + f".{int(wall * 1e6) % 1000000:06d}"
+        if source == VIRTUAL:
+            origin = "virtual"
+        elif source >= KEYBOARD:
+            origin = f"keyboard{source - KEYBOARD}"
+        else:
+            origin = ("controller", "power")[source]
+        if kind == DECISION:
+            action = ("up", "down", "expired")[type & 0xff]
+            waiting = " last_button" if type & LAST_BUTTON else ""
+            slot = f"button{code}" if code else "unmapped"
+            yield f"{when} decision {origin:<10} {action:<7} {slot} queue={value}{waiting}"
+        else:
+            yield f"{when} {('', 'input', 'output')[kind]:<8} {origin:<10} type={type} code={code} value={value}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Decode a handycon event trace dump.")
+    parser.add_argument("path")
+    args = parser.parse_args()
+    for line in decode(args.path):
+        print(line)
+
+
+if __name__ == "__main__":
+    main()
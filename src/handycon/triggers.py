@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+# This file is part of Handheld Game Console Controller System (HandyGCCS)
+# Copyright 2022-2023 Derek J. Clark <derekjohn.clark@gmail.com>
+
+## Local modules
+from .constants import TRIGGER_DEFAULTS
+
+## Partial imports
+from array import array
+from evdev import ecodes as e
+
+TRIGGER_MAX = 255
+
+TRIGGER_AXES = {
+    "left": e.ABS_Z,
+    "right": e.ABS_RZ,
+}
+
+
+# Builds the 256 entry response table for an analog trigger.
+def build_curve_table(deadzone, outer_deadzone, curve) -> array:
+    inner = deadzone * TRIGGER_MAX
+    outer = (1.0 - outer_deadzone) * TRIGGER_MAX
+
+    def output(value):
+        if value <= inner:
+            return 0
+        if value >= outer:
+            return TRIGGER_MAX
+        return round(((value - inner) / (outer - inner)) ** curve * TRIGGER_MAX)
+
+    return array("B", map(output, range(TRIGGER_MAX + 1)))
+
+
+# Builds the released and pressed tables for a hair trigger. The trigger
+# actuates fully at the threshold and only releases once it falls below the
+# threshold minus the hysteresis.
+def build_hair_tables(deadzone, threshold, hysteresis) -> tuple:
+    press = max(threshold, deadzone) * TRIGGER_MAX
+    release = max(threshold - hysteresis, deadzone) * TRIGGER_MAX
+    released = array("B", (TRIGGER_MAX if value >= press else 0 for value in range(TRIGGER_MAX + 1)))
+    pressed = array("B", (TRIGGER_MAX if value > release else 0 for value in range(TRIGGER_MAX + 1)))
+    return released, pressed
+
+
+class TriggerPipeline:
+    """Applies precompiled curve and hair trigger tables to ABS_Z and ABS_RZ."""
+
+    def __init__(self, settings: dict):
+        # Each trigger has a table for its released and pressed state. Analog
+        # curves use the same table for both.
+        self.tables = {}
+        self.pressed = {}
+        for trigger, code in TRIGGER_AXES.items():
+            trigger_settings = settings[trigger]
+            if trigger_settings == TRIGGER_DEFAULTS:
+                continue
+            if trigger_settings["hair_trigger"]:
+                self.tables[code] = build_hair_tables(
+                    trigger_settings["deadzone"],
+                    trigger_settings["threshold"],
+                    trigger_settings["hysteresis"],
+                )
+            else:
+                table = build_curve_table(
+                    trigger_settings["deadzone"],
+                    trigger_settings["outer_deadzone"],
+                    trigger_settings["curve"],
+                )
+                self.tables[code] = (table, table)
+            self.pressed[code] = 0
+
+    def __bool__(self):
+        return bool(self.tables)
+
+    def process(self, event):
+        tables = self.tables.get(event.code)
+        if tables is not None:
+            value = tables[self.pressed[event.code]][min(max(event.value, 0), TRIGGER_MAX)]
+            self.pressed[event.code] = 1 if value else 0
+            event.value = value
+        return event
+
+
+# Reads and validates the [Triggers] config section.
+def compile_triggers(section) -> dict:
+    settings = {}
+    for trigger in TRIGGER_AXES:
+        trigger_settings = {}
+        for key, default in TRIGGER_DEFAULTS.items():
+            option = f"{trigger}_{key}"
+            try:
+                if isinstance(default, bool):
+                    trigger_settings[key] = section.getboolean(option, fallback=default)
+                else:
+                    trigger_settings[key] = section.getfloat(option, fallback=default)
+            except ValueError:
+                raise ValueError(f"Invalid value for {option} in [Triggers].")
+
+        if not 0.0 <= trigger_settings["deadzone"] < 1.0 - trigger_settings["outer_deadzone"] <= 1.0:
+            raise ValueError(f"{trigger} trigger deadzones overlap.")
+        if trigger_settings["curve"] <= 0.0:
+            raise ValueError(f"{trigger}_curve must be greater than 0.")
+        if not 0.0 < trigger_settings["threshold"] <= 1.0:
+            raise ValueError(f"{trigger}_threshold must be between 0 and 1.")
+        if not 0.0 <= trigger_settings["hysteresis"] < trigger_settings["threshold"]:
+            raise ValueError(f"{trigger}_hysteresis must be smaller than {trigger}_threshold.")
+        settings[trigger] = trigger_settings
+    return settings
+
+
+def get_default_config() -> dict:
+    return {f"{trigger}_{key}": value for trigger in TRIGGER_AXES for key, value in TRIGGER_DEFAULTS.items()}
@@ -4,34 +4,15 @@
 
 # Python Modules
 import asyncio
-import configparser
+import importlib
 import os
-import re
-import subprocess
 import sys
-from . import devices
+import time
 
 ## Local modules
-import handycon.handhelds.ally_gen1 as ally_gen1
-import handycon.handhelds.anb_gen1 as anb_gen1
-import handycon.handhelds.aok_gen1 as aok_gen1
-import handycon.handhelds.aok_gen2 as aok_gen2
-import handycon.handhelds.aya_gen1 as aya_gen1
-import handycon.handhelds.aya_gen2 as aya_gen2
-import handycon.handhelds.aya_gen3 as aya_gen3
-import handycon.handhelds.aya_gen4 as aya_gen4
-import handycon.handhelds.aya_gen5 as aya_gen5
-import handycon.handhelds.aya_gen6 as aya_gen6
-import handycon.handhelds.aya_gen7 as aya_gen7
-import handycon.handhelds.ayn_gen1 as ayn_gen1
-import handycon.handhelds.gpd_gen1 as gpd_gen1
-import handycon.handhelds.gpd_gen2 as gpd_gen2
-import handycon.handhelds.gpd_gen3 as gpd_gen3
-import handycon.handhelds.oxp_gen1 as oxp_gen1
-import handycon.handhelds.oxp_gen2 as oxp_gen2
-import handycon.handhelds.oxp_gen3 as oxp_gen3
-import handycon.handhelds.oxp_gen4 as oxp_gen4
 from .constants import *
+from . import devices
+from . import profiles
 
 ## Partial imports
 from time import sleep
@@ -45,6 +26,7 @@ def set_handycon(handheld_controller):
 # Capture the username and home path of the user who has been logged in the longest.
 def get_user():
     global handycon
+    import subprocess
 
     handycon.logger.debug("Identifying user.")
     cmd = "who | awk '{print $1}' | sort | head -1"
@@ -70,25 +52,30 @@ def id_system():
     cpu_vendor = get_cpu_vendor()
     handycon.logger.debug(f"Found CPU Vendor: {cpu_vendor}")
 
+    # Devices described by a profile need no handheld module.
+    known_profiles, errors = profiles.load_profiles()
+    for error in errors:
+        handycon.logger.error(f"Skipping handheld profile {error}")
+    profile = profiles.find_profile(known_profiles, system_id, cpu_vendor)
+    if profile:
+        handycon.system_type = profile["name"].upper()
+
     ## ANBERNIC Devices
-    if system_id in (
+    elif system_id in (
             "Win600",
             ):
         handycon.system_type = "ANB_GEN1"
-        handycon.system_handler = anb_gen1
 
     ## AOKZOE Devices
     elif system_id in (
         "AOKZOE A1 AR07",
         ):
         handycon.system_type = "AOK_GEN1"
-        handycon.system_handler = aok_gen1
 
     elif system_id in (
         "AOKZOE A1 Pro",
         ):
         handycon.system_type = "AOK_GEN2"
-        handycon.system_handler = aok_gen2
 
 
     ## ASUS Devices
@@ -96,7 +83,6 @@ def id_system():
         "ROG Ally RC71L_RC71L",
         ):
         handycon.system_type = "ALY_GEN1"
-        handycon.system_handler = ally_gen1
 
     ## Aya Neo Devices
     elif system_id in (
@@ -107,42 +93,26 @@ def id_system():
         "AYANEO 2021 Pro Retro Power",
         ):
         handycon.system_type = "AYA_GEN1"
-        handycon.system_handler = aya_gen1
-
-    elif system_id in (
-        "NEXT",
-        "NEXT Pro",
-        "NEXT Advance",
-        "AYANEO NEXT",
-        "AYANEO NEXT Pro",
-        "AYANEO NEXT Advance",
-        ):
-        handycon.system_type = "AYA_GEN2"
-        handycon.system_handler = aya_gen2
 
     elif system_id in (
         "AIR",
         "AIR Pro",
         ):
         handycon.system_type = "AYA_GEN3"
-        handycon.system_handler = aya_gen3
 
     elif system_id in (
         "AYANEO 2",
         "GEEK",
         ):
         handycon.system_type = "AYA_GEN4"
-        handycon.system_handler = aya_gen4
 
     elif system_id in (
         "AIR Plus",
         ):
         if cpu_vendor == "GenuineIntel":
             handycon.system_type = "AYA_GEN7"
-            handycon.system_handler = aya_gen7
         else:
             handycon.system_type = "AYA_GEN5"
-            handycon.system_handler = aya_gen5
 
     elif system_id in (
         "AYANEO 2S",
@@ -150,34 +120,12 @@ def id_system():
         "AIR 1S",
         ):
         handycon.system_type = "AYA_GEN6"
-        handycon.system_handler = aya_gen6
 
     ## Ayn Devices
     elif system_id in (
             "Loki Max",
         ):
         handycon.system_type = "AYN_GEN1"
-        handycon.system_handler = ayn_gen1
-
-    ## GPD Devices.
-    # Have 2 buttons with 3 modes (left, right, both)
-    elif system_id in (
-        "G1618-03", #Win3
-        ):
-        handycon.system_type = "GPD_GEN1"
-        handycon.system_handler = gpd_gen1
-
-    elif system_id in (
-        "G1619-04", #WinMax2
-        ):
-        handycon.system_type = "GPD_GEN2"
-        handycon.system_handler = gpd_gen2
-
-    elif system_id in (
-        "G1618-04", #Win4
-        ):
-        handycon.system_type = "GPD_GEN3"
-        handycon.system_handler = gpd_gen3
 
 ## ONEXPLAYER and AOKZOE devices.
     # BIOS have inlete DMI data and most models report as "ONE XPLAYER" or "ONEXPLAYER".
@@ -187,22 +135,18 @@ def id_system():
         ):
         if cpu_vendor == "GenuineIntel":
             handycon.system_type = "OXP_GEN1"
-            handycon.system_handler = oxp_gen1
         else:
             handycon.system_type = "OXP_GEN2"
-            handycon.system_handler = oxp_gen2
 
     elif system_id in (
         "ONEXPLAYER mini A07",
         ):
         handycon.system_type = "OXP_GEN3"
-        handycon.system_handler = oxp_gen3
 
     elif system_id in (
         "ONEXPLAYER Mini Pro",
         ):
         handycon.system_type = "OXP_GEN4"
-        handycon.system_handler = oxp_gen4
 
     # Block devices that aren't supported as this could cause issues.
     else:
@@ -212,25 +156,33 @@ se run the capture-system.py utility found on the GitHub repository and upload \
  file with your issue.")
         sys.exit(0)
 
+    # Only the module for the detected handheld is ever imported.
+    if profile:
+        handycon.system_handler = profiles.ProfileHandler(profile)
+    else:
+        handycon.system_handler = importlib.import_module(f"handycon.handhelds.{handycon.system_type.lower()}")
+
     # So that we can use the config during init, we need to get it BEFORE we init the handheld.
-    get_config()
+    with handycon.startup.phase("get_config"):
+        get_config()
 
     handycon.system_handler.init_handheld(handycon)
+    handycon.add_keyboard("keyboard", handycon.KEYBOARD_NAME, handycon.KEYBOARD_ADDRESS)
     handycon.logger.info(f"Identified host system as {system_id} and configured defaults for {handycon.system_type}.")
 
 
 def get_cpu_vendor():
     global handycon
 
-    cmd = "cat /proc/cpuinfo"
-    all_info = subprocess.check_output(cmd, shell=True).decode().strip()
-    for line in all_info.split("\n"):
-        if "vendor_id" in line:
-                return re.sub( ".*vendor_id.*:", "", line,1).strip()
+    with open("/proc/cpuinfo", "r") as cpuinfo:
+        for line in cpuinfo:
+            if line.startswith("vendor_id"):
+                return line.split(":", 1)[1].strip()
 
 
 def get_config():
     global handycon
+    import configparser
     # Check for an existing config file and load it.
     handycon.config = configparser.ConfigParser()
     if os.path.exists(CONFIG_PATH):
@@ -248,37 +200,234 @@ def get_config():
 
 # Match runtime variables to the config
 def map_config():
-    # Assign config file values
-    handycon.button_map = {
-    "button1": EVENT_MAP[handycon.config["Button Map"]["button1"]],
-    "button2": EVENT_MAP[handycon.config["Button Map"]["button2"]],
-    "button3": EVENT_MAP[handycon.config["Button Map"]["button3"]],
-    "button4": EVENT_MAP[handycon.config["Button Map"]["button4"]],
-    "button5": EVENT_MAP[handycon.config["Button Map"]["button5"]],
-    "button6": EVENT_MAP[handycon.config["Button Map"]["button6"]],
-    "button7": EVENT_MAP[handycon.config["Button Map"]["button7"]],
-    "button8": EVENT_MAP[handycon.config["Button Map"]["button8"]],
-    "button9": EVENT_MAP[handycon.config["Button Map"]["button9"]],
-    "button10": EVENT_MAP[handycon.config["Button Map"]["button10"]],
-    "button11": EVENT_MAP[handycon.config["Button Map"]["button11"]],
-    "button12": EVENT_MAP[handycon.config["Button Map"]["button12"]],
-    }
-    handycon.power_action = POWER_ACTION_MAP[handycon.config["Button Map"]["power_button"]][0]
+    apply_config(handycon.config, compile_config(handycon.config))
 
+
+# Parses and validates a config file without touching the running state. This
+# is safe to call from a worker thread.
+def read_config(path=CONFIG_PATH):
+    import configparser
+    config = configparser.ConfigParser()
     try:
-        turbo_cfg = handycon.config["Turbo"]
-    except:
+        if not config.read(path):
+            raise ValueError(f"{path} could not be read.")
+    except configparser.Error as err:
+        raise ValueError(f"{path} could not be parsed: {err}")
+    return config, compile_config(config)
+
+
+# Resolves the config values into the lookups used while handling events.
+# Raises ValueError if any value is unknown. Optional subsystems are only
+# imported and compiled once they are enabled.
+def compile_config(config) -> dict:
+    if "Button Map" not in config:
+        raise ValueError("Config is missing the [Button Map] section.")
+    button_section = config["Button Map"]
+
+    button_map = {}
+    for number in range(1, 13):
+        button = f"button{number}"
+        event = button_section.get(button)
+        if event not in EVENT_MAP:
+            raise ValueError(f"Unknown event {event} assigned to {button}.")
+        button_map[button] = EVENT_MAP[event]
+
+    power_button = button_section.get("power_button")
+    if power_button not in POWER_ACTION_MAP:
+        raise ValueError(f"Unknown power action {power_button}.")
+
+    if "Turbo" in config:
+        turbo_cfg = compile_turbo(config["Turbo"])
+    else:
         turbo_cfg = turbo_handler.get_default_config()
 
-    handycon.turbo = turbo_handler(turbo_cfg)
+    stick_pipeline = None
+    if section_changed(config, "Sticks", STICK_DEFAULTS):
+        from . import sticks
+        stick_pipeline = sticks.StickPipeline(sticks.compile_sticks(config["Sticks"])) or None
+
+    # Mouse mode and the gyro compile their sections when first toggled on.
+    mouse_settings = compile_mouse(config) if handycon.mouse is not None else None
+    imu_settings = compile_gyro(config) if handycon.imu is not None else None
+
+    governor_settings = None
+    if section_enabled(config, "Governor"):
+        from . import governor
+        governor_settings = governor.compile_governor(config["Governor"])
+        for key in ("battery_ceiling", "ac_ceiling"):
+            if governor_settings[key] and governor_settings[key] not in turbo_cfg["speeds"]:
+                raise ValueError(f"Governor {key} {governor_settings[key]} is not a turbo speed.")
+
+    fan_settings = None
+    if section_enabled(config, "Fans"):
+        from . import fans
+        fan_settings = fans.compile_fans(config["Fans"])
+        for speed in fan_settings["curves"]:
+            if speed not in turbo_cfg["speeds"]:
+                raise ValueError(f"Fan curve_{speed} is not for a turbo speed.")
+
+    trigger_pipeline = None
+    if section_changed(config, "Triggers", TRIGGER_DEFAULTS):
+        from . import triggers
+        trigger_pipeline = triggers.TriggerPipeline(triggers.compile_triggers(config["Triggers"])) or None
+
+    return {
+        "button_map": button_map,
+        "fans": fan_settings,
+        "governor": governor_settings,
+        "imu": imu_settings,
+        "mouse": mouse_settings,
+        "power_action": POWER_ACTION_MAP[power_button][0],
+        "sticks": stick_pipeline,
+        "triggers": trigger_pipeline,
+        "turbo": turbo_cfg,
+    }
+
+
+# True if the enabled option of a section is set.
+def section_enabled(config, name) -> bool:
+    if name not in config:
+        return False
+    try:
+        return config[name].getboolean("enabled", False)
+    except ValueError as err:
+        raise ValueError(f"Invalid value in [{name}]: {err}")
+
+
+# True if any option of a section is set away from its default. Options are
+# named <axis>_<option>. A value that doesn't parse counts as changed so the
+# subsystem reports it.
+def section_changed(config, name, defaults) -> bool:
+    if name not in config:
+        return False
+    section = config[name]
+    for option in section:
+        default = defaults.get(option.split("_", 1)[-1])
+        try:
+            if isinstance(default, bool):
+                value = section.getboolean(option)
+            else:
+                value = section.getfloat(option)
+        except ValueError:
+            return True
+        if value != default:
+            return True
+    return False
+
+
+# Called when mouse mode is first toggled on, and on reloads after that.
+def compile_mouse(config) -> dict:
+    from . import mouse
+    return mouse.compile_mouse(config["Mouse"] if "Mouse" in config else config[config.default_section])
 
 
+# Called when the gyro is first toggled on, and on reloads after that.
+def compile_gyro(config) -> dict:
+    from . import fusion
+    from . import imu
+    section = config["Gyro"] if "Gyro" in config else config[config.default_section]
+    settings = imu.compile_imu(section)
+    settings.update(fusion.compile_fusion(section))
+    return settings
 
 
+# configparser stores the nested turbo speeds as their python repr.
+def compile_turbo(section) -> dict:
+    import ast
+    from . import knobs
+
+    capture = section.get("capture", "True")
+    speeds = section.get("speeds", "{}")
+    if isinstance(capture, str):
+        capture = capture.strip().lower() in ("1", "true", "yes", "on")
+    if isinstance(speeds, str):
+        try:
+            speeds = ast.literal_eval(speeds)
+        except (ValueError, SyntaxError) as err:
+            raise ValueError(f"Invalid turbo speeds: {err}")
+    if not isinstance(speeds, dict) or not all(isinstance(speed, dict) for speed in speeds.values()):
+        raise ValueError("Turbo speeds must be a mapping of speed settings.")
+    for key, speed in speeds.items():
+        if "knobs" in speed:
+            try:
+                speed["knobs"] = knobs.compile_knobs(speed["knobs"])
+            except ValueError as err:
+                raise ValueError(f"Turbo speed {key}: {err}")
+    # Cores parked by one speed come back online at the speeds that don't set cpus.
+    if any("cpus" in speed.get("knobs", {}) for speed in speeds.values()):
+        for speed in speeds.values():
+            speed.setdefault("knobs", {}).setdefault("cpus", knobs.ALL_CPUS)
+    return {"capture": capture, "speeds": {str(key): value for key, value in speeds.items()}}
+
+
+# Swaps in a compiled config. Nothing here awaits, so event handlers always
+# see either the old or the new settings, never a mix.
+def apply_config(config, compiled):
+    global handycon
+
+    handycon.config = config
+    handycon.button_map = compiled["button_map"]
+    handycon.power_action = compiled["power_action"]
+    handycon.sticks = compiled["sticks"]
+    handycon.triggers = compiled["triggers"]
+    # Either may have been toggled on for the first time since compiling.
+    if handycon.imu is not None and compiled["imu"] is not None:
+        handycon.fusion.update(compiled["imu"])
+        handycon.imu.update(compiled["imu"])
+    if handycon.mouse is not None and compiled["mouse"] is not None:
+        handycon.mouse.update(compiled["mouse"])
+    if handycon.turbo is None:
+        handycon.turbo = turbo_handler(compiled["turbo"])
+    else:
+        handycon.turbo.update(compiled["turbo"])
+    # The governor and fan control are only loaded once enabled.
+    if compiled["governor"] is not None:
+        if handycon.governor is None:
+            from . import governor
+            handycon.governor = governor.Governor(handycon, compiled["governor"])
+            handycon.idle.on_idle.append(handycon.governor.pause)
+            handycon.idle.on_wake.append(handycon.governor.resume)
+        else:
+            handycon.governor.update(compiled["governor"])
+        handycon.governor.start()
+    elif handycon.governor is not None:
+        handycon.governor.stop()
+    if compiled["fans"] is not None:
+        if handycon.fans is None:
+            from . import fans
+            handycon.fans = fans.FanController(handycon, compiled["fans"])
+        else:
+            handycon.fans.update(compiled["fans"])
+        handycon.fans.start()
+    elif handycon.fans is not None:
+        handycon.fans.stop()
+
+
+# A remap is held back while a chord is in flight so its release still
+# matches the button it was pressed with.
+def apply_pending_config():
+    global handycon
+
+    if handycon.pending_config is None or handycon.event_queue or handycon.last_button or handycon.chord_timer.busy():
+        return False
+    config, compiled = handycon.pending_config
+    handycon.pending_config = None
+    apply_config(config, compiled)
+    handycon.logger.info(f"Applied updated config: {CONFIG_PATH}")
+    return True
+
 
 # Sets the default configuration.
 def set_default_config():
     global handycon
+    from . import fans
+    from . import fusion
+    from . import governor
+    from . import imu
+    from . import mouse
+    from . import sticks
+    from . import triggers
+
     handycon.config["Button Map"] = {
             "button1": "SCR",
             "button2": "QAM",
@@ -295,6 +444,12 @@ def set_default_config():
             "power_button": "SUSPEND",
             }
 
+    handycon.config["Fans"] = fans.get_default_config()
+    handycon.config["Governor"] = governor.get_default_config()
+    handycon.config["Gyro"] = imu.get_default_config() | fusion.get_default_config()
+    handycon.config["Mouse"] = mouse.get_default_config()
+    handycon.config["Sticks"] = sticks.get_default_config()
+    handycon.config["Triggers"] = triggers.get_default_config()
     handycon.config["Turbo"] = turbo_handler.get_default_config()
 
     handycon.logger.info(f"config: {handycon.config}")
@@ -314,6 +469,7 @@ def write_config():
 
 def steam_ifrunning_deckui(cmd):
     global handycon
+    import subprocess
 
     # Get the currently running Steam PID.
     steampid_path = handycon.HOME_PATH + '/.steam/steam.pid'
@@ -354,6 +510,7 @@ def steam_ifrunning_deckui(cmd):
 
 def launch_chimera():
     global handycon
+    import subprocess
 
     if not handycon.HAS_CHIMERA_LAUNCHER:
         return
@@ -383,6 +540,7 @@ class turbo_handler:
                         "export XDG_RUNTIME_DIR=/run/user/1000",
                         "pw-play /usr/share/notifications/power-saving.ogg",
                     ],
+                    "knobs": {"epp": "power"},
                     "rumble": 1,
                     "default" : True,
                 },
@@ -395,6 +553,7 @@ class turbo_handler:
                         "export XDG_RUNTIME_DIR=/run/user/1000",
                         "pw-play /usr/share/notifications/max-performance.ogg",
                     ],
+                    "knobs": {"epp": "performance"},
                     "rumble": 2,
                     "default" : True,
                 },
@@ -407,29 +566,44 @@ class turbo_handler:
 
     def __init__(self, config:dict|None):
         self.enabled = False
-        self.config = config if not None else self.DEFAULT_CONFIG
+        self.current = 0
+        self.manual_at = float("-inf")
+        self.startup_task = None
+        self.update(config)
+        self.current = self.default
+
+    # Replaces the speed settings, keeping the current speed where possible.
+    def update(self, config:dict|None):
+        self.config = config if config is not None else self.DEFAULT_CONFIG
 
         # Get all the speeds and remove the default indicator.
         self.default = 0
         self.speeds = sorted(self.config.get("speeds",{}).keys())
         # Find the default speed, or just set to the first.
-        for speed in speeds:
-            if speed.get("default",False):
-                self.default = speed
+        for index, speed in enumerate(self.speeds):
+            if self.config["speeds"][speed].get("default",False):
+                self.default = index
                 break
+        if self.current >= len(self.speeds):
+            self.current = self.default
 
     @classmethod
     def get_default_config(cls) -> dict:
-        cfg = cls.DEFAULT_CONFIG
+        import copy
+        cfg = copy.deepcopy(cls.DEFAULT_CONFIG)
 
         # Override defaults for Powersave and Performance if we know a better set for a particular device.
-        try:
-            cfg["speeds"][0][command] = handycon.system_handler.get_powersave_config()
-            cfg["speeds"][1][command] = handycon.system_handler.get_performance_config()
-
-        except Exception:
-            # Ignore if this fails. It just means the module doesn't change the defaults.
-            pass
+        # Handlers return None, or don't define the function, to keep the defaults.
+        handler = getattr(handycon, "system_handler", None)
+        for speed, name in (("0", "powersave"), ("1", "performance")):
+            get_command = getattr(handler, f"get_{name}_config", None)
+            command = get_command() if get_command else None
+            if command:
+                cfg["speeds"][speed]["command"] = command
+            get_knobs = getattr(handler, f"get_{name}_knobs", None)
+            speed_knobs = get_knobs() if get_knobs else None
+            if speed_knobs:
+                cfg["speeds"][speed]["knobs"] = speed_knobs
 
         return cfg
 
@@ -438,30 +612,68 @@ class turbo_handler:
         mode = self.config.get("capture",False)
         return mode is True
 
+    # Applies the default speed in the background once the controller is
+    # forwarding, so startup never waits on the speed commands.
     def set_turbo(self):
-        loop = asyncio.get_event_loop()
-        loop.run_until_complete(self.toggle(0))
+        self.startup_task = asyncio.ensure_future(self.apply_at_startup())
+
+    async def apply_at_startup(self):
+        try:
+            await asyncio.wait_for(handycon.forwarding.wait(), TURBO_STARTUP_WAIT)
+        except asyncio.TimeoutError:
+            handycon.logger.warn("Controller is not forwarding yet. Applying the default turbo speed anyway.")
+        if not self.speeds:
+            return
+
+        speed = self.speeds[self.current]
+        handycon.logger.info(f"Applying turbo speed {speed} in the background.")
+        start = time.monotonic()
+        try:
+            await self.toggle(0)
+        except Exception as err:
+            handycon.logger.error(f"{err} | Failed to apply turbo speed {speed} at startup.")
+            return
+        handycon.startup.add_phase("turbo speed", start, time.monotonic())
+        handycon.logger.info(f"Applied turbo speed {speed} in {time.monotonic() - start:.2f}s.")
 
     async def toggle(self, step = 1):
         # Normally don't set step.  Its only purpose is to reuse logic at startup.
-        self.current += step
+        if step:
+            # A manual toggle holds off the governor.
+            self.manual_at = time.monotonic()
+        if not self.speeds:
+            # Nothing to do, no speeds.
+            return
 
         # Make sure the current speed is valid
-        current = self.current
-        if current > len(self.speeds):
+        current = self.current + step
+        if current >= len(self.speeds):
             current = 0
-        self.current = current
-
-        if current > len(self.speeds):
-            # Nothing to do, no speeds.
-            return
+        await self.set_speed(current)
 
-        new_speed = self.config.get("speeds",{}).get(current,{})
+    # Applies a speed by index. The governor skips the feedback and rumble.
+    async def set_speed(self, index, feedback=True):
+        self.current = index
+        new_speed = self.config["speeds"][self.speeds[index]]
         command = new_speed.get("command",None)
         if command is not None:
             # Execute the speed setting command.
             await run_async(command, 'Turbo Toggled with:')
 
+        speed_knobs = new_speed.get("knobs",None)
+        if speed_knobs:
+            from . import knobs
+
+            # Knobs go after the command, which may change the cpufreq governor.
+            loop = asyncio.get_running_loop()
+            failures = await loop.run_in_executor(None, knobs.apply_knobs, speed_knobs)
+            for failure in failures:
+                handycon.logger.warn(f"Turbo knob not applied: {failure}")
+            handycon.logger.debug(f"Applied turbo knobs {speed_knobs}.")
+
+        if not feedback:
+            return
+
         feedback = new_speed.get("feedback",None)
         if feedback is not None:
             # execute the feedback command.
@@ -470,7 +682,7 @@ class turbo_handler:
         rumble = new_speed.get("rumble",None)
         if rumble is not None:
             # execute the rumble command.
-            while rumble > 0:
+            for _ in range(rumble):
                 await devices.do_rumble(0, 100, 100, 0)
                 await asyncio.sleep(FF_DELAY)
 
@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+# This file is part of Handheld Game Console Controller System (HandyGCCS)
+# Copyright 2022-2023 Derek J. Clark <derekjohn.clark@gmail.com>
+
+# Python Modules
+import asyncio
+import os
+import sys
+import threading
+import time
+import traceback
+
+## Local modules
+from .notify import sd_notify
+
+# A probe answered later than this counts as a stall.
+STALL_THRESHOLD = 0.1
+# Time between probes while input is active, and while idle. Any stall longer
+# than PROBE_PERIOD + STALL_THRESHOLD is always caught.
+PROBE_PERIOD = 0.1
+IDLE_PROBE_PERIOD = 5.0
+# Frames kept from the stack sample of a stalled loop.
+STACK_DEPTH = 12
+
+
+class LoopWatchdog:
+    """Measures how long the event loop takes to run a callback posted from
+    another thread. A probe still waiting past the threshold means something
+    is blocking the loop, so the loop thread's stack is sampled then and
+    logged with the stall once the loop recovers.
+
+    Under systemd's watchdog, WATCHDOG=1 is only sent while probes are being
+    answered in time, so a wedged loop gets the service restarted."""
+
+    def __init__(self, handycon, threshold=STALL_THRESHOLD, period=PROBE_PERIOD):
+        self.handycon = handycon
+        self.threshold = threshold
+        self.period = period
+        self.idle = False
+        self.loop = None
+        self.loop_thread = None
+        self.thread = None
+        self.answered = threading.Event()
+        self.stopping = threading.Event()
+        # Set while input is active, so an idle watchdog can sleep on it.
+        self.woken = threading.Event()
+        self.woken.set()
+        self.ping_interval = None
+        self.probes = 0
+        self.lag_total = 0.0
+        self.lag_max = 0.0
+        self.stalls = 0
+
+    def start(self):
+        self.loop = asyncio.get_event_loop()
+        self.loop_thread = threading.get_ident()
+        usec = os.environ.get("WATCHDOG_USEC")
+        pid = os.environ.get("WATCHDOG_PID")
+        if usec and (not pid or int(pid) == os.getpid()):
+            self.ping_interval = int(usec) / 2000000
+        self.handycon.idle.on_idle.append(self.pause)
+        self.handycon.idle.on_wake.append(self.resume)
+        self.thread = threading.Thread(target=self.run, name="loop-watchdog", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stopping.set()
+        self.woken.set()
+        if self.thread and self.thread is not threading.current_thread():
+            self.thread.join(1.0)
+        self.thread = None
+
+    # Probes slow down while the handheld is idle, and stop unless systemd
+    # expects pings.
+    def pause(self):
+        self.woken.clear()
+        self.idle = True
+
+    def resume(self):
+        self.idle = False
+        self.woken.set()
+
+    def stats(self) -> dict:
+        return {
+            "probes": self.probes,
+            "lag_max_ms": self.lag_max * 1000,
+            "lag_mean_ms": self.lag_total / self.probes * 1000 if self.probes else 0.0,
+            "stalls": self.stalls,
+        }
+
+    # Runs on the event loop.
+    def beat(self, sent):
+        lag = time.monotonic() - sent
+        self.probes += 1
+        self.lag_total += lag
+        self.lag_max = max(self.lag_max, lag)
+        self.answered.set()
+
+    # Names what the loop is running and formats a sample of its stack.
+    def sample(self) -> tuple:
+        where = "a callback"
+        try:
+            task = asyncio.current_task(self.loop)
+        except RuntimeError:
+            task = None
+        frame = sys._current_frames().get(self.loop_thread)
+        if task is not None:
+            coro = task.get_coro()
+            where = f"task {task.get_name()} ({getattr(coro, '__qualname__', coro)})"
+        elif frame is not None:
+            # The outermost frame outside asyncio is the callback the loop ran.
+            for summary in traceback.extract_stack(frame):
+                if f"{os.sep}asyncio{os.sep}" not in summary.filename and summary.name != "<module>":
+                    where = f"callback {summary.name} ({os.path.basename(summary.filename)}:{summary.lineno})"
+                    break
+        stack = "".join(traceback.format_stack(frame)[-STACK_DEPTH:]) if frame is not None else ""
+        return where, stack
+
+    def run(self):
+        last_ping = float("-inf")
+        while not self.stopping.is_set():
+            if self.idle and not self.ping_interval:
+                self.woken.wait()
+                continue
+            sent = time.monotonic()
+            self.answered.clear()
+            try:
+                self.loop.call_soon_threadsafe(self.beat, sent)
+            except RuntimeError:
+                # The loop has closed.
+                return
+
+            if not self.answered.wait(self.threshold):
+                where, stack = self.sample()
+                while not self.answered.wait(self.period):
+                    if self.stopping.is_set():
+                        return
+                self.stalls += 1
+                self.handycon.logger.warn(
+                    f"Event loop blocked for {(time.monotonic() - sent) * 1000:.0f}ms in {where}.\n{stack}")
+
+            # The probe was answered, so the loop is healthy right now.
+            now = time.monotonic()
+            if self.ping_interval and now - last_ping >= self.ping_interval:
+                sd_notify("WATCHDOG=1")
+                last_ping = now
+
+            period = self.period
+            if self.idle:
+                period = min(IDLE_PROBE_PERIOD, self.ping_interval or IDLE_PROBE_PERIOD)
+            self.stopping.wait(period)